@@ -1,13 +1,60 @@
 from flask import Flask, jsonify, request, render_template
 from rename_files_final import DeepSeekFileRenamer
+from suggestion_cache_final import SuggestionCache, DEFAULT_CACHE_DIR
+from extraction_cache_final import ExtractionCache
+from snapshot_index_final import SnapshotIndex
+from file_extractor_final import EXTRACTOR_VERSION
+from rename_plan_final import RenamePlanStore
+from watch_folder_final import FolderWatcher
 from pathlib import Path
 import asyncio
+import json
 import logging
 import sys
 import os
 
 logger = logging.getLogger(__name__)
 renamer = None
+watcher = None
+plan_store = RenamePlanStore()
+
+def load_config(base_dir: Path) -> dict:
+    """读取 config.json，读取失败时返回空配置"""
+    config_file = base_dir / 'config.json'
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取配置文件失败，使用默认配置 {config_file}: {str(e)}")
+        return {}
+
+def create_suggestion_cache(cache_config: dict) -> SuggestionCache:
+    """按配置创建文件名建议缓存"""
+    cache_dir = Path(cache_config.get('directory') or DEFAULT_CACHE_DIR).expanduser()
+    return SuggestionCache(
+        db_path=cache_dir / 'suggestions.db',
+        max_size_bytes=int(cache_config.get('max_size_mb', 50) * 1024 * 1024),
+        enabled=cache_config.get('enabled', True)
+    )
+
+def create_extraction_cache(cache_config: dict) -> ExtractionCache:
+    """按配置创建文件内容提取缓存"""
+    cache_dir = Path(cache_config.get('directory') or DEFAULT_CACHE_DIR).expanduser()
+    return ExtractionCache(
+        db_path=cache_dir / 'extractions.db',
+        max_size_bytes=int(cache_config.get('extraction_max_size_mb', 200) * 1024 * 1024),
+        enabled=cache_config.get('enabled', True) and cache_config.get('extraction_enabled', True),
+        version=EXTRACTOR_VERSION,
+        failure_ttl_seconds=cache_config.get('extraction_failure_ttl_hours', 24) * 3600
+    )
+
+def create_snapshot_index(cache_config: dict) -> SnapshotIndex:
+    """按配置创建目录快照"""
+    cache_dir = Path(cache_config.get('directory') or DEFAULT_CACHE_DIR).expanduser()
+    return SnapshotIndex(
+        db_path=cache_dir / 'snapshots.db',
+        enabled=cache_config.get('snapshot_enabled', True)
+    )
 
 def create_app():
     global renamer
@@ -26,7 +73,39 @@ def create_app():
     app = Flask(__name__, 
                 template_folder=str(template_dir), 
                 static_folder=str(static_dir))
-    renamer = DeepSeekFileRenamer()
+    
+    config = load_config(base_dir)
+    api_config = dict(config.get('api', {}))
+    if api_config.get('deepseek_base_url'):
+        # 配置中写的是完整接口地址，客户端需要的是基础地址
+        base_url = api_config['deepseek_base_url'].rstrip('/')
+        if base_url.endswith('/chat/completions'):
+            base_url = base_url[:-len('/chat/completions')]
+        api_config['base_url'] = base_url
+    
+    file_config = config.get('file_processing', {})
+    cache_config = config.get('cache', {})
+    renamer = DeepSeekFileRenamer(
+        api_config=api_config,
+        suggestion_cache=create_suggestion_cache(cache_config),
+        extraction_cache=create_extraction_cache(cache_config),
+        pricing=config.get('pricing', {}),
+        extraction_workers=file_config.get('extraction_workers', 0),
+        extraction_queue_size=file_config.get('extraction_queue_size', 64),
+        extraction_timeout=file_config.get('extraction_timeout', 60),
+        extraction_memory_limit_mb=file_config.get('extraction_memory_limit_mb', 1024),
+        extraction_max_tasks_per_worker=file_config.get('extraction_max_tasks_per_worker', 200),
+        pdf_backend=file_config.get('pdf_backend', 'auto'),
+        dedupe_enabled=file_config.get('dedupe_enabled', True),
+        near_dedupe_enabled=file_config.get('near_dedupe_enabled', True),
+        near_duplicate_distance=file_config.get('near_duplicate_distance', 3),
+        scan_workers=file_config.get('scan_workers', 0),
+        snapshot_index=create_snapshot_index(cache_config),
+        only_changed=file_config.get('only_changed', False),
+        scan_verify_files=file_config.get('scan_verify_files', True),
+        exclude_patterns=file_config.get('exclude_patterns', [])
+    )
+    watch_config = config.get('watch', {})
 
     @app.route('/')
     def index():
@@ -97,12 +176,16 @@ def create_app():
                     'size': file_info['size'],
                     'type': file_info['type'],
                     'extension': file_info['extension'],
-                    'relative_path': str(file_info['relative_path'])
+                    'relative_path': str(file_info['relative_path']),
+                    'changed': file_info['changed'],
+                    'last_suggestion': file_info['last_suggestion'] or ''
                 })
             
             return jsonify({
                 'total_files': len(serializable_files),
-                'files': serializable_files
+                'changed_files': sum(1 for f in serializable_files if f['changed']),
+                'files': serializable_files,
+                'scan': renamer.last_scan_stats
             })
         except Exception as e:
             logger.error(f"扫描文件失败: {str(e)}")
@@ -122,6 +205,30 @@ def create_app():
             renamer.custom_suffix = data.get('custom_suffix', '').strip()
             renamer.max_filename_length = int(data.get('max_filename_length', 100))
             renamer.backup_enabled = data.get('backup_enabled', True)
+            renamer.bypass_cache = data.get('bypass_cache', False)
+            renamer.batch_size = max(1, int(data.get('batch_size', renamer.batch_size)))
+            renamer.dedupe_enabled = bool(data.get('dedupe_enabled', renamer.dedupe_enabled))
+            renamer.near_dedupe_enabled = bool(data.get('near_dedupe_enabled', renamer.near_dedupe_enabled))
+            renamer.only_changed = bool(data.get('only_changed', renamer.only_changed))
+            if 'extraction_workers' in data:
+                renamer.extraction_pool.resize(int(data['extraction_workers']))
+            if 'extraction_timeout' in data:
+                timeout = float(data['extraction_timeout'] or 0)
+                renamer.extraction_pool.timeout = timeout if timeout > 0 else None
+            
+            if any(key in data for key in ('max_concurrent', 'max_concurrent_limit', 'adaptive_concurrency')):
+                limiter = renamer.concurrency_limiter
+                initial_limit = data.get('max_concurrent')
+                if initial_limit is None and data.get('adaptive_concurrency') is False:
+                    # 关闭自适应时按上限固定并发
+                    initial_limit = data.get('max_concurrent_limit')
+                limiter.reset(
+                    initial_limit=initial_limit,
+                    max_limit=data.get('max_concurrent_limit'),
+                    adaptive=data.get('adaptive_concurrency')
+                )
+                if renamer.deepseek_client:
+                    renamer.deepseek_client.max_connections = limiter.max_limit
             
             exclude_patterns = data.get('exclude_patterns', [])
             if isinstance(exclude_patterns, list):
@@ -146,12 +253,18 @@ def create_app():
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
-            result = loop.run_until_complete(renamer.process_directory(execute_rename=False))
-            loop.close()
+            try:
+                with renamer.run_lock:
+                    result = loop.run_until_complete(renamer.process_directory(execute_rename=False))
+            finally:
+                loop.close()
             
             if 'error' in result:
                 return jsonify({'error': result['error']}), 500
             
+            # 保存已解析的目标路径，执行时直接套用
+            plan_id = plan_store.create(renamer.base_dir, result['analysis_results'])
+            
             # 转换为JSON可序列化的格式
             preview_results = []
             for analysis_result in result['analysis_results']:
@@ -161,16 +274,31 @@ def create_app():
                     'success': analysis_result['success'],
                     'skipped': analysis_result['skipped'],
                     'error': analysis_result.get('error', ''),
-                    'suggested_name': analysis_result.get('suggested_name', '')
+                    'suggested_name': analysis_result.get('suggested_name', ''),
+                    'cached': bool((analysis_result.get('analysis_result') or {}).get('cached')),
+                    'retries': analysis_result.get('retries', 0),
+                    'usage': analysis_result.get('usage', {}),
+                    'elapsed': analysis_result.get('elapsed', 0.0),
+                    'cost': analysis_result.get('cost', 0.0),
+                    'duplicate_of': analysis_result.get('duplicate_of', ''),
+                    'near_duplicate_of': analysis_result.get('near_duplicate_of', '')
                 }
                 preview_results.append(preview_result)
             
             return jsonify({
+                'plan_id': plan_id,
                 'total_files': result['total_files'],
                 'successful_analyses': result['successful_analyses'],
                 'failed_analyses': result['failed_analyses'],
                 'skipped_analyses': result['skipped_analyses'],
-                'preview_results': preview_results
+                'total_retries': result.get('total_retries', 0),
+                'duplicate_files': result.get('duplicate_files', 0),
+                'near_duplicate_files': result.get('near_duplicate_files', 0),
+                'message': result.get('message', ''),
+                'prompt_cache': result.get('prompt_cache'),
+                'usage': result.get('usage'),
+                'preview_results': preview_results,
+                'cache_stats': renamer.suggestion_cache.get_stats() if renamer.suggestion_cache else None
             })
             
         except Exception as e:
@@ -183,30 +311,46 @@ def create_app():
         if not renamer.base_dir:
             return jsonify({'error': '请先设置工作目录'}), 400
         
-        if not renamer.deepseek_client:
-            return jsonify({'error': '请先设置 DeepSeek API 密钥'}), 400
-        
         try:
-            data = request.json or {}
+            data = request.get_json(silent=True) or {}
             selected_indices = data.get('selected_files', [])
+            plan_id = data.get('plan_id')
             
-            # 使用异步函数
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            if selected_indices:
-                # 如果指定了选中的文件，只处理这些文件
-                result = loop.run_until_complete(renamer.process_selected_files(selected_indices, execute_rename=True))
+            if plan_id:
+                # 套用预览计划，只做文件系统操作
+                plan = plan_store.get(plan_id)
+                if not plan:
+                    return jsonify({'error': '预览计划不存在或已过期，请重新预览'}), 409
+                
+                if plan.base_dir != renamer.base_dir:
+                    return jsonify({'error': '工作目录已变更，请重新预览'}), 409
+                
+                with renamer.run_lock:
+                    result = renamer.apply_plan(plan, selected_indices)
+                plan_store.discard(plan_id)
             else:
-                # 否则处理所有文件
-                result = loop.run_until_complete(renamer.process_directory(execute_rename=True))
-            
-            loop.close()
+                if not renamer.deepseek_client:
+                    return jsonify({'error': '请先设置 DeepSeek API 密钥'}), 400
+                
+                # 使用异步函数
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                
+                try:
+                    with renamer.run_lock:
+                        if selected_indices:
+                            # 如果指定了选中的文件，只处理这些文件
+                            result = loop.run_until_complete(renamer.process_selected_files(selected_indices, execute_rename=True))
+                        else:
+                            # 否则处理所有文件
+                            result = loop.run_until_complete(renamer.process_directory(execute_rename=True))
+                finally:
+                    loop.close()
             
             if 'error' in result:
                 return jsonify({'error': result['error']}), 500
             
-            rename_stats = result.get('rename_stats', {})
+            rename_stats = result.get('rename_stats') or {}
             
             return jsonify({
                 'total_files': result['total_files'],
@@ -286,11 +430,115 @@ def create_app():
             'max_filename_length': renamer.max_filename_length,
             'backup_enabled': renamer.backup_enabled,
             'exclude_patterns': renamer.exclude_patterns,
+            'bypass_cache': renamer.bypass_cache,
+            'batch_size': renamer.batch_size,
+            'dedupe_enabled': renamer.dedupe_enabled,
+            'near_dedupe_enabled': renamer.near_dedupe_enabled,
+            'only_changed': renamer.only_changed,
+            'max_concurrent': renamer.concurrency_limiter.limit,
+            'max_concurrent_limit': renamer.concurrency_limiter.max_limit,
+            'adaptive_concurrency': renamer.concurrency_limiter.adaptive,
+            'extraction_workers': renamer.extraction_pool.workers,
+            'extraction_timeout': renamer.extraction_pool.timeout,
             'has_api_key': bool(renamer.deepseek_client),
             'has_directory': bool(renamer.base_dir),
             'directory': str(renamer.base_dir) if renamer.base_dir else ''
         })
 
+    @app.route('/concurrency', methods=['GET'])
+    def concurrency():
+        """获取自适应并发控制器的当前窗口和调整历史"""
+        return jsonify(renamer.concurrency_limiter.get_stats())
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        """获取最近一次运行和本次会话的 token 用量与费用估算，以及内容提取进程的运行情况"""
+        stats = renamer.get_usage_stats()
+        stats['extraction'] = renamer.extraction_pool.get_stats()
+        return jsonify(stats)
+
+    @app.route('/cache_stats', methods=['GET'])
+    def cache_stats():
+        """获取文件名建议缓存、内容提取缓存的命中统计和目录快照的规模"""
+        stats = renamer.suggestion_cache.get_stats() if renamer.suggestion_cache else {'enabled': False}
+        stats['extraction_cache'] = (
+            renamer.extraction_cache.get_stats() if renamer.extraction_cache else {'enabled': False}
+        )
+        stats['snapshot_index'] = (
+            renamer.snapshot_index.get_stats() if renamer.snapshot_index else {'enabled': False}
+        )
+        return jsonify(stats)
+
+    @app.route('/clear_cache', methods=['POST'])
+    def clear_cache():
+        """清空文件名建议缓存、内容提取缓存和目录快照（之后所有文件都视为新增）"""
+        if not renamer.suggestion_cache and not renamer.extraction_cache and not renamer.snapshot_index:
+            return jsonify({'error': '缓存未启用'}), 400
+        
+        try:
+            if renamer.suggestion_cache:
+                renamer.suggestion_cache.clear()
+            if renamer.extraction_cache:
+                renamer.extraction_cache.clear()
+            if renamer.snapshot_index:
+                renamer.snapshot_index.clear()
+            return jsonify({'message': '缓存已清空'})
+        except Exception as e:
+            logger.error(f"清空缓存失败: {str(e)}")
+            return jsonify({'error': f'清空缓存失败: {str(e)}'}), 500
+
+    @app.route('/watch/start', methods=['POST'])
+    def watch_start():
+        """开始监视工作目录，新到达的文件写完后自动分析并重命名"""
+        global watcher
+        if not renamer.base_dir:
+            return jsonify({'error': '请先设置工作目录'}), 400
+        
+        if not renamer.deepseek_client:
+            return jsonify({'error': '请先设置 DeepSeek API 密钥'}), 400
+        
+        if watcher and watcher.running:
+            return jsonify({'error': '监视已在运行，请先停止'}), 409
+        
+        try:
+            data = request.get_json(silent=True) or {}
+            options = dict(watch_config)
+            options.update({key: data[key] for key in (
+                'backend', 'debounce_seconds', 'batch_size', 'batch_window_seconds', 'max_pending',
+                'poll_interval_seconds', 'auto_rename', 'process_existing'
+            ) if key in data})
+            watcher = FolderWatcher(renamer, **options)
+            result = watcher.start()
+            if not result['success']:
+                return jsonify({'error': result['error']}), 400
+            
+            return jsonify({
+                'message': '已开始监视目录',
+                'backend': result['backend'],
+                'directory': result['directory']
+            })
+        except Exception as e:
+            logger.error(f"启动监视失败: {str(e)}")
+            return jsonify({'error': f'启动监视失败: {str(e)}'}), 500
+
+    @app.route('/watch/stop', methods=['POST'])
+    def watch_stop():
+        """停止监视，正在处理的批次完成后退出"""
+        if not watcher or not watcher.running:
+            return jsonify({'error': '监视未在运行'}), 400
+        
+        result = watcher.stop()
+        if not result['success']:
+            return jsonify({'error': result['error']}), 400
+        return jsonify({'message': '已停止监视', 'status': watcher.get_status()})
+
+    @app.route('/watch/status', methods=['GET'])
+    def watch_status():
+        """获取监视状态、等待队列长度、处理统计和最近处理的文件"""
+        if not watcher:
+            return jsonify({'running': False})
+        return jsonify(watcher.get_status())
+
     # 向后兼容的路由
     @app.route('/discover_patterns', methods=['GET'])
     def discover_patterns():
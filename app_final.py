@@ -14,6 +14,7 @@ import logging
 import webbrowser
 import time
 import threading
+import multiprocessing
 from pathlib import Path
 
 # 支持PyInstaller打包
@@ -34,10 +35,18 @@ if str(BASE_DIR) not in sys.path:
 TEMPLATE_DIR = BASE_DIR / 'templates'
 STATIC_DIR = BASE_DIR / 'static'
 
+# 启动时导入耗时的预算（秒），可用环境变量覆盖
+IMPORT_BUDGET_SECONDS = float(os.environ.get('DEEPSEEK_RENAME_IMPORT_BUDGET', '1.0'))
+
+# 这些解析库应在处理对应文件时才导入，启动阶段不应出现在 sys.modules 中
+LAZY_MODULES = ('docx', 'PyPDF2', 'pdfplumber', 'pypdfium2', 'fitz', 'markdown', 'openpyxl', 'pptx')
+
 # 导入Flask和其他依赖
 try:
+    _import_started = time.perf_counter()
     from flask import Flask
     from api_final import create_app
+    IMPORT_SECONDS = time.perf_counter() - _import_started
 except ImportError as e:
     print(f"❌ 导入错误: {e}")
     print("请确保已安装所有必要的依赖包")
@@ -56,6 +65,27 @@ def setup_logging():
         ]
     )
 
+def get_import_report() -> dict:
+    """启动阶段的导入耗时报告"""
+    from file_extractor_final import get_import_timings
+    eager_modules = [name for name in LAZY_MODULES if name in sys.modules]
+    return {
+        'import_seconds': round(IMPORT_SECONDS, 3),
+        'budget_seconds': IMPORT_BUDGET_SECONDS,
+        'within_budget': IMPORT_SECONDS <= IMPORT_BUDGET_SECONDS and not eager_modules,
+        'eager_modules': eager_modules,
+        'lazy_imports': get_import_timings()
+    }
+
+def print_import_report(report: dict):
+    """打印导入耗时报告"""
+    status = "✅" if report['within_budget'] else "⚠️"
+    print(f"{status} 启动导入耗时 {report['import_seconds']:.3f} 秒（预算 {report['budget_seconds']:.3f} 秒）")
+    if report['eager_modules']:
+        print(f"   启动时已导入的解析库: {', '.join(report['eager_modules'])}")
+    for name, seconds in report['lazy_imports'].items():
+        print(f"   按需导入 {name}: {seconds:.3f} 秒")
+
 def open_browser(url, delay=3):
     """延迟打开浏览器"""
     def _open():
@@ -75,6 +105,12 @@ def main():
     if os.name == 'nt':  # Windows
         os.system('chcp 65001 >nul')
     
+    # 只输出导入耗时报告，超出预算时返回非零退出码，便于持续跟踪启动耗时
+    if '--import-report' in sys.argv:
+        report = get_import_report()
+        print_import_report(report)
+        sys.exit(0 if report['within_budget'] else 1)
+    
     print("🚀 启动 DeepSeek 智能文件重命名工具...")
     
     # 设置日志
@@ -113,6 +149,11 @@ def main():
         print("⏳ 正在启动服务器...")
         app = create_app()
         
+        import_report = get_import_report()
+        if not import_report['within_budget']:
+            print_import_report(import_report)
+            logging.warning(f"启动导入耗时 {import_report['import_seconds']:.3f} 秒，超出预算 {import_report['budget_seconds']:.3f} 秒")
+        
         # 设置服务器参数
         host = '127.0.0.1'
         port = 5000
@@ -157,4 +198,6 @@ def main():
             time.sleep(3)
 
 if __name__ == '__main__':
+    # 打包后内容提取进程池需要它才能正常启动子进程
+    multiprocessing.freeze_support()
     main()
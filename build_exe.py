@@ -54,8 +54,13 @@ a = Analysis(
         'requests',
         'docx',
         'PyPDF2',
+        'pdfplumber',
+        'pypdfium2',
+        'watchdog.observers',
         'openpyxl',
+        'xlrd',
         'pptx',
+        'chardet',
         'tkinter',
         'asyncio',
         'json',
@@ -208,6 +213,21 @@ def main():
         'rename_files_final.py',
         'deepseek_client_final.py',
         'file_extractor_final.py',
+        'suggestion_cache_final.py',
+        'rename_plan_final.py',
+        'concurrency_final.py',
+        'retry_final.py',
+        'excerpt_final.py',
+        'usage_final.py',
+        'extraction_pool_final.py',
+        'ooxml_final.py',
+        'extraction_cache_final.py',
+        'dedupe_final.py',
+        'near_dedupe_final.py',
+        'fs_walk_final.py',
+        'snapshot_index_final.py',
+        'watch_folder_final.py',
+        'exclude_matcher_final.py',
         'config.json',
         'templates/index.html',
         'static/styles.css',
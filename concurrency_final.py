@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 视为限流或服务端过载的状态码
+CONGESTION_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _Slot:
+    """一次受限调用的占位，调用方在退出前写入状态码"""
+    
+    def __init__(self, limiter: 'AdaptiveConcurrencyLimiter'):
+        self.limiter = limiter
+        self.status_code: Optional[int] = None
+        self.failed = False
+        self.started_at = 0.0
+    
+    async def __aenter__(self) -> '_Slot':
+        await self.limiter.acquire()
+        self.started_at = time.monotonic()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self.started_at
+        await self.limiter.release(latency, self.status_code, failed=self.failed or exc_type is not None, started_at=self.started_at)
+        return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 自适应并发控制器
+    
+    延迟和错误率正常时按加性增长放宽并发窗口，遇到 429/5xx 或 p95 延迟明显上升时按乘性因子收缩。
+    """
+    
+    def __init__(
+        self,
+        initial_limit: int = 3,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 1.5,
+        latency_window: int = 50,
+        adaptive: bool = True,
+        history_size: int = 200
+    ):
+        """
+        初始化并发控制器
+        
+        Args:
+            initial_limit: 初始并发窗口
+            min_limit: 窗口下限
+            max_limit: 窗口上限
+            increase_step: 每完成一整个窗口的成功请求后增加的并发数
+            decrease_factor: 拥塞时窗口的乘性收缩因子
+            latency_tolerance: p95 延迟超过基线的倍数时视为拥塞
+            latency_window: 计算 p95 所用的最近样本数
+            adaptive: 为 False 时窗口固定为 initial_limit
+            history_size: 保留的窗口变化记录条数
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        
+        self.window = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        
+        self._latencies = deque(maxlen=latency_window)
+        self._baseline_p95: Optional[float] = None
+        self._last_decrease_at = 0.0
+        self.history = deque(maxlen=history_size)
+        
+        # 统计
+        self.total_requests = 0
+        self.congestion_events = 0
+        self.errors = 0
+        
+        # 条件变量绑定事件循环，按循环惰性创建
+        self._condition = None
+        self._loop = None
+        
+        self._record("init")
+    
+    @property
+    def limit(self) -> int:
+        """当前允许同时在途的请求数"""
+        return max(self.min_limit, int(self.window))
+    
+    def _get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            # 上一个事件循环遗留的在途计数已无意义
+            self.in_flight = 0
+        return self._condition
+    
+    def slot(self) -> _Slot:
+        """获取一个并发占位，用法: async with limiter.slot() as slot"""
+        return _Slot(self)
+    
+    async def acquire(self) -> None:
+        """等待直到在途请求数低于当前窗口"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+    
+    async def release(self, latency: float, status_code: Optional[int] = None, failed: bool = False, started_at: float = None) -> None:
+        """释放占位并根据本次调用的延迟和状态调整窗口"""
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._observe(latency, status_code, failed, started_at)
+            condition.notify_all()
+    
+    def _observe(self, latency: float, status_code: Optional[int], failed: bool, started_at: Optional[float]):
+        """记录一次调用结果并调整窗口"""
+        self.total_requests += 1
+        
+        congested = failed or status_code in CONGESTION_STATUS_CODES
+        if failed or (status_code is not None and status_code != 200):
+            self.errors += 1
+        
+        if not self.adaptive:
+            return
+        
+        # 在上次收缩之前发出的请求反映的是旧窗口，不再重复收缩
+        stale = started_at is not None and started_at < self._last_decrease_at
+        
+        if congested:
+            if not stale:
+                self._decrease(f"status_{status_code}" if status_code else "error")
+            return
+        
+        self._latencies.append(latency)
+        if self._latency_degraded():
+            if not stale:
+                self._decrease("latency")
+        else:
+            self._increase()
+    
+    def _p95(self) -> Optional[float]:
+        if len(self._latencies) < 10:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+    
+    def _latency_degraded(self) -> bool:
+        """p95 延迟相对基线明显上升时返回 True，否则更新基线"""
+        p95 = self._p95()
+        if p95 is None:
+            return False
+        
+        if self._baseline_p95 is None:
+            self._baseline_p95 = p95
+            return False
+        
+        if p95 > self._baseline_p95 * self.latency_tolerance:
+            return True
+        
+        # 健康时缓慢跟踪基线
+        self._baseline_p95 += 0.1 * (p95 - self._baseline_p95)
+        return False
+    
+    def _increase(self):
+        previous = self.limit
+        # 每个成功请求增加 step/window，相当于每个窗口增加 step
+        self.window = min(float(self.max_limit), self.window + self.increase_step / self.window)
+        if self.limit != previous:
+            self._record("increase")
+    
+    def _decrease(self, reason: str):
+        self.congestion_events += 1
+        self.window = max(float(self.min_limit), self.window * self.decrease_factor)
+        self._last_decrease_at = time.monotonic()
+        # 收缩后重新采样延迟
+        self._latencies.clear()
+        self._record(reason)
+        logger.warning(f"并发窗口收缩至 {self.limit}（原因: {reason}）")
+    
+    def _record(self, reason: str):
+        self.history.append({
+            'timestamp': time.time(),
+            'limit': self.limit,
+            'window': round(self.window, 3),
+            'in_flight': self.in_flight,
+            'reason': reason
+        })
+    
+    def reset(self, initial_limit: int = None, max_limit: int = None, adaptive: bool = None) -> None:
+        """更新配置并重新开始调整"""
+        if max_limit is not None:
+            self.max_limit = max(self.min_limit, int(max_limit))
+        if adaptive is not None:
+            self.adaptive = adaptive
+        if initial_limit is not None:
+            self.window = float(min(max(int(initial_limit), self.min_limit), self.max_limit))
+        self.window = min(self.window, float(self.max_limit))
+        self._latencies.clear()
+        self._baseline_p95 = None
+        self._record("reset")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回当前窗口、延迟和调整历史"""
+        p95 = self._p95()
+        return {
+            'adaptive': self.adaptive,
+            'limit': self.limit,
+            'window': round(self.window, 3),
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'in_flight': self.in_flight,
+            'p95_latency': round(p95, 3) if p95 is not None else None,
+            'baseline_p95_latency': round(self._baseline_p95, 3) if self._baseline_p95 is not None else None,
+            'total_requests': self.total_requests,
+            'congestion_events': self.congestion_events,
+            'errors': self.errors,
+            'history': list(self.history)
+        }
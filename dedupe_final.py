@@ -0,0 +1,75 @@
+import hashlib
+import logging
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 部分哈希只读取文件开头的字节数，大小相同但开头不同的文件到此即可区分
+PARTIAL_HASH_BYTES = 64 * 1024
+
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def _hash_file(file_path: Path, limit: Optional[int] = None) -> str:
+    """计算文件内容的 SHA-256，指定 limit 时只读取开头部分"""
+    hasher = hashlib.sha256()
+    remaining = limit
+    with open(file_path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(_HASH_CHUNK_BYTES if remaining is None else min(_HASH_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return hasher.hexdigest()
+
+
+def _split_by(indices: Iterable[int], key_func: Callable[[int], Hashable]) -> List[List[int]]:
+    """按 key 分组，只保留包含多个成员的组；读取失败的文件视为不重复"""
+    buckets = defaultdict(list)
+    for index in indices:
+        try:
+            key = key_func(index)
+        except OSError as e:
+            logger.warning(f"计算文件哈希失败，不参与去重: {str(e)}")
+            continue
+        buckets[key].append(index)
+    return [bucket for bucket in buckets.values() if len(bucket) > 1]
+
+
+def find_duplicate_groups(files_info: List[Dict[str, Any]],
+                          partial_bytes: int = PARTIAL_HASH_BYTES) -> List[List[int]]:
+    """按 大小 -> 部分哈希 -> 完整哈希 逐级找出内容完全相同的文件
+    
+    大小唯一的文件不需要读取；大小相同的先比较开头部分，开头也相同时才计算完整哈希。
+    
+    Args:
+        files_info: scan_directory 返回的文件信息
+        partial_bytes: 部分哈希读取的字节数
+    
+    Returns:
+        重复文件组，元素是 files_info 中的下标。每组至少两个文件，组内按路径排序，
+        第一个文件作为代表，结果与扫描顺序无关
+    """
+    groups = []
+    for same_size in _split_by(range(len(files_info)), lambda i: files_info[i]['size']):
+        size = files_info[same_size[0]]['size']
+        if size == 0:
+            # 空文件本来就会因内容过短被跳过
+            continue
+        
+        same_head = _split_by(same_size, lambda i: _hash_file(files_info[i]['path'], partial_bytes))
+        if size <= partial_bytes:
+            # 部分哈希已经覆盖整个文件
+            groups.extend(same_head)
+            continue
+        for candidates in same_head:
+            groups.extend(_split_by(candidates, lambda i: _hash_file(files_info[i]['path'])))
+    
+    for group in groups:
+        group.sort(key=lambda i: str(files_info[i]['path']))
+    groups.sort(key=lambda group: group[0])
+    return groups
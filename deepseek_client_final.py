@@ -1,133 +1,669 @@
 import requests
+import asyncio
+import itertools
 import json
 import logging
-from typing import Dict, Any, Optional
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+from retry_final import RetryPolicy, RetryBudget
+from excerpt_final import select_excerpt
 
 logger = logging.getLogger(__name__)
 
+# 请求编号，区分打包请求复制到各文件的重试记录
+_REQUEST_IDS = itertools.count(1)
+
+# 提示词版本，修改提示词模板时递增，使旧的缓存建议失效
+PROMPT_VERSION = "3"
+
+# 各分析类型的任务描述、命名要求和期望的回复内容
+_TASKS = {
+    "summary": "提供一个简洁的摘要作为文件名建议",
+    "keywords": "提取3-5个最重要的关键词，用下划线连接作为文件名",
+    "topic": "识别主要主题，并生成一个简洁的主题名称作为文件名"
+}
+
+_RULES = {
+    "summary": """要求：
+1. 摘要应该简洁明了，适合作为文件名
+2. 长度不超过50个字符
+3. 不要包含特殊字符，只使用中文、英文、数字和下划线
+4. 如果是代码文件，请包含主要功能描述
+5. 如果是文档，请提取核心主题""",
+
+    "keywords": """要求：
+1. 关键词应该能代表文本的核心内容
+2. 使用中文或英文
+3. 用下划线连接关键词
+4. 总长度不超过50个字符""",
+
+    "topic": """要求：
+1. 主题名称应该准确反映文本内容的核心
+2. 长度不超过30个字符
+3. 使用中文或英文
+4. 不包含特殊字符"""
+}
+
+_REPLIES = {
+    "summary": "建议的文件名",
+    "keywords": "关键词组合",
+    "topic": "主题名称"
+}
+
+# 固定的系统提示词放在最前面、文件内容放在最后，
+# 这样同类请求的前缀完全相同，可以命中服务端的上下文缓存
+SYSTEM_PROMPTS = {
+    analysis_type: f"""请分析用户提供的文本内容，{_TASKS[analysis_type]}。
+{_RULES[analysis_type]}
+
+请只返回{_REPLIES[analysis_type]}，不要其他解释。"""
+    for analysis_type in _TASKS
+}
+
+BATCH_SYSTEM_PROMPTS = {
+    analysis_type: f"""用户会提供多个文件的内容片段，每个片段以“=== 文件 序号 ===”开头。请为每个文件分别{_TASKS[analysis_type]}。
+{_RULES[analysis_type]}
+
+请只返回一个 JSON 数组，每个文件对应一个元素，格式为 {{"id": 文件序号, "name": "{_REPLIES[analysis_type]}"}}，不要其他解释。"""
+    for analysis_type in _TASKS
+}
+
 class DeepSeekClient:
     """DeepSeek API 客户端，用于文本内容分析"""
     
-    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com/v1"):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.deepseek.com/v1",
+        timeout: float = 30,
+        max_connections: int = 20,
+        model: str = "deepseek-chat",
+        cache=None,
+        retry_policy: Optional[RetryPolicy] = None,
+        excerpt_token_budget: int = 600,
+        batch_excerpt_token_budget: int = 250
+    ):
         self.api_key = api_key
         self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.model = model
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 送入提示词的片段 token 预算（单文件 / 批量中的每个文件）
+        self.excerpt_token_budget = excerpt_token_budget
+        self.batch_excerpt_token_budget = batch_excerpt_token_budget
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        
+        # 同步模式复用 keep-alive 连接
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        
+        # 异步模式的连接池，每个事件循环各一个，惰性创建；
+        # 网页请求和监视线程各自运行事件循环，互不替换对方的连接池
+        self._async_clients: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._async_clients_lock = threading.Lock()
+    
+    def _build_payload(self, content: str, analysis_type: str) -> Dict[str, Any]:
+        """根据分析类型构建请求体，系统提示词固定，文件内容放在最后"""
+        system_prompt = SYSTEM_PROMPTS.get(analysis_type, SYSTEM_PROMPTS["summary"])
+        excerpt = select_excerpt(content, self.excerpt_token_budget)
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": excerpt
+                }
+            ],
+            "max_tokens": 100,
+            "temperature": 0.7
+        }
+    
+    @staticmethod
+    def _extract_usage(body: Dict[str, Any]) -> Dict[str, int]:
+        """从响应的 usage 字段取出 token 用量，区分命中上下文缓存的部分"""
+        usage = body.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0) or 0
+        
+        # DeepSeek 返回 prompt_cache_hit_tokens，OpenAI 兼容接口放在 prompt_tokens_details 中
+        hit_tokens = usage.get("prompt_cache_hit_tokens")
+        if hit_tokens is None:
+            hit_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        miss_tokens = usage.get("prompt_cache_miss_tokens")
+        if miss_tokens is None:
+            miss_tokens = max(0, prompt_tokens - hit_tokens)
+        
+        completion_tokens = usage.get("completion_tokens", 0) or 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": usage.get("total_tokens", prompt_tokens + completion_tokens) or 0,
+            "prompt_cache_hit_tokens": hit_tokens,
+            "prompt_cache_miss_tokens": miss_tokens
+        }
+    
+    @staticmethod
+    def _split_usage(usage: Dict[str, int], weights: List[int]) -> List[Dict[str, int]]:
+        """把一次批量请求的用量按各文件片段长度分摊"""
+        total_weight = sum(weights) or len(weights)
+        shares = [{} for _ in weights]
+        for key, value in usage.items():
+            assigned = 0
+            for index, weight in enumerate(weights):
+                if index == len(weights) - 1:
+                    # 余数归最后一个文件，保证合计不变
+                    shares[index][key] = value - assigned
+                else:
+                    part = value * (weight or 1) // total_weight
+                    shares[index][key] = part
+                    assigned += part
+        return shares
+    
+    def _parse_response(self, response, content: str, analysis_type: str) -> Dict[str, Any]:
+        """解析 API 响应为分析结果（兼容 requests 与 httpx 的响应对象）"""
+        if response.status_code == 200:
+            result = response.json()
+            suggested_name = result["choices"][0]["message"]["content"].strip()
+            
+            return {
+                "success": True,
+                "suggested_name": suggested_name,
+                "analysis_type": analysis_type,
+                "original_length": len(content),
+                "status_code": response.status_code,
+                "usage": self._extract_usage(result)
+            }
+        else:
+            logger.error(f"DeepSeek API 错误: {response.status_code} - {response.text}")
+            return {
+                "success": False,
+                "error": f"API 调用失败: {response.status_code}",
+                "suggested_name": "未知文档",
+                "status_code": response.status_code
+            }
+    
+    @staticmethod
+    def _new_retry_info() -> Dict[str, Any]:
+        """单个请求的重试记录和耗时，会合并进分析结果
+        
+        打包请求的记录复制到该批每个文件，request_id 相同，统计重试次数时每个请求只计一次。
+        """
+        return {"request_id": next(_REQUEST_IDS), "retries": 0, "retry_statuses": [], "elapsed": 0.0}
+    
+    def _retry_delay(self, retry_info: Dict[str, Any], started_at: float, retry_after: Optional[str],
+                     retry_budget: Optional[RetryBudget]) -> Optional[float]:
+        """决定是否重试，需要重试时返回等待秒数并记账"""
+        delay = self.retry_policy.next_delay(retry_info["retries"], started_at, retry_after)
+        if delay is None:
+            return None
+        
+        if retry_budget is not None and not retry_budget.try_consume():
+            logger.warning("本批次的重试预算已用完，不再重试")
+            return None
+        
+        retry_info["retries"] += 1
+        return delay
+    
+    def _post(self, payload: Dict[str, Any], retry_info: Dict[str, Any],
+              retry_budget: Optional[RetryBudget] = None) -> requests.Response:
+        """发送请求，对限流、临时错误和网络异常按退避策略重试"""
+        started_at = time.monotonic()
+        try:
+            return self._post_with_retries(payload, retry_info, retry_budget, started_at)
+        finally:
+            retry_info["elapsed"] = round(time.monotonic() - started_at, 3)
+    
+    def _post_with_retries(self, payload: Dict[str, Any], retry_info: Dict[str, Any],
+                           retry_budget: Optional[RetryBudget], started_at: float) -> requests.Response:
+        """_post 的重试循环"""
+        while True:
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/chat/completions",
+                    json=payload,
+                    timeout=max(1.0, min(self.timeout, self.retry_policy.remaining(started_at)))
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self._retry_delay(retry_info, started_at, None, retry_budget)
+                if delay is None:
+                    raise
+                retry_info["retry_statuses"].append(None)
+                logger.warning(f"请求异常 {str(e)}，{delay:.1f} 秒后第 {retry_info['retries']} 次重试")
+                time.sleep(delay)
+                continue
+            
+            if not self.retry_policy.is_retryable_status(response.status_code):
+                return response
+            
+            delay = self._retry_delay(retry_info, started_at, response.headers.get("Retry-After"), retry_budget)
+            if delay is None:
+                return response
+            retry_info["retry_statuses"].append(response.status_code)
+            logger.warning(f"API 返回 {response.status_code}，{delay:.1f} 秒后第 {retry_info['retries']} 次重试")
+            time.sleep(delay)
+    
+    async def _post_async(self, payload: Dict[str, Any], retry_info: Dict[str, Any],
+                          retry_budget: Optional[RetryBudget] = None):
+        """异步版本的 _post，等待期间不占用事件循环"""
+        started_at = time.monotonic()
+        try:
+            return await self._post_with_retries_async(payload, retry_info, retry_budget, started_at)
+        finally:
+            retry_info["elapsed"] = round(time.monotonic() - started_at, 3)
+    
+    async def _post_with_retries_async(self, payload: Dict[str, Any], retry_info: Dict[str, Any],
+                                       retry_budget: Optional[RetryBudget], started_at: float):
+        """_post_async 的重试循环"""
+        client = self._get_async_client()
+        while True:
+            try:
+                response = await client.post(
+                    "/chat/completions",
+                    json=payload,
+                    timeout=max(1.0, min(self.timeout, self.retry_policy.remaining(started_at)))
+                )
+            except httpx.TransportError as e:
+                delay = self._retry_delay(retry_info, started_at, None, retry_budget)
+                if delay is None:
+                    raise
+                retry_info["retry_statuses"].append(None)
+                logger.warning(f"请求异常 {str(e) or type(e).__name__}，{delay:.1f} 秒后第 {retry_info['retries']} 次重试")
+                await asyncio.sleep(delay)
+                continue
+            
+            if not self.retry_policy.is_retryable_status(response.status_code):
+                return response
+            
+            delay = self._retry_delay(retry_info, started_at, response.headers.get("Retry-After"), retry_budget)
+            if delay is None:
+                return response
+            retry_info["retry_statuses"].append(response.status_code)
+            logger.warning(f"API 返回 {response.status_code}，{delay:.1f} 秒后第 {retry_info['retries']} 次重试")
+            await asyncio.sleep(delay)
+    
+    def _cache_key(self, content: str, analysis_type: str, batch: bool = False) -> str:
+        """计算建议缓存的键"""
+        # 片段预算不同，送给模型的内容也不同；打包请求用另一套提示词和片段预算，单独缓存
+        if batch:
+            prompt_version = f"batch:{PROMPT_VERSION}:{self.batch_excerpt_token_budget}"
+        else:
+            prompt_version = f"{PROMPT_VERSION}:{self.excerpt_token_budget}"
+        return self.cache.make_key(content, analysis_type, self.model, prompt_version)
+    
+    def lookup_cached(self, content: str, analysis_type: str = "summary", batch: bool = False) -> Optional[Dict[str, Any]]:
+        """只查询建议缓存，不发起请求；未启用缓存或未命中时返回 None
+        
+        batch 为 True 时查询打包请求的结果，与单文件请求的结果分开缓存。
+        """
+        if not self.cache:
+            return None
+        return self._cache_lookup(content, analysis_type, batch)
+    
+    def _cache_lookup(self, content: str, analysis_type: str, batch: bool = False) -> Optional[Dict[str, Any]]:
+        """查询建议缓存，命中时直接返回分析结果"""
+        suggested_name = self.cache.get(self._cache_key(content, analysis_type, batch))
+        if suggested_name is None:
+            return None
+        
+        return {
+            "success": True,
+            "suggested_name": suggested_name,
+            "analysis_type": analysis_type,
+            "original_length": len(content),
+            "cached": True
+        }
+    
+    def _cache_store(self, content: str, analysis_type: str, result: Dict[str, Any], batch: bool = False) -> None:
+        """只缓存成功的分析结果"""
+        if result.get("success"):
+            self.cache.put(self._cache_key(content, analysis_type, batch), result["suggested_name"],
+                           analysis_type, self.model)
     
-    def analyze_content(self, content: str, analysis_type: str = "summary") -> Dict[str, Any]:
+    def analyze_content(self, content: str, analysis_type: str = "summary", use_cache: bool = True,
+                        retry_budget: Optional[RetryBudget] = None) -> Dict[str, Any]:
         """
         分析文本内容并返回分析结果
         
         Args:
             content: 要分析的文本内容
             analysis_type: 分析类型 ('summary', 'keywords', 'topic', 'custom')
+            use_cache: 是否使用建议缓存，为 False 时跳过查询但仍写入新结果
+            retry_budget: 批次共享的重试预算，为空时只受单请求重试次数限制
         
         Returns:
-            包含分析结果的字典
+            包含分析结果的字典，retries 为本次分析的重试次数，elapsed 为请求耗时（秒），
+            usage 为 token 用量
         """
+        if self.cache and use_cache:
+            cached = self._cache_lookup(content, analysis_type)
+            if cached:
+                return cached
+        
+        retry_info = self._new_retry_info()
         try:
-            # 根据分析类型构建不同的提示词
-            prompts = {
-                "summary": f"""请分析以下文本内容，并提供一个简洁的摘要作为文件名建议。
-要求：
-1. 摘要应该简洁明了，适合作为文件名
-2. 长度不超过50个字符
-3. 不要包含特殊字符，只使用中文、英文、数字和下划线
-4. 如果是代码文件，请包含主要功能描述
-5. 如果是文档，请提取核心主题
-
-文本内容：
-{content[:2000]}
-
-请只返回建议的文件名，不要其他解释：""",
-
-                "keywords": f"""请从以下文本中提取3-5个最重要的关键词，用下划线连接作为文件名。
-要求：
-1. 关键词应该能代表文本的核心内容
-2. 使用中文或英文
-3. 用下划线连接关键词
-4. 总长度不超过50个字符
-
-文本内容：
-{content[:2000]}
-
-请只返回关键词组合，不要其他解释：""",
-
-                "topic": f"""请识别以下文本的主要主题，并生成一个简洁的主题名称作为文件名。
-要求：
-1. 主题名称应该准确反映文本内容的核心
-2. 长度不超过30个字符
-3. 使用中文或英文
-4. 不包含特殊字符
-
-文本内容：
-{content[:2000]}
-
-请只返回主题名称，不要其他解释："""
-            }
-            
-            prompt = prompts.get(analysis_type, prompts["summary"])
+            payload = self._build_payload(content, analysis_type)
             
             # 调用 DeepSeek API
-            payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 100,
-                "temperature": 0.7
-            }
+            response = self._post(payload, retry_info, retry_budget)
             
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                suggested_name = result["choices"][0]["message"]["content"].strip()
-                
-                return {
-                    "success": True,
-                    "suggested_name": suggested_name,
-                    "analysis_type": analysis_type,
-                    "original_length": len(content)
-                }
-            else:
-                logger.error(f"DeepSeek API 错误: {response.status_code} - {response.text}")
-                return {
-                    "success": False,
-                    "error": f"API 调用失败: {response.status_code}",
-                    "suggested_name": "未知文档"
-                }
+            result = self._parse_response(response, content, analysis_type)
+            if self.cache:
+                self._cache_store(content, analysis_type, result)
                 
         except Exception as e:
             logger.error(f"DeepSeek API 调用异常: {str(e)}")
-            return {
+            result = {
                 "success": False,
                 "error": str(e),
                 "suggested_name": "分析失败"
             }
+        
+        result.update(retry_info)
+        return result
+    
+    def _get_async_client(self):
+        """获取当前事件循环对应的异步连接池"""
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # 循环已结束却没有调用 aclose 的连接池无法再关闭，只能丢弃
+                for stale_loop in [l for l in self._async_clients if l.is_closed()]:
+                    del self._async_clients[stale_loop]
+                # 连接池绑定在创建它的事件循环上，每个循环单独创建
+                client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    )
+                )
+                self._async_clients[loop] = client
+        return client
+    
+    async def analyze_content_async(self, content: str, analysis_type: str = "summary", use_cache: bool = True,
+                                    retry_budget: Optional[RetryBudget] = None) -> Dict[str, Any]:
+        """
+        异步分析文本内容，多个调用可以同时在途
+        
+        未安装 httpx 时退回到线程中执行同步请求，不阻塞事件循环。
+        """
+        if not HTTPX_AVAILABLE:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.analyze_content, content, analysis_type, use_cache,
+                                              retry_budget)
+        
+        if self.cache and use_cache:
+            cached = self._cache_lookup(content, analysis_type)
+            if cached:
+                return cached
+        
+        retry_info = self._new_retry_info()
+        try:
+            payload = self._build_payload(content, analysis_type)
+            
+            response = await self._post_async(payload, retry_info, retry_budget)
+            
+            result = self._parse_response(response, content, analysis_type)
+            if self.cache:
+                self._cache_store(content, analysis_type, result)
+                
+        except Exception as e:
+            logger.error(f"DeepSeek API 调用异常: {str(e) or type(e).__name__}")
+            result = {
+                "success": False,
+                "error": str(e) or type(e).__name__,
+                "suggested_name": "分析失败"
+            }
+        
+        result.update(retry_info)
+        return result
+    
+    def _build_batch_payload(self, items: List[Tuple[str, str]], analysis_type: str) -> Dict[str, Any]:
+        """把多个文件片段打包进一个请求，文件以序号标识，固定的说明放在系统提示词中"""
+        system_prompt = BATCH_SYSTEM_PROMPTS.get(analysis_type, BATCH_SYSTEM_PROMPTS["summary"])
+        sections = []
+        for index, (_, content) in enumerate(items, start=1):
+            excerpt = select_excerpt(content, self.batch_excerpt_token_budget)
+            sections.append(f"=== 文件 {index} ===\n{excerpt}")
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": "\n\n".join(sections)
+                }
+            ],
+            "max_tokens": 60 * len(items),
+            "temperature": 0.7
+        }
+    
+    def _parse_batch_response(self, response, items: List[Tuple[str, str]], analysis_type: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        解析批量分析响应
+        
+        Returns:
+            文件 ID 到分析结果的映射；响应格式不正确或需要拆分重试时返回 None
+        """
+        if response.status_code == 400:
+            # 多半是请求过长，拆小后重试
+            logger.warning(f"批量分析请求被拒绝，拆分后重试: {response.text}")
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"DeepSeek API 错误: {response.status_code} - {response.text}")
+            return self._batch_failure(items, f"API 调用失败: {response.status_code}", "未知文档",
+                                       response.status_code)
+        
+        try:
+            body = response.json()
+            text = body["choices"][0]["message"]["content"]
+            # 模型可能用 ```json 代码块包裹数组
+            start, end = text.find('['), text.rfind(']')
+            names = json.loads(text[start:end + 1]) if start != -1 and end > start else None
+        except (ValueError, KeyError, IndexError, TypeError):
+            names = None
+        
+        if not isinstance(names, list):
+            logger.warning(f"批量分析响应格式不正确，拆分后重试（{len(items)} 个文件）")
+            return None
+        
+        names_by_index = {}
+        for entry in names:
+            if isinstance(entry, dict) and str(entry.get("name", "")).strip():
+                names_by_index[str(entry.get("id")).strip()] = str(entry["name"]).strip()
+        
+        usage_shares = self._split_usage(self._extract_usage(body), [len(content) for _, content in items])
+        
+        results = {}
+        for index, (file_id, content) in enumerate(items, start=1):
+            suggested_name = names_by_index.get(str(index))
+            if suggested_name is None:
+                logger.warning(f"批量分析响应缺少文件 {index}，拆分后重试")
+                return None
+            
+            results[file_id] = {
+                "success": True,
+                "suggested_name": suggested_name,
+                "analysis_type": analysis_type,
+                "original_length": len(content),
+                "batch_size": len(items),
+                "status_code": response.status_code,
+                "usage": usage_shares[index - 1]
+            }
+        
+        return results
+    
+    @staticmethod
+    def _batch_failure(items: List[Tuple[str, str]], error: str, suggested_name: str,
+                       status_code: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """为整批文件生成相同的失败结果"""
+        failure = {"success": False, "error": error, "suggested_name": suggested_name}
+        if status_code is not None:
+            failure["status_code"] = status_code
+        return {file_id: dict(failure) for file_id, _ in items}
+    
+    def _batch_cache_lookup(self, items: List[Tuple[str, str]], analysis_type: str, use_cache: bool):
+        """批量查询缓存，返回 (已命中的结果, 仍需请求的条目)"""
+        if not (self.cache and use_cache):
+            return {}, list(items)
+        
+        results = {}
+        pending = []
+        for file_id, content in items:
+            cached = self._cache_lookup(content, analysis_type, batch=True)
+            if cached:
+                results[file_id] = cached
+            else:
+                pending.append((file_id, content))
+        return results, pending
+    
+    def _batch_cache_store(self, items: List[Tuple[str, str]], analysis_type: str, results: Dict[str, Dict[str, Any]]) -> None:
+        """缓存批量分析中成功的结果"""
+        if not self.cache:
+            return
+        for file_id, content in items:
+            self._cache_store(content, analysis_type, results[file_id], batch=True)
+    
+    def analyze_batch(self, items: List[Tuple[str, str]], analysis_type: str = "summary", use_cache: bool = True,
+                      retry_budget: Optional[RetryBudget] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        在一个请求中分析多个文件
+        
+        Args:
+            items: (文件 ID, 文本内容) 列表
+            analysis_type: 分析类型 ('summary', 'keywords', 'topic')
+            use_cache: 是否使用建议缓存
+            retry_budget: 批次共享的重试预算
+        
+        Returns:
+            文件 ID 到分析结果的映射，结果格式与 analyze_content 相同
+        """
+        results, pending = self._batch_cache_lookup(items, analysis_type, use_cache)
+        if pending:
+            results.update(self._analyze_batch_uncached(pending, analysis_type, retry_budget))
+        return results
+    
+    @staticmethod
+    def _attach_retry_info(results: Dict[str, Dict[str, Any]], retry_info: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """批量请求的重试记录和耗时计入该批每个文件"""
+        for result in results.values():
+            result["retries"] = retry_info["retries"]
+            result["retry_statuses"] = list(retry_info["retry_statuses"])
+            result["elapsed"] = retry_info["elapsed"]
+        return results
+    
+    def _analyze_batch_uncached(self, items: List[Tuple[str, str]], analysis_type: str,
+                                retry_budget: Optional[RetryBudget] = None) -> Dict[str, Dict[str, Any]]:
+        """发送批量请求，响应不正确时对半拆分重试，直到退化为单文件请求"""
+        if len(items) == 1:
+            file_id, content = items[0]
+            return {file_id: self.analyze_content(content, analysis_type, use_cache=False, retry_budget=retry_budget)}
+        
+        retry_info = self._new_retry_info()
+        try:
+            response = self._post(self._build_batch_payload(items, analysis_type), retry_info, retry_budget)
+            results = self._parse_batch_response(response, items, analysis_type)
+        except Exception as e:
+            logger.error(f"DeepSeek API 调用异常: {str(e)}")
+            return self._attach_retry_info(self._batch_failure(items, str(e), "分析失败"), retry_info)
+        
+        if results is None:
+            middle = len(items) // 2
+            results = self._analyze_batch_uncached(items[:middle], analysis_type, retry_budget)
+            results.update(self._analyze_batch_uncached(items[middle:], analysis_type, retry_budget))
+            return results
+        
+        self._batch_cache_store(items, analysis_type, results)
+        return self._attach_retry_info(results, retry_info)
+    
+    async def analyze_batch_async(self, items: List[Tuple[str, str]], analysis_type: str = "summary", use_cache: bool = True,
+                                  retry_budget: Optional[RetryBudget] = None) -> Dict[str, Dict[str, Any]]:
+        """异步版本的 analyze_batch"""
+        if not HTTPX_AVAILABLE:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.analyze_batch, items, analysis_type, use_cache, retry_budget)
+        
+        results, pending = self._batch_cache_lookup(items, analysis_type, use_cache)
+        if pending:
+            results.update(await self._analyze_batch_uncached_async(pending, analysis_type, retry_budget))
+        return results
+    
+    async def _analyze_batch_uncached_async(self, items: List[Tuple[str, str]], analysis_type: str,
+                                            retry_budget: Optional[RetryBudget] = None) -> Dict[str, Dict[str, Any]]:
+        """异步发送批量请求，拆分后的两半并发重试"""
+        if len(items) == 1:
+            file_id, content = items[0]
+            return {file_id: await self.analyze_content_async(content, analysis_type, use_cache=False,
+                                                              retry_budget=retry_budget)}
+        
+        retry_info = self._new_retry_info()
+        try:
+            response = await self._post_async(self._build_batch_payload(items, analysis_type), retry_info, retry_budget)
+            results = self._parse_batch_response(response, items, analysis_type)
+        except Exception as e:
+            logger.error(f"DeepSeek API 调用异常: {str(e) or type(e).__name__}")
+            return self._attach_retry_info(self._batch_failure(items, str(e) or type(e).__name__, "分析失败"), retry_info)
+        
+        if results is None:
+            middle = len(items) // 2
+            halves = await asyncio.gather(
+                self._analyze_batch_uncached_async(items[:middle], analysis_type, retry_budget),
+                self._analyze_batch_uncached_async(items[middle:], analysis_type, retry_budget)
+            )
+            results = halves[0]
+            results.update(halves[1])
+            return results
+        
+        self._batch_cache_store(items, analysis_type, results)
+        return self._attach_retry_info(results, retry_info)
+    
+    async def aclose(self):
+        """关闭当前事件循环的异步连接池，其他循环的连接池不受影响"""
+        with self._async_clients_lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def close(self):
+        """关闭同步会话"""
+        self.session.close()
     
     def test_connection(self) -> bool:
         """测试API连接是否正常"""
         try:
             payload = {
-                "model": "deepseek-chat",
+                "model": self.model,
                 "messages": [{"role": "user", "content": "Hello"}],
                 "max_tokens": 10
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
-                headers=self.headers,
                 json=payload,
                 timeout=10
             )
@@ -135,4 +671,4 @@ class DeepSeekClient:
             return response.status_code == 200
         except Exception as e:
             logger.error(f"连接测试失败: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
\ No newline at end of file
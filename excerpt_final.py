@@ -0,0 +1,117 @@
+import re
+from typing import List
+
+# DeepSeek 官方给出的粗略换算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+
+# 常见的标题行：Markdown 标题、"第X章"、"一、"、"1.2 "、"幻灯片 N:"、"工作表: X"
+_HEADING_RE = re.compile(
+    r'^\s*(?:#{1,6}\s+\S'
+    r'|第[一二三四五六七八九十百零〇\d]+[章节部分篇条]'
+    r'|[一二三四五六七八九十]+[、.．]'
+    r'|\d+(?:\.\d+)*[、.．]?\s+\S'
+    r'|幻灯片\s*\d+'
+    r'|工作表\s*[:：]'
+    r'|(?:abstract|summary|introduction|conclusion|摘要|概述|引言|总结|结论|目录)\b)',
+    re.IGNORECASE
+)
+
+# 片段之间的分隔符
+EXCERPT_SEPARATOR = "\n……\n"
+
+
+def _char_tokens(char: str) -> float:
+    return CJK_TOKENS_PER_CHAR if _CJK_RE.match(char) else OTHER_TOKENS_PER_CHAR
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的 token 数，中日韩字符按更高的权重计算"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR) + 1
+
+
+def truncate_to_tokens(text: str, token_budget: float) -> str:
+    """从开头截取不超过预算的文本"""
+    used = 0.0
+    for index, char in enumerate(text):
+        used += _char_tokens(char)
+        if used > token_budget:
+            return text[:index]
+    return text
+
+
+def _headings(lines: List[str], max_len: int = 60) -> List[str]:
+    """挑出像标题的短行，去重并保持原有顺序"""
+    seen = set()
+    headings = []
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or len(stripped) > max_len or stripped in seen:
+            continue
+        if _HEADING_RE.match(stripped):
+            seen.add(stripped)
+            headings.append(stripped)
+    return headings
+
+
+def select_excerpt(content: str, token_budget: int = 600, head_share: float = 0.5,
+                   heading_share: float = 0.2, window_tokens: int = 80) -> str:
+    """
+    在 token 预算内挑选最能代表全文的片段
+    
+    先取开头，再补充正文中的标题行，剩余预算平均分给均匀分布在后文的若干窗口。
+    内容本身不超过预算时原样返回。
+    
+    Args:
+        content: 提取出的全文
+        token_budget: 片段的 token 预算
+        head_share: 开头部分占预算的比例
+        heading_share: 标题行占预算的比例
+        window_tokens: 每个中段窗口的 token 数
+    """
+    if not content or estimate_tokens(content) <= token_budget:
+        return content
+    
+    head = truncate_to_tokens(content, token_budget * head_share)
+    # 尽量在行尾截断
+    cut = head.rfind('\n')
+    if cut > len(head) // 2:
+        head = head[:cut]
+    parts = [head.strip()]
+    remaining = token_budget - estimate_tokens(head)
+    
+    rest = content[len(head):]
+    
+    # 标题行
+    heading_budget = min(remaining, token_budget * heading_share)
+    selected_headings = []
+    for heading in _headings(rest.splitlines()):
+        cost = estimate_tokens(heading) + 1
+        if cost > heading_budget:
+            break
+        selected_headings.append(heading)
+        heading_budget -= cost
+        remaining -= cost
+    if selected_headings:
+        parts.append('\n'.join(selected_headings))
+    
+    # 均匀分布在后文的中段窗口
+    window_count = int(remaining // window_tokens)
+    if window_count > 0 and rest.strip():
+        step = len(rest) / (window_count + 1)
+        for i in range(1, window_count + 1):
+            start = int(step * i)
+            # 从下一行开头取，避免半截句子
+            line_start = rest.find('\n', start)
+            if 0 <= line_start - start < step / 2:
+                start = line_start + 1
+            window = truncate_to_tokens(rest[start:], window_tokens).strip()
+            if window:
+                parts.append(window)
+    
+    return EXCERPT_SEPARATOR.join(part for part in parts if part)
@@ -0,0 +1,114 @@
+import fnmatch
+import hashlib
+import logging
+import os
+import re
+from typing import FrozenSet, Iterable, List, Optional, Pattern
+
+logger = logging.getLogger(__name__)
+
+# 默认排除的文件类型
+DEFAULT_EXCLUDED_EXTENSIONS: FrozenSet[str] = frozenset({
+    '.exe', '.dll', '.so', '.dylib', '.bin', '.zip', '.rar', '.7z'
+})
+
+# 本工具自己生成的内容：备份目录和重命名日志，不能再被扫描、分析
+TOOL_DIR_PATTERNS = (r're:^backup_\d{8}_\d{6}$',)
+TOOL_FILE_PATTERNS = (r're:^rename_log_.*\.json$',)
+
+# 出现这些字符的无前缀模式按正则表达式处理，兼容旧配置
+_REGEX_ONLY_CHARS = set('^$+()|\\{}')
+_GLOB_CHARS = set('*?[')
+# 只按扩展名匹配的 glob，如 *.tmp，直接查集合
+_EXTENSION_GLOB_RE = re.compile(r'^\*(\.[^*?\[\]/\\]+)$')
+
+
+def _pattern_to_regex(pattern: str) -> Optional[str]:
+    """把单个排除模式转换成正则表达式，按 search 语义匹配文件名
+    
+    - 're:' 前缀：正则表达式
+    - 'glob:' 前缀：通配符，匹配整个文件名
+    - 无前缀：含正则专用字符（^ $ + ( ) | \\ { }）时按正则处理；含 * ? [ 时按通配符处理，
+      如 config.json 中的 '.*'、'~*'、'*.tmp'；其余按子串匹配
+    """
+    if pattern.startswith('re:'):
+        regex = pattern[3:]
+    elif pattern.startswith('glob:'):
+        regex = '^' + fnmatch.translate(pattern[5:])
+    elif _REGEX_ONLY_CHARS & set(pattern):
+        regex = pattern
+    elif _GLOB_CHARS & set(pattern):
+        regex = '^' + fnmatch.translate(pattern)
+    else:
+        regex = re.escape(pattern)
+    
+    if not regex:
+        return None
+    try:
+        # 与其他模式合并时会被包进分组，按分组后的形式校验
+        re.compile(f'(?:{regex})')
+    except re.error as e:
+        logger.warning(f"忽略无效的排除模式 {pattern}: {str(e)}")
+        return None
+    return regex
+
+
+def _compile(regexes: List[str]) -> Optional[Pattern]:
+    """把全部模式合并成一个正则，一次 search 完成所有模式的匹配"""
+    if not regexes:
+        return None
+    return re.compile('|'.join(f'(?:{regex})' for regex in regexes), re.IGNORECASE)
+
+
+class ExcludeMatcher:
+    """编译后的排除规则，对文件名和目录名做匹配
+    
+    通配符和正则合并成一个正则表达式，只按扩展名排除的模式放进集合；
+    用户的排除模式同时作用于目录，命中的目录整个跳过，不再遍历其内容。
+    本工具生成的备份目录（backup_YYYYmmdd_HHMMSS）和日志（rename_log_*.json）总是被排除。
+    """
+    
+    def __init__(
+        self,
+        patterns: Iterable[str] = (),
+        excluded_extensions: Iterable[str] = DEFAULT_EXCLUDED_EXTENSIONS
+    ):
+        """
+        Args:
+            patterns: 排除模式，支持 're:' 和 'glob:' 前缀
+            excluded_extensions: 总是排除的扩展名（带点，小写）
+        """
+        self.patterns = list(patterns)
+        extensions = set(excluded_extensions)
+        regexes = []
+        for pattern in self.patterns:
+            if not isinstance(pattern, str) or not pattern:
+                continue
+            extension_match = _EXTENSION_GLOB_RE.match(pattern[5:] if pattern.startswith('glob:') else pattern)
+            if extension_match and not pattern.startswith('re:'):
+                extensions.add(extension_match.group(1).lower())
+                continue
+            regex = _pattern_to_regex(pattern)
+            if regex is not None:
+                regexes.append(regex)
+        
+        tool_dirs = [_pattern_to_regex(pattern) for pattern in TOOL_DIR_PATTERNS]
+        tool_files = [_pattern_to_regex(pattern) for pattern in TOOL_FILE_PATTERNS]
+        self.excluded_extensions: FrozenSet[str] = frozenset(extensions)
+        self._file_regex = _compile(regexes + tool_files)
+        self._dir_regex = _compile(regexes + tool_dirs)
+        # 规则的摘要，规则变化后目录快照中的文件列表不能复用
+        self.signature = hashlib.sha256(
+            repr((sorted(self.excluded_extensions), regexes, tool_dirs, tool_files)).encode('utf-8')
+        ).hexdigest()
+    
+    def matches_file(self, name: str) -> bool:
+        """文件名是否被排除"""
+        extension = os.path.splitext(name)[1].lower()
+        if extension and extension in self.excluded_extensions:
+            return True
+        return self._file_regex is not None and self._file_regex.search(name) is not None
+    
+    def matches_dir(self, name: str) -> bool:
+        """目录是否整个跳过"""
+        return self._dir_regex is not None and self._dir_regex.search(name) is not None
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union
+
+from suggestion_cache_final import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 计算内容哈希时每次读取的字节数
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class FileFingerprint:
+    """文件身份：设备号 + inode + 大小 + 修改时间，必要时补充内容哈希"""
+    
+    def __init__(self, file_path: Path, stat_result: os.stat_result):
+        self.file_path = file_path
+        self.dev = stat_result.st_dev
+        self.inode = stat_result.st_ino
+        self.size = stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.content_hash: Optional[str] = None
+    
+    @property
+    def has_identity(self) -> bool:
+        # 部分文件系统不提供 inode，此时只能按内容哈希查找
+        return bool(self.inode)
+    
+    def compute_hash(self) -> str:
+        """流式计算文件内容的 SHA-256"""
+        if self.content_hash is None:
+            hasher = hashlib.sha256()
+            with open(self.file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b''):
+                    hasher.update(chunk)
+            self.content_hash = hasher.hexdigest()
+        return self.content_hash
+
+
+class ExtractionCache:
+    """基于 SQLite 的文件内容提取缓存
+    
+    先按 (设备号, inode, 大小, 修改时间) 查找，重命名和移动不改变这些属性，
+    因此重命名、撤销、再重命名都不需要重新解析；找不到时再按内容哈希查找，
+    复制出来的文件或只被 touch 过的文件也能命中。
+    
+    确定性的解析失败同样缓存，未变化的损坏文件不会每次都重新解析；超时、进程崩溃、
+    读文件出错等临时失败（结果带 transient 标记）不缓存，下次照常重试。
+    失败结果在 failure_ttl_seconds 后过期，安装了新的解析库后也能重新尝试。
+    """
+    
+    def __init__(
+        self,
+        db_path: Union[str, Path] = None,
+        max_size_bytes: int = 200 * 1024 * 1024,
+        enabled: bool = True,
+        version: str = "",
+        failure_ttl_seconds: float = 24 * 3600
+    ):
+        """
+        初始化缓存
+        
+        Args:
+            db_path: 数据库文件路径，默认位于用户目录下
+            max_size_bytes: 缓存内容总大小上限，超出后按最近最少使用淘汰
+            enabled: 是否启用缓存
+            version: 提取逻辑的版本，不同版本的结果互不命中
+            failure_ttl_seconds: 解析失败结果的有效期（秒），0 表示不缓存失败结果
+        """
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / "extractions.db"
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+        self.version = version
+        self.failure_ttl_seconds = failure_ttl_seconds
+        
+        # 命中统计
+        self.identity_hits = 0
+        self.hash_hits = 0
+        self.failure_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if enabled:
+            try:
+                self._open()
+            except Exception as e:
+                logger.error(f"打开提取缓存失败，缓存已禁用 {self.db_path}: {str(e)}")
+                self.enabled = False
+    
+    def _open(self):
+        """打开数据库并建表"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                content TEXT,
+                metadata TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS identities (
+                dev INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (dev, inode, size, mtime_ns)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_access ON extractions (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_identities_key ON identities (key)")
+        self._conn.commit()
+    
+    def _key_prefix(self, suffix: str, variant: str) -> str:
+        return f"{self.version}:{suffix}:{variant}:"
+    
+    def _make_key(self, content_hash: str, suffix: str, variant: str = "") -> str:
+        """提取结果取决于文件内容、扩展名（决定解析方式）、提取配置（如 PDF 后端）和提取逻辑版本"""
+        return self._key_prefix(suffix, variant) + content_hash
+    
+    def _identity_key(self, fingerprint: FileFingerprint) -> Optional[str]:
+        if not fingerprint.has_identity:
+            return None
+        row = self._conn.execute(
+            "SELECT key FROM identities WHERE dev = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+            (fingerprint.dev, fingerprint.inode, fingerprint.size, fingerprint.mtime_ns)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def _remember_identity(self, fingerprint: FileFingerprint, key: str) -> None:
+        """记录文件身份对应的条目，同一个 inode 只保留最新版本（调用方持有锁）"""
+        if not fingerprint.has_identity:
+            return
+        self._conn.execute(
+            "DELETE FROM identities WHERE dev = ? AND inode = ?", (fingerprint.dev, fingerprint.inode)
+        )
+        self._conn.execute(
+            "INSERT INTO identities (dev, inode, size, mtime_ns, key) VALUES (?, ?, ?, ?, ?)",
+            (fingerprint.dev, fingerprint.inode, fingerprint.size, fingerprint.mtime_ns, key)
+        )
+    
+    def _load(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        row = self._conn.execute(
+            "SELECT content, metadata, created_at FROM extractions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        metadata = json.loads(row[1])
+        now = time.time()
+        if not metadata.get('success') and now - row[2] > self.failure_ttl_seconds:
+            # 过期的失败结果视为未命中，重新提取后覆盖
+            return None
+        self._conn.execute("UPDATE extractions SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], metadata
+    
+    @staticmethod
+    def _build_result(file_path: Path, content: Optional[str], metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """按当前路径还原提取结果，文件改名后 file_path/file_name 也随之更新"""
+        result = dict(metadata)
+        result.update({
+            'file_path': str(file_path),
+            'file_name': file_path.name,
+            'content': content,
+            'cached': True
+        })
+        return result
+    
+    def lookup(self, file_path: Path, variant: str = "") -> Tuple[Optional[Dict[str, Any]], Optional[FileFingerprint]]:
+        """查询文件的提取结果
+        
+        Args:
+            file_path: 文件路径
+            variant: 提取配置（如 PDF 后端），配置不同的结果互不命中
+        
+        Returns:
+            (命中的提取结果或 None, 文件指纹)；未命中时把指纹传给 put 以免重复计算哈希
+        """
+        if not self.enabled:
+            return None, None
+        
+        try:
+            fingerprint = FileFingerprint(file_path, file_path.stat())
+            suffix = file_path.suffix.lower()
+            
+            with self._lock:
+                key = self._identity_key(fingerprint)
+                cached = self._load(key) if key and key.startswith(self._key_prefix(suffix, variant)) else None
+                if cached is not None:
+                    self._conn.commit()
+                    self.identity_hits += 1
+                    self._count_failure(cached[1])
+                    return self._build_result(file_path, *cached), fingerprint
+            
+            # 哈希计算可能要读完整个文件，放在锁外面
+            key = self._make_key(fingerprint.compute_hash(), suffix, variant)
+            with self._lock:
+                cached = self._load(key)
+                if cached is None:
+                    self.misses += 1
+                    return None, fingerprint
+                self._remember_identity(fingerprint, key)
+                self._conn.commit()
+                self.hash_hits += 1
+                self._count_failure(cached[1])
+                return self._build_result(file_path, *cached), fingerprint
+        except Exception as e:
+            logger.error(f"读取提取缓存失败 {file_path}: {str(e)}")
+            return None, None
+    
+    def _count_failure(self, metadata: Dict[str, Any]) -> None:
+        if not metadata.get('success'):
+            self.failure_hits += 1
+    
+    def put(self, fingerprint: Optional[FileFingerprint], result: Dict[str, Any], variant: str = "") -> None:
+        """写入提取结果（包括确定性的解析失败），并在超出容量时淘汰旧条目"""
+        if not self.enabled or fingerprint is None:
+            return
+        if not result.get('success') and (result.get('transient') or not self.failure_ttl_seconds):
+            return
+        
+        try:
+            key = self._make_key(fingerprint.compute_hash(), fingerprint.file_path.suffix.lower(), variant)
+            content = result.get('content')
+            metadata = {
+                name: result.get(name)
+                for name in ('file_type', 'success', 'error', 'file_size', 'simhash')
+            }
+            metadata_json = json.dumps(metadata, ensure_ascii=False)
+            size = len(key) + len(metadata_json) + len((content or '').encode('utf-8', errors='surrogatepass'))
+            now = time.time()
+            
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (key, content, metadata, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, content, metadata_json, size, now, now)
+                )
+                self._remember_identity(fingerprint, key)
+                self._evict()
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"写入提取缓存失败 {fingerprint.file_path}: {str(e)}")
+    
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限（调用方持有锁）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        
+        overflow = total - self.max_size_bytes
+        rows = self._conn.execute(
+            "SELECT key, size FROM extractions ORDER BY last_access ASC"
+        )
+        stale_keys = []
+        for key, size in rows:
+            if overflow <= 0:
+                break
+            stale_keys.append((key,))
+            overflow -= size
+        
+        self._conn.executemany("DELETE FROM extractions WHERE key = ?", stale_keys)
+        self._conn.executemany("DELETE FROM identities WHERE key = ?", stale_keys)
+        self.evictions += len(stale_keys)
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM extractions")
+            self._conn.execute("DELETE FROM identities")
+            self._conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        entries = 0
+        size_bytes = 0
+        if self.enabled:
+            with self._lock:
+                entries, size_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+                ).fetchone()
+        
+        hits = self.identity_hits + self.hash_hits
+        lookups = hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'path': str(self.db_path),
+            'entries': entries,
+            'size_bytes': size_bytes,
+            'max_size_bytes': self.max_size_bytes,
+            'identity_hits': self.identity_hits,
+            'hash_hits': self.hash_hits,
+            'failure_hits': self.failure_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+    
+    def close(self) -> None:
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self.enabled = False
@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from file_extractor_final import FileContentExtractor
+from near_dedupe_final import MIN_TEXT_LENGTH, simhash
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows 没有 resource 模块，无法限制工作进程内存
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 每个工作进程各自持有一个提取器，避免每个文件重复初始化
+_worker_extractor: Optional[FileContentExtractor] = None
+
+
+def _init_worker(extractor_options: Optional[Dict[str, Any]] = None) -> None:
+    global _worker_extractor
+    _worker_extractor = FileContentExtractor(**(extractor_options or {}))
+
+
+def extract_file(file_path: str) -> Dict[str, Any]:
+    """在工作进程中提取单个文件的内容，参数和返回值都可以被 pickle
+    
+    内容足够长时顺带计算 SimHash 指纹，用于在主进程中识别近似重复的文件。
+    """
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = FileContentExtractor()
+    result = _worker_extractor.extract_content(Path(file_path))
+    content = result.get('content')
+    if result.get('success') and content and len(content) >= MIN_TEXT_LENGTH:
+        result['simhash'] = simhash(content)
+    return result
+
+
+def _apply_memory_limit(memory_limit_bytes: int) -> None:
+    """限制当前进程的地址空间，超出后内存分配失败，而不是拖垮整台机器"""
+    if not memory_limit_bytes or not RESOURCE_AVAILABLE:
+        return
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        soft = memory_limit_bytes if hard == resource.RLIM_INFINITY else min(memory_limit_bytes, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    except (ValueError, OSError) as e:
+        logger.warning(f"无法设置提取进程的内存上限: {str(e)}")
+
+
+def _worker_main(conn, memory_limit_bytes: int, extractor_options: Optional[Dict[str, Any]]) -> None:
+    """工作进程主循环：逐个接收文件路径并返回提取结果，收到 None 或管道关闭时退出"""
+    _apply_memory_limit(memory_limit_bytes)
+    _init_worker(extractor_options)
+    while True:
+        try:
+            file_path = conn.recv()
+        except (EOFError, OSError):
+            break
+        if file_path is None:
+            break
+        conn.send(extract_file(file_path))
+
+
+def _failure_result(file_path: Path, error: str) -> Dict[str, Any]:
+    # 超时和进程崩溃与当时的负载、超时和内存上限设置有关，标记为临时失败，不写入提取缓存
+    return {
+        'file_path': str(file_path),
+        'file_name': file_path.name,
+        'success': False,
+        'content': None,
+        'error': error,
+        'file_size': 0,
+        'transient': True
+    }
+
+
+class _SupervisedWorker:
+    """一个受监管的提取进程，通过管道逐个处理文件"""
+    
+    def __init__(self, context, memory_limit_bytes: int, extractor_options: Optional[Dict[str, Any]]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit_bytes, extractor_options), daemon=True
+        )
+        self.process.start()
+        # 关闭父进程中的子端，子进程退出时 recv 才能收到 EOF
+        child_conn.close()
+        self.tasks = 0
+    
+    def run(self, file_path: str, timeout: Optional[float]) -> Dict[str, Any]:
+        """提取一个文件，超时抛出 TimeoutError，进程崩溃抛出 EOFError"""
+        self.conn.send(file_path)
+        if not self.conn.poll(timeout):
+            raise TimeoutError()
+        result = self.conn.recv()
+        self.tasks += 1
+        return result
+    
+    def stop(self) -> None:
+        """通知进程正常退出"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+    
+    def kill(self) -> None:
+        """强制结束进程（处理超时或已崩溃的进程）"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ExtractionPool:
+    """受监管的文件内容提取进程池
+    
+    PDF、Excel、Word 的解析是 CPU 密集型操作，放在事件循环里会阻塞所有在途的 API 请求。
+    这里把提取交给独立的工作进程，事件循环只等待结果。每个文件单独计时，
+    超时的进程被直接结束并替换；工作进程有内存上限，处理一定数量的文件后自动重启，
+    一个畸形文件只会让它自己被跳过，不会拖住整批预览。
+    """
+    
+    def __init__(
+        self,
+        workers: int = 0,
+        use_processes: bool = True,
+        timeout: Optional[float] = 60.0,
+        memory_limit_mb: int = 1024,
+        max_tasks_per_worker: int = 200,
+        extractor_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        初始化提取进程池
+        
+        Args:
+            workers: 工作进程数，0 表示使用 CPU 核数
+            use_processes: 为 False 时在线程中提取（调试或不支持多进程的环境，超时后无法中止）
+            timeout: 单个文件的提取超时（秒），为空或 0 表示不限制
+            memory_limit_mb: 工作进程的地址空间上限（MB），0 表示不限制，仅 Unix 有效
+            max_tasks_per_worker: 工作进程处理多少个文件后重启，0 表示不重启
+            extractor_options: 传给 FileContentExtractor 的参数（如 pdf_backend）
+        """
+        self.workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        self.use_processes = use_processes
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.extractor_options = extractor_options or {}
+        
+        # 不用 fork：本进程中已有 Flask 请求线程、监视线程和 SQLite 连接，fork 会把其他线程持有的锁
+        # （logging、sqlite、httpx）原样复制进子进程，子进程可能因此死锁。工作进程只接收可 pickle 的配置
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        self._dispatcher: Optional[ThreadPoolExecutor] = None
+        self._idle: List[_SupervisedWorker] = []
+        self._lock = threading.Lock()
+        # 调整大小或关闭后递增，之前启动的工作进程归还时直接退出
+        self._generation = 0
+        
+        # 运行统计
+        self.timeouts = 0
+        self.crashes = 0
+        self.recycled = 0
+        
+        if memory_limit_mb and not RESOURCE_AVAILABLE:
+            logger.info("当前系统不支持限制进程内存，提取进程的内存上限不生效")
+    
+    def _get_dispatcher(self) -> ThreadPoolExecutor:
+        # 每个调度线程同一时间只占用一个工作进程，线程数即并发提取数
+        if self._dispatcher is None:
+            # 线程模式下提取在调度线程中进行，同样按配置初始化提取器
+            self._dispatcher = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='extract',
+                initializer=_init_worker, initargs=(self.extractor_options,)
+            )
+        return self._dispatcher
+    
+    def _acquire_worker(self) -> _SupervisedWorker:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _SupervisedWorker(self._context, self.memory_limit_mb * 1024 * 1024, self.extractor_options)
+    
+    def _release_worker(self, worker: _SupervisedWorker, generation: int) -> None:
+        if self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker:
+            # 定期重启，回收解析库积累的内存
+            with self._lock:
+                self.recycled += 1
+            worker.stop()
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._idle.append(worker)
+                return
+        worker.stop()
+    
+    def _extract_supervised(self, file_path: Path) -> Dict[str, Any]:
+        """在调度线程中执行：取一个工作进程提取文件，超时或崩溃时结束该进程"""
+        generation = self._generation
+        try:
+            worker = self._acquire_worker()
+        except (OSError, NotImplementedError, ImportError) as e:
+            # 部分受限环境不支持多进程，退回线程内提取
+            logger.warning(f"无法创建提取进程（{str(e)}），改为在线程中提取内容")
+            self.use_processes = False
+            return extract_file(str(file_path))
+        
+        for attempt in range(2):
+            try:
+                result = worker.run(str(file_path), self.timeout)
+            except TimeoutError:
+                worker.kill()
+                with self._lock:
+                    self.timeouts += 1
+                logger.error(f"内容提取超时，已结束提取进程 {file_path}")
+                return _failure_result(file_path, f"提取超时（超过 {self.timeout:g} 秒）")
+            except (EOFError, OSError) as e:
+                # 进程意外退出，常见原因是超出内存上限或解析库崩溃；空闲期间已退出的进程
+                # 在发送任务时就会报 BrokenPipe，与本文件无关，换一个新进程重试一次
+                worker.kill()
+                with self._lock:
+                    self.crashes += 1
+                if attempt == 0:
+                    logger.warning(f"内容提取进程异常退出，换新进程重试 {file_path}: {str(e) or type(e).__name__}")
+                    try:
+                        worker = _SupervisedWorker(
+                            self._context, self.memory_limit_mb * 1024 * 1024, self.extractor_options
+                        )
+                    except (OSError, NotImplementedError, ImportError) as spawn_error:
+                        logger.error(f"无法创建提取进程 {file_path}: {str(spawn_error)}")
+                        return _failure_result(file_path, "提取进程异常退出（可能超出内存上限）")
+                    continue
+                logger.error(f"内容提取进程异常退出 {file_path}: {str(e) or type(e).__name__}")
+                return _failure_result(file_path, "提取进程异常退出（可能超出内存上限）")
+            
+            self._release_worker(worker, generation)
+            return result
+    
+    async def extract(self, file_path: Path) -> Dict[str, Any]:
+        """异步提取文件内容，返回值与 FileContentExtractor.extract_content 相同"""
+        loop = asyncio.get_running_loop()
+        if self.use_processes:
+            return await loop.run_in_executor(self._get_dispatcher(), self._extract_supervised, file_path)
+        
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._get_dispatcher(), extract_file, str(file_path)), self.timeout
+            )
+        except asyncio.TimeoutError:
+            # 线程无法被强制结束，只能放弃等待，线程会在提取完成后自行释放
+            with self._lock:
+                self.timeouts += 1
+            logger.error(f"内容提取超时 {file_path}")
+            return _failure_result(file_path, f"提取超时（超过 {self.timeout:g} 秒）")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回进程池配置和超时、崩溃、重启次数"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'use_processes': self.use_processes,
+                'timeout': self.timeout,
+                'memory_limit_mb': self.memory_limit_mb if RESOURCE_AVAILABLE else 0,
+                'max_tasks_per_worker': self.max_tasks_per_worker,
+                'idle_workers': len(self._idle),
+                'timeouts': self.timeouts,
+                'crashes': self.crashes,
+                'recycled': self.recycled
+            }
+    
+    def resize(self, workers: int) -> None:
+        """调整工作进程数，下次提取时生效"""
+        workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+        if workers != self.workers:
+            self.workers = workers
+            self.shutdown(wait=False)
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """停止空闲的工作进程，正在提取的进程完成后退出"""
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+        if self._dispatcher is not None:
+            self._dispatcher.shutdown(wait=wait)
+            self._dispatcher = None
@@ -1,43 +1,145 @@
 import os
+import re
+import sys
+import codecs
+import time
 import logging
+import importlib
+import importlib.util
+import zipfile
 from pathlib import Path
-from typing import Optional, Dict, Any
-import chardet
+from xml.etree.ElementTree import ParseError
+from typing import Optional, Dict, Any, Iterator, List
 
-# 文档处理库
-try:
-    from docx import Document
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
+from ooxml_final import read_xlsx, iter_docx_paragraphs, iter_pptx_slides
 
-try:
-    import PyPDF2
-    import pdfplumber
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
 
-try:
-    import markdown
-    MARKDOWN_AVAILABLE = True
-except ImportError:
-    MARKDOWN_AVAILABLE = False
+# 文档处理库体积较大，启动时只探测是否安装，第一次处理对应类型的文件时才真正导入
+def _module_available(module_name: str) -> bool:
+    """检查模块是否已安装，不执行导入"""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
 
-try:
-    from openpyxl import load_workbook
-    EXCEL_AVAILABLE = True
-except ImportError:
-    EXCEL_AVAILABLE = False
+DOCX_AVAILABLE = _module_available('docx')
+PDFPLUMBER_AVAILABLE = _module_available('pdfplumber')
+PYPDF2_AVAILABLE = _module_available('PyPDF2')
+PYPDFIUM2_AVAILABLE = _module_available('pypdfium2')
+PYMUPDF_AVAILABLE = _module_available('fitz')
+PDF_AVAILABLE = PDFPLUMBER_AVAILABLE or PYPDF2_AVAILABLE or PYPDFIUM2_AVAILABLE or PYMUPDF_AVAILABLE
+MARKDOWN_AVAILABLE = _module_available('markdown')
+EXCEL_AVAILABLE = _module_available('openpyxl')
+XLRD_AVAILABLE = _module_available('xlrd')
+PPTX_AVAILABLE = _module_available('pptx')
+CHARDET_AVAILABLE = _module_available('chardet')
+CCHARDET_AVAILABLE = _module_available('cchardet')
+CHARSET_NORMALIZER_AVAILABLE = _module_available('charset_normalizer')
 
-try:
-    from pptx import Presentation
-    PPTX_AVAILABLE = True
-except ImportError:
-    PPTX_AVAILABLE = False
+# 各解析库实际导入的耗时（秒），按首次使用的顺序记录
+_IMPORT_TIMINGS: Dict[str, float] = {}
+
+
+def _lazy_import(module_name: str):
+    """首次使用时导入模块并记录耗时，之后直接返回已导入的模块"""
+    if module_name not in _IMPORT_TIMINGS:
+        started_at = time.perf_counter()
+        importlib.import_module(module_name)
+        _IMPORT_TIMINGS[module_name] = time.perf_counter() - started_at
+    return sys.modules[module_name]
+
+
+def get_import_timings() -> Dict[str, float]:
+    """返回已按需导入的解析库及其导入耗时"""
+    return {name: round(seconds, 4) for name, seconds in _IMPORT_TIMINGS.items()}
 
 logger = logging.getLogger(__name__)
 
+# 旧版 .xls 等 OLE2 复合文档的文件头
+OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# 字节顺序标记，UTF-32 要排在 UTF-16 前面（UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头）
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 编码检测只看开头这么多字节
+_DETECT_SAMPLE_BYTES = 32 * 1024
+
+# 提取逻辑的版本号，修改解析方式或截取规则后递增，使提取缓存中的旧结果失效
+EXTRACTOR_VERSION = "3"
+
+# 只读文字层的 PDF 后端，按速度从快到慢排列。这是固定的默认顺序，运行时不读取基准结果；
+# pdf_benchmark.py 只用来验证它在当前机器和文档上是否仍然成立，不成立时可在配置中指定 pdf_backend
+FAST_PDF_BACKENDS = ('pypdfium2', 'pymupdf', 'pypdf2')
+PDF_BACKENDS = FAST_PDF_BACKENDS + ('pdfplumber',)
+_PDF_BACKEND_AVAILABLE = {
+    'pypdfium2': PYPDFIUM2_AVAILABLE,
+    'pymupdf': PYMUPDF_AVAILABLE,
+    'pypdf2': PYPDF2_AVAILABLE,
+    'pdfplumber': PDFPLUMBER_AVAILABLE,
+}
+
+# 文字层损坏时常见的替换字符、私用区字符、控制字符和 pdfminer 的 (cid:N) 占位
+_GARBLED_RE = re.compile(r'[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]|\(cid:\d+\)')
+
+# 乱码字符占比超过该值时视为文字层不可用
+GARBLED_RATIO = 0.1
+
+
+def available_pdf_backends():
+    """返回已安装的 PDF 后端"""
+    return [name for name in PDF_BACKENDS if _PDF_BACKEND_AVAILABLE[name]]
+
+
+def _looks_garbled(text: str) -> bool:
+    """判断文本是否为空或大部分是乱码"""
+    visible = len(text) - sum(1 for ch in text if ch.isspace())
+    if visible == 0:
+        return True
+    garbled = sum(len(match.group()) for match in _GARBLED_RE.finditer(text))
+    return garbled / visible > GARBLED_RATIO
+
+class TextAccumulator:
+    """按字符预算累积文本片段
+    
+    每个片段只追加一次，超出预算的部分直接截断，工作量和内存与预算成正比，与文档大小无关。
+    """
+    
+    def __init__(self, budget: int, separator: str = '\n'):
+        self.budget = budget
+        self.separator = separator
+        self.parts = []
+        self.length = 0
+    
+    @property
+    def full(self) -> bool:
+        return self.length >= self.budget
+    
+    def add(self, text: str) -> bool:
+        """追加一个片段，返回是否还需要更多内容"""
+        if not text or self.full:
+            return not self.full
+        
+        separator_length = len(self.separator) if self.parts else 0
+        remaining = self.budget - self.length - separator_length
+        if remaining <= 0:
+            self.length = self.budget
+            return False
+        
+        piece = text[:remaining]
+        self.parts.append(piece)
+        self.length += separator_length + len(piece)
+        return not self.full
+    
+    def text(self) -> str:
+        return self.separator.join(self.parts)
+
+
 class FileContentExtractor:
     """文件内容提取器，支持多种文件格式"""
     
@@ -70,8 +172,21 @@ class FileContentExtractor:
         '.ppt': 'presentation'
     }
     
-    def __init__(self):
+    def __init__(self, pdf_backend: str = "auto"):
+        """
+        Args:
+            pdf_backend: PDF 文字层后端，'auto' 使用已安装的最快后端，
+                         也可指定 'pypdfium2'、'pymupdf'、'pypdf2' 或 'pdfplumber'
+        """
         self.max_content_length = 5000  # 最大内容长度
+        self.pdf_backend = pdf_backend
+        self._pdf_backends: Optional[List[str]] = None
+    
+    def extraction_variant(self, file_path: Path) -> str:
+        """提取结果依赖的配置，用于区分缓存：PDF 取决于依次尝试的后端，其他类型没有可选项"""
+        if file_path.suffix.lower() == '.pdf':
+            return '+'.join(self._pdf_backend_order()) or 'none'
+        return ''
     
     def is_supported_file(self, file_path: Path) -> bool:
         """检查文件是否支持内容提取"""
@@ -82,23 +197,78 @@ class FileContentExtractor:
         ext = file_path.suffix.lower()
         return self.SUPPORTED_EXTENSIONS.get(ext, 'unknown')
     
+    @staticmethod
+    def _detect_bytes_encoding(raw_data: bytes) -> Optional[str]:
+        """用可用的检测库猜测编码，按速度依次尝试 cchardet、charset_normalizer、chardet"""
+        sample = raw_data[:_DETECT_SAMPLE_BYTES]
+        try:
+            if CCHARDET_AVAILABLE:
+                return _lazy_import('cchardet').detect(sample).get('encoding')
+            if CHARSET_NORMALIZER_AVAILABLE:
+                best = _lazy_import('charset_normalizer').from_bytes(sample).best()
+                return best.encoding if best else None
+            if CHARDET_AVAILABLE:
+                return _lazy_import('chardet').detect(sample).get('encoding')
+        except Exception as e:
+            logger.debug(f"编码检测失败: {str(e)}")
+        return None
+    
+    def _decode_text(self, raw_data: bytes, complete: bool) -> str:
+        """解码一段文件内容：先看 BOM，再严格按 UTF-8 解码，失败时才调用编码检测
+        
+        Args:
+            raw_data: 文件开头的字节
+            complete: 是否已读到文件末尾；未读完时末尾可能截断了多字节字符
+        """
+        for bom, encoding in _BOMS:
+            if raw_data.startswith(bom):
+                return raw_data.decode(encoding, errors='ignore')
+        
+        try:
+            # 增量解码器允许末尾出现不完整的字符，其余位置必须是合法的 UTF-8
+            decoder = codecs.getincrementaldecoder('utf-8')('strict')
+            return decoder.decode(raw_data, final=complete)
+        except UnicodeDecodeError:
+            pass
+        
+        # 中文环境下非 UTF-8 的文本绝大多数是 GBK/GB18030
+        encoding = self._detect_bytes_encoding(raw_data) or 'gb18030'
+        if encoding.lower().replace('-', '').replace('_', '') in ('gb2312', 'gbk', 'ascii'):
+            encoding = 'gb18030'
+        try:
+            return raw_data.decode(encoding, errors='ignore')
+        except LookupError:
+            return raw_data.decode('utf-8', errors='ignore')
+    
+    def _read_text(self, file_path: Path) -> str:
+        """只读一次文件，从同一个缓冲区检测编码并解码，最多读取内容上限对应的字节数"""
+        # UTF-8 每个字符最多 4 字节
+        limit = self.max_content_length * 4
+        with open(file_path, 'rb') as f:
+            raw_data = f.read(limit + 1)
+        complete = len(raw_data) <= limit
+        return self._decode_text(raw_data[:limit], complete)[:self.max_content_length]
+    
     def detect_encoding(self, file_path: Path) -> str:
         """检测文件编码"""
         try:
             with open(file_path, 'rb') as f:
-                raw_data = f.read(10000)  # 读取前10KB用于检测编码
-                result = chardet.detect(raw_data)
-                return result.get('encoding', 'utf-8') or 'utf-8'
+                raw_data = f.read(_DETECT_SAMPLE_BYTES)
+            for bom, encoding in _BOMS:
+                if raw_data.startswith(bom):
+                    return encoding
+            try:
+                codecs.getincrementaldecoder('utf-8')('strict').decode(raw_data, final=False)
+                return 'utf-8'
+            except UnicodeDecodeError:
+                return self._detect_bytes_encoding(raw_data) or 'gb18030'
         except Exception:
             return 'utf-8'
     
     def extract_text_content(self, file_path: Path) -> Optional[str]:
         """提取纯文本文件内容"""
         try:
-            encoding = self.detect_encoding(file_path)
-            with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                content = f.read(self.max_content_length)
-                return content
+            return self._read_text(file_path)
         except Exception as e:
             logger.error(f"提取文本文件内容失败 {file_path}: {str(e)}")
             return None
@@ -109,138 +279,291 @@ class FileContentExtractor:
             if not MARKDOWN_AVAILABLE:
                 return self.extract_text_content(file_path)
             
-            encoding = self.detect_encoding(file_path)
-            with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-                md_content = f.read(self.max_content_length)
-                # 简单处理：移除Markdown标记，保留纯文本
-                import re
-                # 移除图片链接
-                md_content = re.sub(r'!\[.*?\]\(.*?\)', '', md_content)
-                # 移除链接
-                md_content = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', md_content)
-                # 移除标题标记
-                md_content = re.sub(r'^#+\s*', '', md_content, flags=re.MULTILINE)
-                # 移除代码块标记
-                md_content = re.sub(r'```.*?```', '', md_content, flags=re.DOTALL)
-                md_content = re.sub(r'`([^`]+)`', r'\1', md_content)
-                # 移除多余空行
-                md_content = re.sub(r'\n\s*\n', '\n\n', md_content)
-                
-                return md_content.strip()
+            md_content = self._read_text(file_path)
+            # 简单处理：移除Markdown标记，保留纯文本
+            import re
+            # 移除图片链接
+            md_content = re.sub(r'!\[.*?\]\(.*?\)', '', md_content)
+            # 移除链接
+            md_content = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', md_content)
+            # 移除标题标记
+            md_content = re.sub(r'^#+\s*', '', md_content, flags=re.MULTILINE)
+            # 移除代码块标记
+            md_content = re.sub(r'```.*?```', '', md_content, flags=re.DOTALL)
+            md_content = re.sub(r'`([^`]+)`', r'\1', md_content)
+            # 移除多余空行
+            md_content = re.sub(r'\n\s*\n', '\n\n', md_content)
+            
+            return md_content.strip()
         except Exception as e:
             logger.error(f"提取Markdown文件内容失败 {file_path}: {str(e)}")
             return None
     
+    def _consume(self, chunks: Iterator[str]) -> str:
+        """从生成器中逐块读取文本，预算用完立即关闭生成器，后续内容不再解析"""
+        accumulator = TextAccumulator(self.max_content_length)
+        try:
+            for chunk in chunks:
+                if not accumulator.add(chunk):
+                    break
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+        return accumulator.text()
+    
     def extract_docx_content(self, file_path: Path) -> Optional[str]:
-        """提取Word文档内容"""
+        """提取Word文档内容，优先直接流式解析 word/document.xml"""
+        try:
+            return self._consume(iter_docx_paragraphs(file_path))
+        except (zipfile.BadZipFile, KeyError, ValueError, ParseError) as e:
+            logger.debug(f"流式读取 .docx 失败，改用 python-docx {file_path}: {str(e)}")
+        
         try:
             if not DOCX_AVAILABLE:
                 logger.warning("python-docx 未安装，无法处理 .docx 文件")
                 return None
             
-            doc = Document(file_path)
-            content = []
-            
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    content.append(paragraph.text.strip())
-                    if len('\n'.join(content)) > self.max_content_length:
-                        break
-            
-            return '\n'.join(content)
+            doc = _lazy_import('docx').Document(file_path)
+            paragraphs = (p.text.strip() for p in doc.paragraphs if p.text.strip())
+            return self._consume(paragraphs)
         except Exception as e:
             logger.error(f"提取Word文档内容失败 {file_path}: {str(e)}")
             return None
     
-    def extract_pdf_content(self, file_path: Path) -> Optional[str]:
-        """提取PDF文档内容"""
+    # 按内容预算逐页读取，这里只是防止文字很少的文档把整本读完的上限
+    MAX_PDF_PAGES = 50
+    # 开头这么多页都没有文字时视为扫描件，不再往后读
+    MAX_EMPTY_PDF_PAGES = 5
+    
+    def _pdf_backend_order(self) -> List[str]:
+        """确定依次尝试的后端：先用最快的文字层后端，结果为空或乱码时再交给 pdfplumber"""
+        if self._pdf_backends is not None:
+            return self._pdf_backends
+        
+        available = available_pdf_backends()
+        fast = [name for name in available if name in FAST_PDF_BACKENDS]
+        if self.pdf_backend in available:
+            first = [self.pdf_backend]
+        else:
+            if self.pdf_backend != "auto":
+                logger.warning(f"PDF 后端 {self.pdf_backend} 不可用，改为自动选择")
+            first = fast[:1]
+        rest = [name for name in ['pdfplumber'] + fast if name in available and name not in first]
+        self._pdf_backends = first + rest
+        return self._pdf_backends
+    
+    def _pdf_page_chunks(self, file_path: Path, backend: str) -> Iterator[str]:
+        """用指定后端逐页产出 PDF 文本，调用方预算用完后关闭生成器，后面的页不再解析"""
+        if backend == 'pypdfium2':
+            pdfium = _lazy_import('pypdfium2')
+            pdf = pdfium.PdfDocument(str(file_path))
+            try:
+                for index in range(min(len(pdf), self.MAX_PDF_PAGES)):
+                    page = pdf[index]
+                    textpage = page.get_textpage()
+                    try:
+                        yield textpage.get_text_range().replace('\r\n', '\n')
+                    finally:
+                        textpage.close()
+                        page.close()
+            finally:
+                pdf.close()
+        elif backend == 'pymupdf':
+            fitz = _lazy_import('fitz')
+            with fitz.open(str(file_path)) as doc:
+                for index in range(min(doc.page_count, self.MAX_PDF_PAGES)):
+                    yield doc.load_page(index).get_text()
+        elif backend == 'pypdf2':
+            PyPDF2 = _lazy_import('PyPDF2')
+            with open(file_path, 'rb') as f:
+                reader = PyPDF2.PdfReader(f)
+                for index in range(min(len(reader.pages), self.MAX_PDF_PAGES)):
+                    yield reader.pages[index].extract_text()
+        else:
+            pdfplumber = _lazy_import('pdfplumber')
+            with pdfplumber.open(file_path) as pdf:
+                for page in pdf.pages[:self.MAX_PDF_PAGES]:
+                    yield page.extract_text()
+    
+    def _stop_at_empty_pages(self, chunks: Iterator[str]) -> Iterator[str]:
+        """开头连续 MAX_EMPTY_PDF_PAGES 页都没有文字时停止读取，扫描件不必逐页读到上限"""
+        empty_pages = 0
         try:
-            if not PDF_AVAILABLE:
-                logger.warning("PDF处理库未安装，无法处理 .pdf 文件")
-                return None
-            
-            content = []
-            
-            # 首先尝试使用 pdfplumber（更好的文本提取）
+            for chunk in chunks:
+                if empty_pages is not None:
+                    if chunk and chunk.strip():
+                        empty_pages = None
+                    else:
+                        empty_pages += 1
+                        if empty_pages >= self.MAX_EMPTY_PDF_PAGES:
+                            return
+                yield chunk
+        finally:
+            chunks.close()
+    
+    def extract_pdf_content(self, file_path: Path) -> Optional[str]:
+        """提取PDF文档内容
+        
+        pdfplumber 的版面分析很慢，先用最快的后端直接读取文字层，
+        只有结果为空或乱码时才升级到 pdfplumber，后端出错时换下一个。
+        pdfplumber 也读不到任何文字时文档没有文字层（扫描件），不再尝试其余后端。
+        """
+        if not PDF_AVAILABLE:
+            logger.warning("PDF处理库未安装，无法处理 .pdf 文件")
+            return None
+        
+        fallback = None
+        last_error = None
+        for backend in self._pdf_backend_order():
             try:
-                import pdfplumber
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages[:5]:  # 只处理前5页
-                        text = page.extract_text()
-                        if text:
-                            content.append(text)
-                            if len('\n'.join(content)) > self.max_content_length:
-                                break
-            except Exception:
-                # 如果 pdfplumber 失败，使用 PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    for i, page in enumerate(reader.pages[:5]):  # 只处理前5页
-                        text = page.extract_text()
-                        if text:
-                            content.append(text)
-                            if len('\n'.join(content)) > self.max_content_length:
-                                break
+                text = self._consume(self._stop_at_empty_pages(self._pdf_page_chunks(file_path, backend)))
+            except Exception as e:
+                last_error = e
+                logger.debug(f"PDF 后端 {backend} 解析失败 {file_path}: {str(e)}")
+                continue
             
-            return '\n'.join(content)
-        except Exception as e:
-            logger.error(f"提取PDF文档内容失败 {file_path}: {str(e)}")
-            return None
+            if not _looks_garbled(text):
+                return text
+            logger.debug(f"PDF 后端 {backend} 未读到有效文字，尝试下一个后端 {file_path}")
+            if fallback is None or (not fallback.strip() and text.strip()):
+                fallback = text
+            if backend == 'pdfplumber' and not text.strip():
+                break
+        
+        if fallback is None:
+            logger.error(f"提取PDF文档内容失败 {file_path}: {str(last_error)}")
+        return fallback
+    
+    # 表格只读取前几个工作表的前若干行，足够判断主题
+    MAX_SHEETS = 3
+    MAX_ROWS_PER_SHEET = 50
     
     def extract_excel_content(self, file_path: Path) -> Optional[str]:
-        """提取Excel文档内容"""
+        """提取Excel文档内容，按文件头区分 .xlsx 和旧版 .xls"""
         try:
-            if not EXCEL_AVAILABLE:
-                logger.warning("openpyxl 未安装，无法处理 Excel 文件")
-                return None
-            
-            workbook = load_workbook(file_path, data_only=True)
-            content = []
-            
-            for sheet_name in workbook.sheetnames[:3]:  # 只处理前3个工作表
-                sheet = workbook[sheet_name]
-                content.append(f"工作表: {sheet_name}")
-                
-                for row in sheet.iter_rows(max_row=50, values_only=True):  # 只处理前50行
-                    row_text = []
-                    for cell in row:
-                        if cell is not None:
-                            row_text.append(str(cell))
-                    if row_text:
-                        content.append(' | '.join(row_text))
-                    
-                    if len('\n'.join(content)) > self.max_content_length:
-                        break
-                
-                if len('\n'.join(content)) > self.max_content_length:
-                    break
+            with open(file_path, 'rb') as f:
+                is_legacy = f.read(len(OLE2_SIGNATURE)) == OLE2_SIGNATURE
             
-            return '\n'.join(content)
+            if is_legacy:
+                return self.extract_xls_content(file_path)
+            return self.extract_xlsx_content(file_path)
         except Exception as e:
             logger.error(f"提取Excel文档内容失败 {file_path}: {str(e)}")
             return None
     
+    def _sheet_chunks(self, sheets) -> Iterator[str]:
+        """把 (工作表名, 行迭代器) 序列转换为逐行的文本块"""
+        for sheet_name, rows in sheets:
+            yield f"工作表: {sheet_name}"
+            for row in rows:
+                row_text = [self._format_cell(cell) for cell in row if cell is not None and cell != '']
+                if row_text:
+                    yield ' | '.join(row_text)
+    
+    @staticmethod
+    def _format_cell(cell) -> str:
+        # xlrd 把所有数字读成浮点数，整数去掉多余的 .0
+        if isinstance(cell, float) and cell.is_integer():
+            return str(int(cell))
+        return str(cell)
+    
+    def extract_xlsx_content(self, file_path: Path) -> Optional[str]:
+        """流式读取 .xlsx，达到行数和长度上限即停止，内存占用与工作簿大小无关"""
+        try:
+            return self._consume(self._sheet_chunks(read_xlsx(file_path, self.MAX_SHEETS, self.MAX_ROWS_PER_SHEET)))
+        except (zipfile.BadZipFile, KeyError, ValueError, ParseError) as e:
+            # 结构不标准的文件交给 openpyxl 处理
+            logger.debug(f"流式读取 .xlsx 失败，改用 openpyxl {file_path}: {str(e)}")
+        
+        if not EXCEL_AVAILABLE:
+            logger.warning("openpyxl 未安装，无法处理 Excel 文件")
+            return None
+        
+        workbook = _lazy_import('openpyxl').load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            # 只读模式按行流式解析，但仍会加载整张共享字符串表
+            sheets = (
+                (sheet.title, sheet.iter_rows(max_row=self.MAX_ROWS_PER_SHEET, values_only=True))
+                for sheet in workbook.worksheets[:self.MAX_SHEETS]
+            )
+            return self._consume(self._sheet_chunks(sheets))
+        finally:
+            # 只读模式会一直持有文件句柄，必须显式关闭
+            workbook.close()
+    
+    def extract_xls_content(self, file_path: Path) -> Optional[str]:
+        """使用 xlrd 读取旧版 .xls，工作表按需加载，读完即释放"""
+        if not XLRD_AVAILABLE:
+            logger.warning("xlrd 未安装，无法处理 .xls 文件")
+            return None
+        
+        xlrd = _lazy_import('xlrd')
+        book = xlrd.open_workbook(str(file_path), on_demand=True)
+        
+        def sheet_rows(index):
+            sheet = book.sheet_by_index(index)
+            try:
+                for row_index in range(min(sheet.nrows, self.MAX_ROWS_PER_SHEET)):
+                    yield [
+                        self._format_xls_cell(xlrd, book, cell)
+                        for cell in sheet.row(row_index)
+                    ]
+            finally:
+                book.unload_sheet(index)
+        
+        try:
+            sheet_names = book.sheet_names()[:self.MAX_SHEETS]
+            return self._consume(self._sheet_chunks((name, sheet_rows(index)) for index, name in enumerate(sheet_names)))
+        finally:
+            book.release_resources()
+    
+    @staticmethod
+    def _format_xls_cell(xlrd, book, cell):
+        """把 xlrd 单元格转换为普通值，日期单元格转成日期字符串"""
+        if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            return None
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            try:
+                return xlrd.xldate_as_datetime(cell.value, book.datemode).strftime('%Y-%m-%d')
+            except (ValueError, OverflowError):
+                return cell.value
+        if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(cell.value)
+        return cell.value
+    
+    # 演示文稿只读取前几张幻灯片
+    MAX_SLIDES = 10
+    
+    def _slide_chunks(self, slides) -> Iterator[str]:
+        """把 (序号, 形状文本列表) 序列转换为文本块，停止时一并关闭底层的幻灯片生成器"""
+        try:
+            for number, texts in slides:
+                yield f"幻灯片 {number}:"
+                yield from texts
+        finally:
+            close = getattr(slides, 'close', None)
+            if close:
+                close()
+    
     def extract_pptx_content(self, file_path: Path) -> Optional[str]:
-        """提取PowerPoint文档内容"""
+        """提取PowerPoint文档内容，优先直接流式解析幻灯片 XML，不读取媒体文件"""
+        try:
+            return self._consume(self._slide_chunks(iter_pptx_slides(file_path, self.MAX_SLIDES)))
+        except (zipfile.BadZipFile, KeyError, ValueError, ParseError) as e:
+            logger.debug(f"流式读取 .pptx 失败，改用 python-pptx {file_path}: {str(e)}")
+        
         try:
             if not PPTX_AVAILABLE:
                 logger.warning("python-pptx 未安装，无法处理 .pptx 文件")
                 return None
             
-            presentation = Presentation(file_path)
-            content = []
-            
-            for i, slide in enumerate(presentation.slides[:10]):  # 只处理前10张幻灯片
-                content.append(f"幻灯片 {i + 1}:")
-                
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        content.append(shape.text.strip())
-                
-                if len('\n'.join(content)) > self.max_content_length:
-                    break
-            
-            return '\n'.join(content)
+            presentation = _lazy_import('pptx').Presentation(file_path)
+            slides = (
+                (i + 1, [shape.text.strip() for shape in slide.shapes if hasattr(shape, "text") and shape.text.strip()])
+                for i, slide in enumerate(presentation.slides[:self.MAX_SLIDES])
+            )
+            return self._consume(self._slide_chunks(slides))
         except Exception as e:
             logger.error(f"提取PowerPoint文档内容失败 {file_path}: {str(e)}")
             return None
@@ -265,6 +588,7 @@ class FileContentExtractor:
         try:
             if not file_path.exists():
                 result['error'] = "文件不存在"
+                result['transient'] = True
                 return result
             
             result['file_size'] = file_path.stat().st_size
@@ -298,6 +622,9 @@ class FileContentExtractor:
             
         except Exception as e:
             result['error'] = f"提取文件内容时发生错误: {str(e)}"
+            # 读文件出错（被占用、权限不足）和内存不足可能下次就好了，不算文件本身的问题
+            if isinstance(e, (OSError, MemoryError)):
+                result['transient'] = True
             logger.error(f"文件内容提取失败 {file_path}: {str(e)}")
         
         return result 
\ No newline at end of file
@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 目录项过滤函数，参数是 os.scandir 返回的 DirEntry；
+# prune_dir 也可能收到只有 name 和 path 属性的 DirRef（来自上次的快照）
+EntryFilter = Callable[[Any], bool]
+
+# 修改时间距扫描开始不到这个时长的目录不复用列表：同一时间精度内的后续改动不会再改变修改时间
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+
+class DirRef(NamedTuple):
+    """快照中记录的子目录，提供与 DirEntry 相同的 name 和 path 属性"""
+    name: str
+    path: str
+
+
+class DirListing(NamedTuple):
+    """一个目录的列表结果，文件和子目录都只记录名称
+    
+    mtime_ns 为 -1 表示列表不可复用（目录刚被修改过，或读取修改时间失败）。
+    files 中的 stat 可以是 os.stat_result，也可以是快照中保存的同名字段。
+    """
+    mtime_ns: int
+    files: List[Tuple[str, Any]]
+    subdirs: List[str]
+
+
+def _list_directory(directory: str, include_file: Optional[EntryFilter], racy_after_ns: int) -> DirListing:
+    """列出单个目录，子目录全部记录（是否跳过在遍历时判断），文件只记录符合条件的
+    
+    DirEntry 自带文件类型，判断是否为目录、文件不需要额外的系统调用；
+    只有通过 include_file 筛选的文件才调用 stat（Windows 上 stat 也直接来自目录列表）。
+    """
+    files = []
+    subdirs = []
+    try:
+        # 先取修改时间再列目录，列表期间发生的改动会让下次扫描重新列出
+        mtime_ns = os.stat(directory).st_mtime_ns
+        if mtime_ns >= racy_after_ns:
+            mtime_ns = -1
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    # 不跟随目录符号链接，避免循环和重复遍历
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        if include_file is None or include_file(entry):
+                            files.append((entry.name, entry.stat()))
+                except OSError as e:
+                    logger.warning(f"读取文件信息失败 {entry.path}: {str(e)}")
+    except OSError as e:
+        logger.warning(f"无法读取目录 {directory}: {str(e)}")
+        return DirListing(-1, [], [])
+    return DirListing(mtime_ns, files, subdirs)
+
+
+def _refresh_files(directory: str, cached: DirListing) -> DirListing:
+    """目录本身没有变化时逐个 stat 快照中的文件，发现原地修改；全部未变时返回原列表"""
+    files = []
+    changed = False
+    for name, old_stat in cached.files:
+        try:
+            stat_result = os.stat(os.path.join(directory, name))
+        except OSError:
+            changed = True
+            continue
+        if stat_result.st_size != old_stat.st_size or stat_result.st_mtime_ns != old_stat.st_mtime_ns:
+            changed = True
+        files.append((name, stat_result))
+    return DirListing(cached.mtime_ns, files, cached.subdirs) if changed else cached
+
+
+def _visit(root: str, relative_dir: str, include_file: Optional[EntryFilter],
+           previous: Dict[str, DirListing], racy_after_ns: int, verify_files: bool) -> DirListing:
+    """取得一个目录的列表：修改时间与快照一致时直接复用，否则重新列出"""
+    directory = os.path.join(root, relative_dir) if relative_dir else root
+    cached = previous.get(relative_dir)
+    if cached is not None and cached.mtime_ns >= 0:
+        try:
+            # 目录的修改时间只在其中的条目增删、改名时变化，文件内容的原地修改需要另外 stat
+            if os.stat(directory).st_mtime_ns == cached.mtime_ns:
+                return _refresh_files(directory, cached) if verify_files else cached
+        except OSError:
+            pass
+    return _list_directory(directory, include_file, racy_after_ns)
+
+
+def walk_listings(
+    root: Union[str, Path],
+    prune_dir: Optional[EntryFilter] = None,
+    include_file: Optional[EntryFilter] = None,
+    workers: int = 0,
+    previous: Optional[Dict[str, DirListing]] = None,
+    verify_files: bool = True
+) -> Dict[str, DirListing]:
+    """用 os.scandir 遍历目录树，返回 相对目录路径 -> 目录列表（根目录为空字符串）
+    
+    Args:
+        root: 根目录
+        prune_dir: 返回 True 的子目录整个跳过，不再列出其内容
+        include_file: 返回 False 的文件不计入结果，也不调用 stat
+        workers: 并行列目录的线程数，0 表示单线程；网络文件系统上每次列目录都有往返延迟，
+                 多线程可以同时列出多个子目录
+        previous: 上次遍历得到的目录列表，修改时间未变的目录不再重新列出
+        verify_files: 复用目录列表时是否仍然 stat 其中的文件；为 False 时只有增删、改名能被发现，
+                      原地修改的文件要等所在目录下次变化时才会更新
+    """
+    root = str(root)
+    previous = previous or {}
+    racy_after_ns = time.time_ns() - RACY_WINDOW_NS
+    listings = {}
+    
+    def children(relative_dir: str, listing: DirListing) -> List[str]:
+        directory = os.path.join(root, relative_dir) if relative_dir else root
+        result = []
+        for name in listing.subdirs:
+            if prune_dir is not None and prune_dir(DirRef(name, os.path.join(directory, name))):
+                continue
+            result.append(os.path.join(relative_dir, name) if relative_dir else name)
+        return result
+    
+    if workers and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan') as executor:
+            running = {executor.submit(_visit, root, '', include_file, previous, racy_after_ns, verify_files): ''}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    relative_dir = running.pop(future)
+                    listing = future.result()
+                    listings[relative_dir] = listing
+                    for child in children(relative_dir, listing):
+                        running[executor.submit(
+                            _visit, root, child, include_file, previous, racy_after_ns, verify_files
+                        )] = child
+    else:
+        pending_dirs = ['']
+        while pending_dirs:
+            relative_dir = pending_dirs.pop()
+            listing = _visit(root, relative_dir, include_file, previous, racy_after_ns, verify_files)
+            listings[relative_dir] = listing
+            pending_dirs.extend(children(relative_dir, listing))
+    
+    return listings
+
+
+def _sort_key(item: Tuple[str, Any]) -> str:
+    # 路径分隔符排在所有字符前面，同一目录下的文件按名称排序且先于更深的子目录中的同名前缀
+    return item[0].replace(os.sep, '\0')
+
+
+def iter_listing_files(root: Union[str, Path], listings: Dict[str, DirListing]) -> List[Tuple[Path, Any]]:
+    """把目录列表展开成按路径排序的 (文件路径, stat)"""
+    root = str(root)
+    results = []
+    for relative_dir, listing in listings.items():
+        directory = os.path.join(root, relative_dir) if relative_dir else root
+        results.extend((os.path.join(directory, name), stat_result) for name, stat_result in listing.files)
+    results.sort(key=_sort_key)
+    return [(Path(path), stat_result) for path, stat_result in results]
+
+
+def walk_files(
+    root: Union[str, Path],
+    prune_dir: Optional[EntryFilter] = None,
+    include_file: Optional[EntryFilter] = None,
+    workers: int = 0
+) -> List[Tuple[Path, os.stat_result]]:
+    """用 os.scandir 遍历目录树，返回按路径排序的 (文件路径, stat)
+    
+    参数含义同 walk_listings，结果顺序与遍历方式无关。
+    """
+    return iter_listing_files(root, walk_listings(root, prune_dir, include_file, workers))
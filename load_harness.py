@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线压测脚本
+
+生成一批测试文件，启动本地模拟 DeepSeek 服务，走完整的 process_directory
+流程，报告吞吐量（文件/秒）、延迟分位数、重试、缓存和并发窗口的情况。
+用于在没有真实 API 的情况下衡量并发和缓存相关的改动。
+
+用法:
+    python load_harness.py --files 500 --latency-mean 0.3 --rate-429 0.05
+    python load_harness.py --files 200 --runs 2 --cache      # 第二轮应全部命中缓存
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from mock_deepseek_server import add_server_arguments, server_from_args, percentiles
+from rename_files_final import DeepSeekFileRenamer
+from suggestion_cache_final import SuggestionCache
+
+_WORDS = ["项目", "报告", "会议", "预算", "合同", "方案", "总结", "计划", "数据", "分析",
+          "quarterly", "report", "design", "invoice", "meeting", "notes", "budget", "draft"]
+
+# 词表要足够大，否则所有文件都由同一小组词拼成，会被近似去重归为一组，请求数远少于文件数
+_VOCABULARY_SIZE = 20000
+_LATIN_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _build_vocabulary(size: int, seed: int) -> List[str]:
+    """生成中文和英文各半的随机词，与常用词合在一起作为测试文件的词表"""
+    rng = random.Random(f"vocabulary:{seed}")
+    words = list(_WORDS)
+    while len(words) < size:
+        if len(words) % 2:
+            words.append("".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 4))))
+        else:
+            words.append("".join(rng.choice(_LATIN_LETTERS) for _ in range(rng.randint(3, 9))))
+    return words
+
+
+def generate_files(directory: Path, count: int, min_chars: int, max_chars: int, seed: int = 0) -> List[Path]:
+    """生成内容各不相同的 txt/md 测试文件，长度在给定范围内随机
+    
+    每个文件用各自的随机种子从大词表中取词，文件之间既不完全相同，也不会被识别为近似重复。
+    """
+    vocabulary = _build_vocabulary(_VOCABULARY_SIZE, seed)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        file_rng = random.Random(f"{seed}:{index}")
+        length = rng.randint(min_chars, max_chars)
+        words = []
+        total = 0
+        while total < length:
+            word = file_rng.choice(vocabulary)
+            words.append(word)
+            total += len(word) + 1
+        suffix = ".md" if index % 4 == 0 else ".txt"
+        header = f"# 文档 {index}\n\n" if suffix == ".md" else f"文档编号 {index}\n"
+        path = directory / f"file_{index:05d}{suffix}"
+        path.write_text(header + " ".join(words), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def _made_request(result: Dict[str, Any]) -> bool:
+    """结果是否来自一次 API 请求（请求结果带有 elapsed 等重试记录）"""
+    analysis_result = result.get('analysis_result')
+    if not analysis_result or analysis_result.get('cached') or 'elapsed' not in analysis_result:
+        return False
+    return not (result.get('duplicate_of') or result.get('near_duplicate_of'))
+
+
+async def run_once(renamer: DeepSeekFileRenamer) -> Dict[str, Any]:
+    started_at = time.monotonic()
+    result = await renamer.process_directory(execute_rename=False)
+    wall_time = time.monotonic() - started_at
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+    analysis_results = result['analysis_results']
+    # 只统计真正发出请求的文件：缓存命中、重复和近似重复的文件没有请求，耗时为 0
+    latencies = [r['elapsed'] for r in analysis_results if _made_request(r)]
+    cached = sum(1 for r in analysis_results if (r.get('analysis_result') or {}).get('cached'))
+    return {
+        'files': result['total_files'],
+        'successful': result['successful_analyses'],
+        'failed': result['failed_analyses'],
+        'skipped': result['skipped_analyses'],
+        'cached': cached,
+        'duplicates': result.get('duplicate_files', 0),
+        'near_duplicates': result.get('near_duplicate_files', 0),
+        'wall_time': round(wall_time, 3),
+        'files_per_second': round(result['total_files'] / wall_time, 2) if wall_time else 0.0,
+        'latency': percentiles(latencies),
+        'total_retries': result['total_retries'],
+        'prompt_cache_hit_rate': round(result['prompt_cache']['hit_rate'], 4),
+        'cost': result['usage']['totals']['cost']
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("=" * 60)
+    for index, run in enumerate(report['runs'], start=1):
+        latency = run['latency']
+        print(f"第 {index} 轮: {run['files']} 个文件，耗时 {run['wall_time']:.2f} 秒，"
+              f"{run['files_per_second']:.1f} 文件/秒")
+        print(f"    成功 {run['successful']}，失败 {run['failed']}，跳过 {run['skipped']}，缓存命中 {run['cached']}，"
+              f"重复 {run['duplicates']}，近似重复 {run['near_duplicates']}")
+        print(f"    请求延迟 p50={latency['p50']:.3f}s p95={latency['p95']:.3f}s p99={latency['p99']:.3f}s")
+        print(f"    重试 {run['total_retries']} 次，提示词缓存命中率 {run['prompt_cache_hit_rate']:.1%}，"
+              f"预计费用 {run['cost']:.4f}")
+    server = report['server']
+    print(f"模拟服务: 共 {server['requests']} 个请求，峰值并发 {server['peak_in_flight']}，"
+          f"状态码 {server['status_counts']}")
+    concurrency = report['concurrency']
+    print(f"并发窗口: 当前 {concurrency.get('limit')}，调整记录 {len(concurrency.get('history', []))} 条")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于模拟 DeepSeek 服务的离线压测")
+    parser.add_argument("--files", type=int, default=200, help="生成的文件数")
+    parser.add_argument("--min-chars", type=int, default=40, help="文件最短字符数")
+    parser.add_argument("--max-chars", type=int, default=3000, help="文件最长字符数")
+    parser.add_argument("--directory", help="使用已有目录，不生成文件")
+    parser.add_argument("--runs", type=int, default=1, help="对同一目录重复运行的次数")
+    parser.add_argument("--batch-size", type=int, default=8, help="多文件打包请求的文件数")
+    parser.add_argument("--max-concurrent", type=int, default=3, help="初始并发数")
+    parser.add_argument("--max-concurrent-limit", type=int, default=16, help="自适应并发上限")
+    parser.add_argument("--no-adaptive", action="store_true", help="关闭自适应并发")
+    parser.add_argument("--extraction-workers", type=int, default=0, help="内容提取进程数，0 表示 CPU 核数")
+    parser.add_argument("--cache", action="store_true", help="启用文件名建议缓存（临时数据库）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    parser.add_argument("--verbose", action="store_true", help="输出详细日志")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO if args.verbose else logging.WARNING)
+    # 日志改写到 stderr，stdout 只输出报告，--json 的结果可以直接交给其他程序解析
+    for handler in root_logger.handlers:
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+            handler.setStream(sys.stderr)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="deepseek_load_"))
+    try:
+        if args.directory:
+            target_dir = Path(args.directory)
+        else:
+            target_dir = work_dir / "files"
+            target_dir.mkdir()
+            generate_files(target_dir, args.files, args.min_chars, args.max_chars, args.seed or 0)
+
+        cache = SuggestionCache(work_dir / "cache.db") if args.cache else None
+
+        with server_from_args(args) as server:
+            renamer = DeepSeekFileRenamer(
+                api_key="mock-key",
+                base_dir=target_dir,
+                api_config={'base_url': server.base_url},
+                suggestion_cache=cache,
+                batch_size=args.batch_size,
+                max_concurrent=args.max_concurrent,
+                max_concurrent_limit=args.max_concurrent_limit,
+                adaptive_concurrency=not args.no_adaptive,
+                extraction_workers=args.extraction_workers
+            )
+            runs = [asyncio.run(run_once(renamer)) for _ in range(args.runs)]
+            report = {
+                'runs': runs,
+                'server': server.get_stats(),
+                'concurrency': renamer.concurrency_limiter.get_stats(),
+                'cache': cache.get_stats() if cache else None
+            }
+            renamer.extraction_pool.shutdown()
+
+        if cache:
+            cache.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
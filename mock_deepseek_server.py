@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟 DeepSeek 服务
+
+实现 /chat/completions 接口，用于在没有真实 API 的情况下测试客户端、
+并发控制和缓存。支持可配置的延迟分布、429/5xx 注入和容量限制，
+根据内容生成确定的文件名，并返回带上下文缓存字段的 usage。
+
+用法:
+    python mock_deepseek_server.py --port 8765 --latency lognormal --latency-mean 0.3 --rate-429 0.05
+然后把 config.json 中的 deepseek_base_url 指向 http://127.0.0.1:8765/v1/chat/completions
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from excerpt_final import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+_BATCH_SECTION_RE = re.compile(r"^=== 文件 (\d+) ===\n", re.MULTILINE)
+
+
+class LatencyModel:
+    """按指定分布生成模拟的响应延迟（秒）"""
+
+    def __init__(self, distribution: str = "lognormal", mean: float = 0.2, sigma: float = 0.5,
+                 per_1k_tokens: float = 0.0, rng: random.Random = None):
+        """
+        Args:
+            distribution: 延迟分布 ('fixed', 'uniform', 'exponential', 'lognormal')
+            mean: 平均延迟
+            sigma: lognormal 的形状参数，uniform 时表示相对 mean 的波动比例
+            per_1k_tokens: 每 1000 个提示词 token 额外增加的延迟
+            rng: 随机数生成器，传入带种子的实例可复现结果
+        """
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {distribution}")
+        self.distribution = distribution
+        self.mean = mean
+        self.sigma = sigma
+        self.per_1k_tokens = per_1k_tokens
+        self.rng = rng or random.Random()
+
+    def sample(self, prompt_tokens: int = 0) -> float:
+        if self.distribution == "fixed":
+            base = self.mean
+        elif self.distribution == "uniform":
+            base = self.rng.uniform(self.mean * (1 - self.sigma), self.mean * (1 + self.sigma))
+        elif self.distribution == "exponential":
+            base = self.rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        else:
+            # 让分布的均值等于 mean
+            mu = math.log(self.mean) - self.sigma ** 2 / 2 if self.mean > 0 else 0.0
+            base = self.rng.lognormvariate(mu, self.sigma) if self.mean > 0 else 0.0
+        return max(0.0, base) + prompt_tokens / 1000 * self.per_1k_tokens
+
+
+class MockDeepSeekServer:
+    """在后台线程中运行的模拟 DeepSeek 服务"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: str = "lognormal",
+        latency_mean: float = 0.2,
+        latency_sigma: float = 0.5,
+        latency_per_1k_tokens: float = 0.0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        retry_after: Optional[float] = 1.0,
+        capacity: int = 0,
+        malformed_batch_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        """
+        初始化模拟服务
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0 表示随机分配
+            latency: 延迟分布
+            latency_mean: 平均延迟（秒）
+            latency_sigma: 延迟分布的形状参数
+            latency_per_1k_tokens: 每 1000 个提示词 token 的额外延迟
+            rate_429: 随机返回 429 的概率
+            rate_5xx: 随机返回 500/502/503 的概率
+            retry_after: 429 和 503 响应中 Retry-After 的秒数，为空时不带该头
+            capacity: 同时处理的请求上限，超出时返回 429，0 表示不限制
+            malformed_batch_rate: 批量请求返回无法解析内容的概率
+            seed: 随机种子，用于复现故障注入和延迟
+        """
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latency_model = LatencyModel(latency, latency_mean, latency_sigma,
+                                          latency_per_1k_tokens, self.rng)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.capacity = capacity
+        self.malformed_batch_rate = malformed_batch_rate
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._seen_prefixes = set()
+        self.reset_stats()
+
+    @property
+    def base_url(self) -> str:
+        """客户端使用的基础地址"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'MockDeepSeekServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"模拟 DeepSeek 服务已启动: {self.base_url}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.requests = 0
+            self.in_flight = 0
+            self.peak_in_flight = 0
+            self.status_counts: Dict[int, int] = {}
+            self.latencies: List[float] = []
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "status_counts": {str(code): count for code, count in sorted(self.status_counts.items())},
+                "latency": percentiles(self.latencies),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens
+            }
+
+    @staticmethod
+    def suggest_name(content: str) -> str:
+        """根据内容生成确定的文件名，相同内容总是得到相同结果"""
+        digest = hashlib.sha1(content.strip().encode("utf-8")).hexdigest()[:8]
+        return f"模拟文档_{digest}"
+
+    def _random(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def _sample_latency(self, prompt_tokens: int) -> float:
+        with self.rng_lock:
+            return self.latency_model.sample(prompt_tokens)
+
+    def _pick_fault(self) -> Optional[int]:
+        """按配置的概率决定是否注入错误"""
+        roll = self._random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_5xx:
+            with self.rng_lock:
+                return self.rng.choice((500, 502, 503))
+        return None
+
+    def _build_reply(self, messages: List[Dict[str, str]]) -> str:
+        """单文件请求返回一个文件名，批量请求返回 JSON 数组"""
+        user_content = messages[-1].get("content", "") if messages else ""
+        parts = _BATCH_SECTION_RE.split(user_content)
+        if len(parts) < 3:
+            return self.suggest_name(user_content)
+
+        if self._random() < self.malformed_batch_rate:
+            return "抱歉，我无法按要求的格式回复。"
+
+        # split 后依次为：前导文本、序号、内容、序号、内容……
+        names = [
+            {"id": int(file_id), "name": self.suggest_name(section)}
+            for file_id, section in zip(parts[1::2], parts[2::2])
+        ]
+        return json.dumps(names, ensure_ascii=False)
+
+    def _usage(self, messages: List[Dict[str, str]], reply: str) -> Dict[str, int]:
+        """估算 token 用量，系统提示词重复出现时计为命中上下文缓存"""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        hit_tokens = 0
+        if len(messages) > 1 and messages[0].get("role") == "system":
+            prefix = messages[0].get("content", "")
+            with self._stats_lock:
+                if prefix in self._seen_prefixes:
+                    hit_tokens = estimate_tokens(prefix)
+                else:
+                    self._seen_prefixes.add(prefix)
+        completion_tokens = estimate_tokens(reply)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - hit_tokens
+        }
+
+    def handle_completion(self, body: Dict[str, Any]):
+        """处理一次 /chat/completions 请求，返回 (状态码, 响应头, 响应体)"""
+        messages = body.get("messages") or []
+        with self._stats_lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            over_capacity = self.capacity and self.in_flight > self.capacity
+
+        started_at = time.monotonic()
+        try:
+            headers = {}
+            status = 429 if over_capacity else self._pick_fault()
+            if status is None:
+                reply = self._build_reply(messages)
+                usage = self._usage(messages, reply)
+                time.sleep(self._sample_latency(usage["prompt_tokens"]))
+                payload = {
+                    "id": f"mock-{self.requests}",
+                    "object": "chat.completion",
+                    "model": body.get("model", "deepseek-chat"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": usage
+                }
+                status = 200
+                with self._stats_lock:
+                    self.prompt_tokens += usage["prompt_tokens"]
+                    self.completion_tokens += usage["completion_tokens"]
+            else:
+                # 错误响应也要花一点时间，避免重试把本地 CPU 打满
+                time.sleep(min(self._sample_latency(0), 0.05))
+                if status in (429, 503) and self.retry_after is not None:
+                    headers["Retry-After"] = f"{self.retry_after:g}"
+                payload = {"error": {"message": f"mock error {status}", "type": "mock_error"}}
+            return status, headers, payload
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.status_counts[status] = self.status_counts.get(status, 0) + 1
+                self.latencies.append(time.monotonic() - started_at)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    self._send_json(200, server.get_stats())
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+
+                if self.path.rstrip("/").endswith("/reset"):
+                    server.reset_stats()
+                    self._send_json(200, {"message": "ok"})
+                    return
+
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                try:
+                    body = json.loads(raw.decode("utf-8"))
+                except (ValueError, UnicodeDecodeError):
+                    self._send_json(400, {"error": {"message": "invalid json"}})
+                    return
+
+                status, headers, payload = server.handle_completion(body)
+                self._send_json(status, payload, headers)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+def percentiles(values: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """计算延迟分位数（最近秩法），单位秒"""
+    if not values:
+        return {f"p{p}": 0.0 for p in points}
+    ordered = sorted(values)
+    result = {}
+    for p in points:
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        result[f"p{p}"] = round(ordered[rank - 1], 4)
+    result["max"] = round(ordered[-1], 4)
+    return result
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """模拟服务的命令行参数，压测脚本复用"""
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal", help="延迟分布")
+    parser.add_argument("--latency-mean", type=float, default=0.2, help="平均延迟（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="延迟分布的形状参数")
+    parser.add_argument("--latency-per-1k-tokens", type=float, default=0.0, help="每 1000 提示词 token 的额外延迟")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="随机返回 429 的概率")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="随机返回 5xx 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After 秒数，负数表示不返回该头")
+    parser.add_argument("--capacity", type=int, default=0, help="同时处理的请求上限，超出返回 429")
+    parser.add_argument("--malformed-batch-rate", type=float, default=0.0, help="批量请求返回错误格式的概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def server_from_args(args, host: str = "127.0.0.1", port: int = 0) -> MockDeepSeekServer:
+    return MockDeepSeekServer(
+        host=host,
+        port=port,
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_sigma=args.latency_sigma,
+        latency_per_1k_tokens=args.latency_per_1k_tokens,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        retry_after=args.retry_after if args.retry_after >= 0 else None,
+        capacity=args.capacity,
+        malformed_batch_rate=args.malformed_batch_rate,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 DeepSeek 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = server_from_args(args, args.host, args.port)
+    print(f"🧪 模拟服务地址: {server.base_url}/chat/completions")
+    print(f"📊 统计信息: {server.base_url}/stats")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 模拟服务已退出")
+    finally:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import hashlib
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# SimHash 指纹位数
+FINGERPRINT_BITS = 64
+
+# 参与近似去重的最短文本长度，太短的文本改动一两个字指纹就差很多，也容易误判
+MIN_TEXT_LENGTH = 200
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 日期：2024-03-15、2024年3月15日、2024.03、20240315、202403
+_DATE_RE = re.compile(
+    r'(?<!\d)((?:19|20)\d{2})[-_./年](0?[1-9]|1[0-2])(?:[-_./月](0?[1-9]|[12]\d|3[01])日?|月)?(?!\d)'
+    r'|(?<!\d)((?:19|20)\d{2})(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])?(?!\d)'
+)
+
+# 版本：v2、V1.3、ver 2、version 3、第2版、终稿、final 等
+_VERSION_RE = re.compile(
+    r'(?<![a-z])v(?:er(?:sion)?)?[ ._-]?(\d+(?:\.\d+)*)(?![\d.])'
+    r'|第\s*(\d+)\s*版'
+    r'|(终稿|定稿|初稿|草稿|修订稿|final|draft)',
+    re.IGNORECASE
+)
+
+
+def _shingles(text: str, size: int) -> Counter:
+    """把文本切成相邻 size 个字符的片段，中文没有空格分词，按字符切比按词切更稳定"""
+    normalized = _WHITESPACE_RE.sub(' ', text.lower()).strip()
+    if len(normalized) <= size:
+        return Counter([normalized])
+    return Counter(normalized[i:i + size] for i in range(len(normalized) - size + 1))
+
+
+# 计算 SimHash 时把 64 位摊开到各自的计数字段里，用一次大整数加法同时累加所有位
+_FIELD_BITS = 32
+_FIELD_MASK = (1 << _FIELD_BITS) - 1
+_SPREAD_BYTE = [
+    sum(1 << (bit * _FIELD_BITS) for bit in range(8) if value >> bit & 1)
+    for value in range(256)
+]
+
+
+def _spread(value: int) -> int:
+    spread = 0
+    for byte_index in range(FINGERPRINT_BITS // 8):
+        spread |= _SPREAD_BYTE[value >> (byte_index * 8) & 0xFF] << (byte_index * 8 * _FIELD_BITS)
+    return spread
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """计算文本的 64 位 SimHash，内容越相近，指纹不同的位数越少"""
+    # 每一位统计带权的 1 的个数，超过总权重一半的位取 1
+    bit_counts = 0
+    total = 0
+    for shingle, count in _shingles(text, shingle_size).items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        bit_counts += _spread(value) * count
+        total += count
+    
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        if (bit_counts >> (bit * _FIELD_BITS) & _FIELD_MASK) * 2 > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex:
+    """按分段（LSH banding）索引 SimHash 指纹，快速找出汉明距离不超过阈值的指纹
+    
+    指纹分成 max_distance + 1 段，两个指纹最多相差 max_distance 位时至少有一段完全相同，
+    只需和这些段相同的候选逐个比较，不必两两比较全部文件。
+    """
+    
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self._buckets: List[Dict[int, List[Tuple[Any, int]]]] = [{} for _ in range(self.bands)]
+    
+    def _band_values(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            # 最后一段包含除不尽的剩余位
+            if band == self.bands - 1:
+                yield band, fingerprint >> (band * self.band_bits)
+            else:
+                yield band, (fingerprint >> (band * self.band_bits)) & mask
+    
+    def add(self, key: Any, fingerprint: int) -> None:
+        for band, value in self._band_values(fingerprint):
+            self._buckets[band].setdefault(value, []).append((key, fingerprint))
+    
+    def find(self, fingerprint: int) -> Optional[Tuple[Any, int]]:
+        """返回距离最近且不超过阈值的 (key, 距离)，没有时返回 None"""
+        best = None
+        for band, value in self._band_values(fingerprint):
+            for key, candidate in self._buckets[band].get(value, ()):
+                distance = hamming_distance(fingerprint, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (key, distance)
+        return best
+    
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._buckets[0].values())
+
+
+def distinguishing_tokens(text: str) -> List[str]:
+    """提取文本中的日期和版本标记，统一成 20240315 / 202403 / v2 / 终稿 这样的形式"""
+    tokens = []
+    for match in _DATE_RE.finditer(text):
+        if match.group(1):
+            year, month, day = match.group(1), match.group(2), match.group(3)
+        else:
+            year, month, day = match.group(4), match.group(5), match.group(6)
+        token = f"{year}{int(month):02d}" + (f"{int(day):02d}" if day else '')
+        if token not in tokens:
+            tokens.append(token)
+    for match in _VERSION_RE.finditer(text):
+        if match.group(1):
+            token = f"v{match.group(1)}"
+        elif match.group(2):
+            token = f"v{match.group(2)}"
+        else:
+            token = match.group(3).lower()
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def pick_differentiator(tokens: Dict[str, List[str]], reference: Dict[str, List[str]]) -> Optional[str]:
+    """找出一个文件有、而相似文件没有的日期或版本标记，用来区分两者的名称
+    
+    Args:
+        tokens: 来源名称 -> 该文件的标记，按优先级排列，如先看文件名再看内容
+        reference: 相似文件对应来源的标记
+    
+    Returns:
+        第一个相似文件中没有的标记，找不到时返回 None
+    """
+    for source, source_tokens in tokens.items():
+        seen = set(reference.get(source, ()))
+        for token in source_tokens:
+            if token not in seen:
+                return token
+    return None
@@ -0,0 +1,288 @@
+import posixpath
+import re
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+from xml.etree.ElementTree import iterparse
+
+# Office Open XML（.xlsx/.docx/.pptx）本质上是 zip 包里的若干 XML 文件，
+# 这里直接用 zipfile + iterparse 流式读取需要的部分，不构建完整的对象模型
+
+NS_SPREADSHEET = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_OFFICE_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+REL_OFFICE_DOCUMENT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+NS_WORD = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+NS_DRAWING = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+# Excel 内置的日期时间数字格式编号
+_BUILTIN_DATE_FORMATS = set(range(14, 23)) | {27, 30, 36, 45, 46, 47, 50, 57}
+
+# 去掉引号内文本、转义字符和颜色/条件段后，格式里出现 y/m/d/h/s 即视为日期格式
+_FORMAT_NOISE_RE = re.compile(r'"[^"]*"|\\.|\[[^\]]*\]')
+_DATE_TOKEN_RE = re.compile(r'[ymdhs]', re.IGNORECASE)
+
+_SLIDE_NAME_RE = re.compile(r'^ppt/slides/slide(\d+)\.xml$')
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _iter_elements(zf: zipfile.ZipFile, name: str, tags: Set[str]):
+    """流式遍历包内 XML 中指定名称的元素，调用方提前退出时立即停止解析"""
+    with zf.open(name) as f:
+        for _, elem in iterparse(f, events=('end',)):
+            if _local_name(elem.tag) in tags:
+                yield elem
+
+
+def _read_relationships(zf: zipfile.ZipFile, rels_path: str) -> Dict[str, str]:
+    """读取关系文件，返回 关系ID -> 包内路径"""
+    if rels_path not in zf.namelist():
+        return {}
+    base_dir = posixpath.dirname(posixpath.dirname(rels_path))
+    relationships = {}
+    for elem in _iter_elements(zf, rels_path, {'Relationship'}):
+        target = elem.get('Target', '')
+        if elem.get('TargetMode') == 'External':
+            continue
+        if target.startswith('/'):
+            path = target.lstrip('/')
+        else:
+            path = posixpath.normpath(posixpath.join(base_dir, target))
+        relationships[elem.get('Id')] = path
+    return relationships
+
+
+def _is_date_format(format_id: int, format_code: Optional[str]) -> bool:
+    if format_id in _BUILTIN_DATE_FORMATS:
+        return True
+    if not format_code:
+        return False
+    return bool(_DATE_TOKEN_RE.search(_FORMAT_NOISE_RE.sub('', format_code)))
+
+
+def _read_date_styles(zf: zipfile.ZipFile) -> Set[int]:
+    """返回使用日期格式的单元格样式序号"""
+    if 'xl/styles.xml' not in zf.namelist():
+        return set()
+
+    format_codes = {}
+    date_styles = set()
+    xf_index = 0
+    in_cell_xfs = False
+    with zf.open('xl/styles.xml') as f:
+        for event, elem in iterparse(f, events=('start', 'end')):
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if name == 'cellXfs':
+                    in_cell_xfs = True
+                continue
+            if name == 'numFmt':
+                format_codes[int(elem.get('numFmtId', 0))] = elem.get('formatCode')
+            elif name == 'xf' and in_cell_xfs:
+                format_id = int(elem.get('numFmtId', 0))
+                if _is_date_format(format_id, format_codes.get(format_id)):
+                    date_styles.add(xf_index)
+                xf_index += 1
+            elif name == 'cellXfs':
+                break
+    return date_styles
+
+
+def _excel_date(value: float, date1904: bool) -> str:
+    epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+    moment = epoch + timedelta(days=value)
+    if moment.hour or moment.minute or moment.second:
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+    return moment.strftime('%Y-%m-%d')
+
+
+def _read_shared_strings(zf: zipfile.ZipFile, needed: Set[int]) -> Dict[int, str]:
+    """只取出需要的共享字符串，读到最大的所需序号后立即停止"""
+    if not needed or 'xl/sharedStrings.xml' not in zf.namelist():
+        return {}
+
+    last_needed = max(needed)
+    strings = {}
+    index = 0
+    for elem in _iter_elements(zf, 'xl/sharedStrings.xml', {'si'}):
+        if index in needed:
+            # 富文本由多个 <r><t> 组成，拼音注音 <rPh> 不计入
+            parts = []
+            for child in elem:
+                name = _local_name(child.tag)
+                if name == 't':
+                    parts.append(child.text or '')
+                elif name == 'r':
+                    text = child.find(f'{{{NS_SPREADSHEET}}}t')
+                    if text is not None:
+                        parts.append(text.text or '')
+            strings[index] = ''.join(parts)
+        elem.clear()
+        if index >= last_needed:
+            break
+        index += 1
+    return strings
+
+
+def _read_sheet_rows(zf: zipfile.ZipFile, path: str, max_rows: int, date_styles: Set[int],
+                     date1904: bool, needed_strings: Set[int]) -> List[List[Any]]:
+    """读取工作表前 max_rows 行，共享字符串先记为 ('s', 序号)，稍后统一替换"""
+    rows = []
+    for row in _iter_elements(zf, path, {'row'}):
+        values = []
+        for cell in row:
+            if _local_name(cell.tag) != 'c':
+                continue
+            cell_type = cell.get('t', 'n')
+            value_elem = cell.find(f'{{{NS_SPREADSHEET}}}v')
+            raw = value_elem.text if value_elem is not None else None
+
+            if cell_type == 's' and raw is not None:
+                index = int(raw)
+                needed_strings.add(index)
+                values.append(('s', index))
+            elif cell_type == 'inlineStr':
+                values.append(''.join(t.text or '' for t in cell.iter(f'{{{NS_SPREADSHEET}}}t')))
+            elif cell_type == 'b' and raw is not None:
+                values.append(raw == '1')
+            elif cell_type in ('str', 'd') and raw is not None:
+                values.append(raw)
+            elif cell_type == 'n' and raw is not None:
+                number = float(raw)
+                if int(cell.get('s', 0)) in date_styles:
+                    values.append(_excel_date(number, date1904))
+                else:
+                    values.append(number)
+        row.clear()
+        rows.append(values)
+        if len(rows) >= max_rows:
+            break
+    return rows
+
+
+def read_xlsx(file_path: Path, max_sheets: int, max_rows: int) -> List[Tuple[str, List[List[Any]]]]:
+    """流式读取 .xlsx 前几个工作表的前若干行
+
+    只解析需要的行，共享字符串表也只读到所需的最大序号为止，
+    内存占用只与读取的行数有关，与工作簿大小无关。
+
+    Returns:
+        [(工作表名, 行列表), ...]，单元格为字符串、数字、布尔值或日期字符串
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        relationships = _read_relationships(zf, 'xl/_rels/workbook.xml.rels')
+        sheets = []
+        date1904 = False
+        for elem in _iter_elements(zf, 'xl/workbook.xml', {'sheet', 'workbookPr'}):
+            if _local_name(elem.tag) == 'workbookPr':
+                date1904 = elem.get('date1904') in ('1', 'true')
+                continue
+            if elem.get('state') in ('hidden', 'veryHidden'):
+                continue
+            path = relationships.get(elem.get(f'{{{NS_OFFICE_REL}}}id'))
+            if path:
+                sheets.append((elem.get('name', ''), path))
+            if len(sheets) >= max_sheets:
+                break
+
+        date_styles = _read_date_styles(zf)
+        needed_strings: Set[int] = set()
+        sheet_rows = [
+            (name, _read_sheet_rows(zf, path, max_rows, date_styles, date1904, needed_strings))
+            for name, path in sheets
+        ]
+
+        shared_strings = _read_shared_strings(zf, needed_strings)
+        return [
+            (name, [
+                [shared_strings.get(value[1], '') if isinstance(value, tuple) else value for value in row]
+                for row in rows
+            ])
+            for name, rows in sheet_rows
+        ]
+
+
+
+def _main_part(zf: zipfile.ZipFile, default: str) -> str:
+    """从包关系中找到主文档部件，找不到时使用约定的默认路径"""
+    if '_rels/.rels' not in zf.namelist():
+        return default
+    for elem in _iter_elements(zf, '_rels/.rels', {'Relationship'}):
+        if elem.get('Type') == REL_OFFICE_DOCUMENT:
+            return elem.get('Target', default).lstrip('/')
+    return default
+
+
+def iter_docx_paragraphs(file_path: Path):
+    """流式读取 .docx 正文（含表格）中的段落文本
+
+    调用方拿够内容后停止迭代即可，后面的 XML 不会被解压和解析。
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        part = _main_part(zf, 'word/document.xml')
+        text_tag = f'{{{NS_WORD}}}t'
+        with zf.open(part) as f:
+            for _, elem in iterparse(f, events=('end',)):
+                name = _local_name(elem.tag)
+                if name == 'p':
+                    parts = []
+                    for node in elem.iter():
+                        node_name = _local_name(node.tag)
+                        if node.tag == text_tag:
+                            parts.append(node.text or '')
+                        elif node_name == 'tab':
+                            parts.append('\t')
+                        elif node_name in ('br', 'cr'):
+                            parts.append('\n')
+                    # 文本框中的段落嵌套在外层段落里，先结束的内层段落清空后不会重复计入
+                    elem.clear()
+                    text = ''.join(parts).strip()
+                    if text:
+                        yield text
+
+
+def _slide_parts(zf: zipfile.ZipFile) -> List[str]:
+    """按演示文稿中的放映顺序返回幻灯片部件路径"""
+    names = set(zf.namelist())
+    relationships = _read_relationships(zf, 'ppt/_rels/presentation.xml.rels')
+    ordered = []
+    if 'ppt/presentation.xml' in names:
+        for elem in _iter_elements(zf, 'ppt/presentation.xml', {'sldId', 'sldIdLst'}):
+            if _local_name(elem.tag) == 'sldIdLst':
+                break
+            path = relationships.get(elem.get(f'{{{NS_OFFICE_REL}}}id'))
+            if path in names:
+                ordered.append(path)
+    if ordered:
+        return ordered
+
+    # 缺少放映顺序时按文件名中的编号排序（slide10 排在 slide9 之后）
+    numbered = [(int(match.group(1)), name) for name in names for match in [_SLIDE_NAME_RE.match(name)] if match]
+    return [name for _, name in sorted(numbered)]
+
+
+def iter_pptx_slides(file_path: Path, max_slides: int):
+    """流式读取 .pptx 前几张幻灯片，逐张返回 (序号, 各形状的文本列表)
+
+    只解压幻灯片 XML，图片、视频等媒体部件不会被读取。
+    """
+    with zipfile.ZipFile(file_path) as zf:
+        text_tag = f'{{{NS_DRAWING}}}t'
+        for number, part in enumerate(_slide_parts(zf)[:max_slides], start=1):
+            shapes = []
+            paragraphs = []
+            with zf.open(part) as f:
+                for _, elem in iterparse(f, events=('end',)):
+                    name = _local_name(elem.tag)
+                    if name == 'p' and elem.tag.startswith(f'{{{NS_DRAWING}}}'):
+                        paragraphs.append(''.join(t.text or '' for t in elem.iter(text_tag)))
+                        elem.clear()
+                    elif name in ('sp', 'graphicFrame'):
+                        text = '\n'.join(paragraphs).strip()
+                        if text:
+                            shapes.append(text)
+                        paragraphs = []
+            yield number, shapes
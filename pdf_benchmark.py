@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF 后端微基准
+
+用已安装的每个 PDF 后端提取同一批 PDF 的文字层（与正式提取相同的内容预算），
+报告每个文件的耗时中位数、读出的字符数和失败/乱码数，并给出推荐的 pdf_backend。
+file_extractor_final.FAST_PDF_BACKENDS 是固定的默认顺序，本脚本只验证实测顺序是否与之一致，
+不一致时按推荐结果在 config.json 中设置 pdf_backend。
+
+用法:
+    python pdf_benchmark.py                      # 使用自动生成的示例 PDF
+    python pdf_benchmark.py ~/Documents/pdfs --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from file_extractor_final import (
+    FAST_PDF_BACKENDS, FileContentExtractor, available_pdf_backends, _lazy_import, _looks_garbled
+)
+
+_BACKEND_MODULES = {
+    'pypdfium2': 'pypdfium2',
+    'pymupdf': 'fitz',
+    'pypdf2': 'PyPDF2',
+    'pdfplumber': 'pdfplumber',
+}
+
+
+def write_sample_pdf(path: Path, pages: int = 20, lines_per_page: int = 45) -> Path:
+    """生成只含 ASCII 文字层的多页 PDF，不依赖任何 PDF 写入库"""
+    objects = []
+    
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+    
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    # 每页占两个对象（内容流和页面），页面树紧随其后
+    pages_id = len(objects) + 2 * pages + 1
+    page_ids = []
+    for page in range(pages):
+        lines = b" ".join(
+            b"(Page %d line %d quarterly revenue analysis body text) '" % (page, line)
+            for line in range(lines_per_page)
+        )
+        stream = b"BT /F1 12 Tf 50 750 Td 14 TL " + lines + b" ET"
+        content_id = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        ))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), pages))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    path.write_bytes(bytes(output))
+    return path
+
+
+def collect_pdfs(paths: List[str]) -> List[Path]:
+    files = []
+    for name in paths:
+        path = Path(name).expanduser()
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() == '.pdf'))
+        elif path.suffix.lower() == '.pdf':
+            files.append(path)
+    return files
+
+
+def benchmark_backend(backend: str, files: List[Path], repeat: int) -> Dict[str, Any]:
+    """用单个后端提取全部文件，不做后端升级，只测文字层本身"""
+    extractor = FileContentExtractor(pdf_backend=backend)
+    started_at = time.perf_counter()
+    _lazy_import(_BACKEND_MODULES[backend])
+    import_seconds = time.perf_counter() - started_at
+    
+    timings = []
+    chars = 0
+    failures = 0
+    garbled = 0
+    for path in files:
+        samples = []
+        text = None
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            try:
+                text = extractor._consume(extractor._pdf_page_chunks(path, backend))
+            except Exception:
+                text = None
+                break
+            samples.append(time.perf_counter() - started_at)
+        if text is None:
+            failures += 1
+            continue
+        timings.append(statistics.median(samples))
+        chars += len(text)
+        garbled += _looks_garbled(text)
+    
+    return {
+        'backend': backend,
+        'import_ms': round(import_seconds * 1000, 1),
+        'median_ms': round(statistics.median(timings) * 1000, 2) if timings else None,
+        'total_ms': round(sum(timings) * 1000, 1),
+        'chars': chars,
+        'failures': failures,
+        'garbled': garbled
+    }
+
+
+def recommend(results: List[Dict[str, Any]]) -> str:
+    """失败和乱码最少的后端中选总耗时最短的"""
+    usable = [r for r in results if r['median_ms'] is not None]
+    if not usable:
+        return "auto"
+    return min(usable, key=lambda r: (r['failures'] + r['garbled'], r['total_ms']))['backend']
+
+
+def measured_fast_order(results: List[Dict[str, Any]]) -> List[str]:
+    """按实测总耗时排列已安装的文字层后端，用于和默认顺序比较"""
+    fast = [r for r in results if r['backend'] in FAST_PDF_BACKENDS and r['median_ms'] is not None]
+    return [r['backend'] for r in sorted(fast, key=lambda r: (r['failures'] + r['garbled'], r['total_ms']))]
+
+
+def default_fast_order(results: List[Dict[str, Any]]) -> List[str]:
+    installed = {r['backend'] for r in results if r['median_ms'] is not None}
+    return [name for name in FAST_PDF_BACKENDS if name in installed]
+
+
+def print_report(results: List[Dict[str, Any]], file_count: int, best: str) -> None:
+    print("=" * 72)
+    print(f"PDF 后端微基准：{file_count} 个文件")
+    print(f"{'后端':<12}{'导入(ms)':>10}{'中位数(ms)':>12}{'合计(ms)':>12}{'字符数':>10}{'失败':>6}{'乱码':>6}")
+    for r in results:
+        median = f"{r['median_ms']:.2f}" if r['median_ms'] is not None else "-"
+        print(f"{r['backend']:<12}{r['import_ms']:>10}{median:>12}{r['total_ms']:>12}"
+              f"{r['chars']:>10}{r['failures']:>6}{r['garbled']:>6}")
+    measured = measured_fast_order(results)
+    default = default_fast_order(results)
+    if measured == default:
+        print(f"实测顺序与默认顺序一致: {' > '.join(measured)}")
+    else:
+        print(f"实测顺序 {' > '.join(measured)} 与默认顺序 {' > '.join(default)} 不同")
+    print(f"推荐: 在 config.json 的 file_processing 中设置 \"pdf_backend\": \"{best}\"")
+    print("=" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各 PDF 后端提取文字层的速度")
+    parser.add_argument('paths', nargs='*', help="PDF 文件或目录，不指定时使用生成的示例 PDF")
+    parser.add_argument('--repeat', type=int, default=3, help="每个文件重复提取的次数，取中位数")
+    parser.add_argument('--pages', type=int, default=20, help="示例 PDF 的页数")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出结果")
+    args = parser.parse_args()
+    
+    backends = available_pdf_backends()
+    if not backends:
+        parser.error("没有安装任何 PDF 处理库")
+    
+    with tempfile.TemporaryDirectory(prefix="pdf_benchmark_") as work_dir:
+        files = collect_pdfs(args.paths) if args.paths else [
+            write_sample_pdf(Path(work_dir) / "sample.pdf", pages=args.pages)
+        ]
+        if not files:
+            parser.error("没有找到 PDF 文件")
+        
+        results = [benchmark_backend(backend, files, max(1, args.repeat)) for backend in backends]
+    
+    best = recommend(results)
+    if args.json:
+        measured = measured_fast_order(results)
+        print(json.dumps({'files': len(files), 'results': results, 'recommended': best,
+                          'measured_order': measured,
+                          'default_order_confirmed': measured == default_fast_order(results)},
+                         ensure_ascii=False, indent=2))
+    else:
+        print_report(results, len(files), best)
+
+
+if __name__ == '__main__':
+    main()
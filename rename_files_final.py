@@ -4,14 +4,30 @@ import shutil
 import asyncio
 import sys
 import json
+import time
+import hashlib
+import threading
 from collections import Counter
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Optional, Union
+from typing import Any, Dict, List, Set, Tuple, Optional, Union
 import logging
 
 from deepseek_client_final import DeepSeekClient
 from file_extractor_final import FileContentExtractor
+from suggestion_cache_final import SuggestionCache
+from rename_plan_final import RenamePlan
+from concurrency_final import AdaptiveConcurrencyLimiter
+from retry_final import RetryPolicy, RetryBudget
+from excerpt_final import estimate_tokens
+from usage_final import UsageStats
+from extraction_pool_final import ExtractionPool
+from extraction_cache_final import ExtractionCache
+from dedupe_final import find_duplicate_groups
+from near_dedupe_final import SimHashIndex, distinguishing_tokens, pick_differentiator
+from fs_walk_final import iter_listing_files, walk_listings
+from exclude_matcher_final import ExcludeMatcher
+from snapshot_index_final import SnapshotIndex, processed_key
 
 logging.basicConfig(
     level=logging.INFO,
@@ -37,7 +53,30 @@ class DeepSeekFileRenamer:
         custom_suffix: str = "",
         max_filename_length: int = 100,
         backup_enabled: bool = True,
-        exclude_patterns: List[str] = None
+        exclude_patterns: List[str] = None,
+        api_config: Dict[str, Any] = None,
+        suggestion_cache: Optional[SuggestionCache] = None,
+        bypass_cache: bool = False,
+        batch_size: int = 8,
+        batch_max_tokens: int = 400,
+        max_concurrent: int = 3,
+        max_concurrent_limit: int = 16,
+        adaptive_concurrency: bool = True,
+        pricing: Dict[str, Any] = None,
+        extraction_workers: int = 0,
+        extraction_queue_size: int = 64,
+        extraction_timeout: float = 60.0,
+        extraction_memory_limit_mb: int = 1024,
+        extraction_max_tasks_per_worker: int = 200,
+        pdf_backend: str = "auto",
+        extraction_cache: Optional[ExtractionCache] = None,
+        dedupe_enabled: bool = True,
+        near_dedupe_enabled: bool = True,
+        near_duplicate_distance: int = 3,
+        scan_workers: int = 0,
+        snapshot_index: Optional[SnapshotIndex] = None,
+        only_changed: bool = False,
+        scan_verify_files: bool = True
     ):
         """
         初始化文件重命名器
@@ -52,7 +91,32 @@ class DeepSeekFileRenamer:
             custom_suffix: 自定义后缀
             max_filename_length: 最大文件名长度
             backup_enabled: 是否启用备份
-            exclude_patterns: 排除的文件模式
+            exclude_patterns: 排除模式，同时作用于文件名和目录名；支持 're:'（正则）和 'glob:'（通配符）前缀，
+                              无前缀时含 * ? [ 的按通配符处理
+            api_config: DeepSeek 客户端配置（base_url、timeout、default_model、max_retries 等）
+            suggestion_cache: 文件名建议缓存
+            bypass_cache: 是否跳过缓存查询，强制重新调用 API
+            batch_size: 多文件打包请求的文件数，1 表示逐个请求
+            batch_max_tokens: 估算 token 数不超过该值的文件才参与打包
+            max_concurrent: 初始的同时在途 API 请求数
+            max_concurrent_limit: 自适应并发的上限
+            adaptive_concurrency: 是否按延迟和限流情况自动调整并发数
+            pricing: token 单价配置，用于估算费用
+            extraction_workers: 内容提取进程数，0 表示使用 CPU 核数
+            extraction_queue_size: 已提取、等待分析的文件数上限，超出时暂停提取
+            extraction_timeout: 单个文件的提取超时（秒），超时的文件被跳过
+            extraction_memory_limit_mb: 提取进程的内存上限（MB），0 表示不限制
+            extraction_max_tasks_per_worker: 提取进程处理多少个文件后重启
+            pdf_backend: PDF 文字层后端，'auto' 表示使用已安装的最快后端
+            extraction_cache: 文件内容提取缓存，文件未变化（包括只是改名）时跳过解析
+            dedupe_enabled: 是否识别内容完全相同的文件，每组只分析一个
+            near_dedupe_enabled: 是否识别内容近似的文件（同一模板的月报、多个版本的草稿），每组只分析一个
+            near_duplicate_distance: SimHash 指纹最多相差多少位视为近似重复
+            scan_workers: 并行列目录的线程数，0 表示单线程，目录位于网络存储时可适当调大
+            snapshot_index: 目录快照，再次扫描时只重新列出有变化的目录，并记录每个文件的处理状态
+            only_changed: 是否只处理上次运行以来新增或修改的文件（需要目录快照）
+            scan_verify_files: 复用快照中的目录列表时是否仍逐个 stat 文件以发现原地修改，
+                               关闭后只重新列出修改时间变化的目录，适合只增不改的归档目录
         """
         self.api_key = api_key
         self.base_dir = Path(base_dir) if base_dir else None
@@ -64,24 +128,77 @@ class DeepSeekFileRenamer:
         self.max_filename_length = max_filename_length
         self.backup_enabled = backup_enabled
         self.exclude_patterns = exclude_patterns or []
+        self.api_config = api_config or {}
+        self.suggestion_cache = suggestion_cache
+        self.bypass_cache = bypass_cache
+        self.batch_size = batch_size
+        self.batch_max_tokens = batch_max_tokens
+        self.pricing = pricing or {}
+        self.extraction_queue_size = max(1, extraction_queue_size)
+        self.extraction_cache = extraction_cache
+        self.dedupe_enabled = dedupe_enabled
+        self.near_dedupe_enabled = near_dedupe_enabled
+        self.near_duplicate_distance = near_duplicate_distance
+        self.scan_workers = scan_workers
+        self.snapshot_index = snapshot_index
+        self.only_changed = only_changed
+        self.scan_verify_files = scan_verify_files
         
         # 初始化组件
         self.deepseek_client = None
-        self.content_extractor = FileContentExtractor()
+        self.content_extractor = FileContentExtractor(pdf_backend=pdf_backend)
+        self.extraction_pool = ExtractionPool(
+            extraction_workers,
+            timeout=extraction_timeout,
+            memory_limit_mb=extraction_memory_limit_mb,
+            max_tasks_per_worker=extraction_max_tasks_per_worker,
+            extractor_options={'pdf_backend': pdf_backend}
+        )
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=max_concurrent,
+            max_limit=max_concurrent_limit,
+            adaptive=adaptive_concurrency
+        )
         
         # 运行时状态
         self.backup_dir = None
         self.operation_log = []
         self.processed_files = []
+        self.last_run_usage = None
+        self.last_scan_stats = None
+        # 网页操作和监视模式共用同一个 API 客户端，同一时间只允许一个批次分析或重命名
+        self.run_lock = threading.Lock()
+        self.session_usage = UsageStats(self.pricing)
         
         if api_key:
-            self.deepseek_client = DeepSeekClient(api_key)
+            self.deepseek_client = self._create_client(api_key)
+    
+    def _create_client(self, api_key: str) -> DeepSeekClient:
+        """按配置创建 DeepSeek 客户端"""
+        return DeepSeekClient(
+            api_key,
+            base_url=self.api_config.get('base_url', "https://api.deepseek.com/v1"),
+            timeout=self.api_config.get('timeout', 30),
+            model=self.api_config.get('default_model', "deepseek-chat"),
+            max_connections=self.concurrency_limiter.max_limit,
+            cache=self.suggestion_cache,
+            retry_policy=RetryPolicy(
+                max_retries=self.api_config.get('max_retries', 3),
+                base_delay=self.api_config.get('retry_base_delay', 1.0),
+                max_delay=self.api_config.get('retry_max_delay', 30.0),
+                deadline=self.api_config.get('request_deadline', 120.0)
+            ),
+            excerpt_token_budget=self.api_config.get('excerpt_token_budget', 600),
+            batch_excerpt_token_budget=self.api_config.get('batch_excerpt_token_budget', 250)
+        )
     
     def set_api_key(self, api_key: str) -> bool:
         """设置 API 密钥并测试连接"""
         try:
             self.api_key = api_key
-            self.deepseek_client = DeepSeekClient(api_key)
+            if self.deepseek_client:
+                self.deepseek_client.close()
+            self.deepseek_client = self._create_client(api_key)
             return self.deepseek_client.test_connection()
         except Exception as e:
             logger.error(f"设置 API 密钥失败: {str(e)}")
@@ -134,50 +251,163 @@ class DeepSeekFileRenamer:
             logger.error(f"备份文件失败 {file_path}: {str(e)}")
             return False
     
+    @property
+    def exclude_patterns(self) -> List[str]:
+        return self._exclude_patterns
+    
+    @exclude_patterns.setter
+    def exclude_patterns(self, patterns: List[str]) -> None:
+        # 规则只在修改时编译一次，扫描时每个文件名只做一次集合查找和一次正则匹配
+        self._exclude_patterns = list(patterns or [])
+        self.exclude_matcher = ExcludeMatcher(self._exclude_patterns)
+    
     def is_excluded_file(self, file_path: Path) -> bool:
-        """检查文件是否在排除列表中"""
-        file_name = file_path.name.lower()
-        
-        for pattern in self.exclude_patterns:
-            if re.search(pattern.lower(), file_name):
-                return True
-        
-        # 默认排除的文件类型
-        excluded_extensions = {'.exe', '.dll', '.so', '.dylib', '.bin', '.zip', '.rar', '.7z'}
-        if file_path.suffix.lower() in excluded_extensions:
-            return True
-        
-        return False
+        """检查文件是否在排除列表中（包括本工具生成的重命名日志）"""
+        return self.exclude_matcher.matches_file(file_path.name)
+    
+    def _should_prune_dir(self, entry: os.DirEntry) -> bool:
+        """扫描时是否跳过整个子目录：命中排除模式的目录和本工具生成的备份目录"""
+        return self.exclude_matcher.matches_dir(entry.name)
+    
+    def _should_include_entry(self, entry: os.DirEntry) -> bool:
+        """只按文件名筛选，不符合条件的文件不需要 stat"""
+        # 先用扩展名排除大多数文件
+        if os.path.splitext(entry.name)[1].lower() not in self.content_extractor.SUPPORTED_EXTENSIONS:
+            return False
+        return not self.exclude_matcher.matches_file(entry.name)
+    
+    def _scan_signature(self) -> str:
+        """扫描条件的摘要，排除规则或支持的文件类型变化后不能复用快照中的文件列表"""
+        conditions = [sorted(self.content_extractor.SUPPORTED_EXTENSIONS), self.exclude_matcher.signature]
+        return hashlib.sha256(json.dumps(conditions, ensure_ascii=False).encode('utf-8')).hexdigest()
     
     def scan_directory(self) -> List[Dict[str, Any]]:
-        """扫描目录并返回可处理的文件列表"""
+        """扫描目录并返回可处理的文件列表
+        
+        用 os.scandir 单次遍历目录树，文件类型来自目录项本身，每个文件最多 stat 一次；
+        启用目录快照时，修改时间未变的目录直接复用上次的列表。
+        结果按路径排序，同一目录两次扫描的顺序一致。
+        """
         if not self.base_dir or not self.base_dir.exists():
             return []
         
+        started = time.monotonic()
+        snapshot_enabled = bool(self.snapshot_index and self.snapshot_index.enabled)
+        signature = self._scan_signature() if snapshot_enabled else ''
+        previous = self.snapshot_index.load(self.base_dir, signature) if snapshot_enabled else {}
+        
+        listings = walk_listings(
+            self.base_dir,
+            prune_dir=self._should_prune_dir,
+            include_file=self._should_include_entry,
+            workers=self.scan_workers,
+            previous=previous,
+            verify_files=self.scan_verify_files
+        )
+        
+        states = {}
+        if snapshot_enabled:
+            self.snapshot_index.save(
+                self.base_dir, signature, listings, previous,
+                type_of=lambda name: self.content_extractor.get_file_type(Path(name))
+            )
+            states = self.snapshot_index.file_states(self.base_dir)
+        
         files_info = []
         
-        for file_path in self.base_dir.rglob('*'):
-            if not file_path.is_file():
+        for file_path, stat_result in iter_listing_files(self.base_dir, listings):
+            files_info.append(self.build_file_info(file_path, stat_result, states))
+        
+        reused = sum(1 for rel_dir, listing in listings.items() if previous.get(rel_dir) is listing)
+        self.last_scan_stats = {
+            'directories': len(listings),
+            'reused_directories': reused,
+            'listed_directories': len(listings) - reused,
+            'files': len(files_info),
+            'changed_files': sum(1 for file_info in files_info if file_info['changed']),
+            'snapshot': snapshot_enabled,
+            'elapsed': time.monotonic() - started
+        }
+        logger.info(f"扫描完成：{len(listings)} 个目录中重新列出 {len(listings) - reused} 个，"
+                    f"共 {len(files_info)} 个文件，其中新增或修改 {self.last_scan_stats['changed_files']} 个")
+        
+        return files_info
+    
+    def build_file_info(self, file_path: Path, stat_result: Any,
+                        states: Optional[Dict[str, Tuple[Optional[str], str]]] = None) -> Dict[str, Any]:
+        """按路径和 stat 结果生成与 scan_directory 相同格式的文件信息"""
+        relative_path = file_path.relative_to(self.base_dir)
+        last_suggestion, last_key = (states or {}).get(str(relative_path), (None, None))
+        return {
+            'path': file_path,
+            'name': file_path.name,
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'inode': stat_result.st_ino,
+            'type': self.content_extractor.get_file_type(file_path),
+            'extension': file_path.suffix,
+            'relative_path': relative_path,
+            # 上次运行以来新增或修改（没有快照时全部视为新增）
+            'changed': last_key != processed_key(stat_result.st_size, stat_result.st_mtime_ns),
+            'last_suggestion': last_suggestion
+        }
+    
+    def _remember_processed(self, files_info: List[Dict[str, Any]], analysis_results: List[Dict[str, Any]],
+                            processed: bool = True) -> None:
+        """把分析成功或确定跳过的文件记入快照，API 失败的文件下次仍会被当作未处理
+        
+        processed 为 False（预览）时只记录文件名建议，不消耗文件“新增或修改”的状态，
+        预览后按计划执行时再由 apply_plan 记为已处理。
+        """
+        if not self.snapshot_index or not self.snapshot_index.enabled:
+            return
+        
+        infos = {file_info['path']: file_info for file_info in files_info}
+        entries = []
+        for result in analysis_results:
+            file_info = infos.get(result['original_path'])
+            if file_info is None or not (result['success'] or result['skipped']):
                 continue
-            
-            if self.is_excluded_file(file_path):
+            entries.append((
+                str(file_info['relative_path']), file_info['size'], file_info['mtime_ns'],
+                result.get('new_name') if result['success'] else None
+            ))
+        self.snapshot_index.mark_processed(self.base_dir, entries, processed)
+    
+    def _remember_plan_applied(self, entries: List[Dict[str, Any]], rename_results: List[Dict[str, Any]]) -> None:
+        """按计划执行后把重命名成功的文件（按新路径）记为已处理
+        
+        重命名失败（权限不足、目标冲突、文件已消失）或预览后被修改的文件不记录，下次仍会被处理。
+        """
+        if not self.snapshot_index or not self.snapshot_index.enabled:
+            return
+        
+        processed = []
+        for entry, result in zip(entries, rename_results):
+            if not result.get('renamed') or entry['size'] is None:
                 continue
-            
-            if not self.content_extractor.is_supported_file(file_path):
+            try:
+                relative_path = Path(result['new_path']).relative_to(self.base_dir)
+            except ValueError:
                 continue
-            
-            file_info = {
-                'path': file_path,
-                'name': file_path.name,
-                'size': file_path.stat().st_size,
-                'type': self.content_extractor.get_file_type(file_path),
-                'extension': file_path.suffix,
-                'relative_path': file_path.relative_to(self.base_dir)
-            }
-            
-            files_info.append(file_info)
+            # 改名不改变大小和修改时间，沿用预览时记录的状态
+            processed.append((str(relative_path), entry['size'], entry['mtime_ns'], result['new_name']))
+        self.snapshot_index.mark_processed(self.base_dir, processed)
+    
+    def _remember_renames(self, renames: List[Tuple[Path, Path]]) -> None:
+        """把重命名后的路径记入快照，文件不会因为改了名而被当作新增"""
+        if not renames or not self.snapshot_index or not self.snapshot_index.enabled:
+            return
         
-        return files_info
+        relative_renames = []
+        for original_path, new_path in renames:
+            try:
+                relative_renames.append((
+                    str(original_path.relative_to(self.base_dir)), str(new_path.relative_to(self.base_dir))
+                ))
+            except ValueError:
+                continue
+        self.snapshot_index.record_renames(self.base_dir, relative_renames)
     
     def sanitize_filename(self, filename: str, extension: str = "") -> str:
         """清理文件名，确保符合文件系统要求"""
@@ -241,9 +471,22 @@ class DeepSeekFileRenamer:
         
         return new_name + original_ext
     
-    def resolve_name_conflict(self, target_path: Path, original_path: Path) -> Path:
-        """解决文件名冲突"""
-        if not target_path.exists() or target_path.samefile(original_path):
+    def resolve_name_conflict(self, target_path: Path, original_path: Path, claimed: Set[str] = None) -> Path:
+        """解决文件名冲突
+        
+        Args:
+            target_path: 期望的新路径
+            original_path: 原文件路径
+            claimed: 本批次中已分配给其他文件的路径（os.path.normcase 后的字符串）
+        """
+        claimed = claimed or set()
+        
+        def is_taken(path: Path) -> bool:
+            if os.path.normcase(str(path)) in claimed:
+                return True
+            return path.exists() and not path.samefile(original_path)
+        
+        if not is_taken(target_path):
             return target_path
         
         base_name = target_path.stem
@@ -255,17 +498,16 @@ class DeepSeekFileRenamer:
             new_name = f"{base_name}_{counter}{extension}"
             new_path = parent_dir / new_name
             
-            if not new_path.exists():
+            if not is_taken(new_path):
                 return new_path
             
             counter += 1
             if counter > 1000:  # 避免无限循环
                 raise RuntimeError("无法解决文件名冲突")
     
-    async def analyze_and_rename_file(self, file_info: Dict[str, Any]) -> Dict[str, Any]:
-        """分析单个文件并生成重命名建议"""
-        file_path = file_info['path']
-        result = {
+    def _new_analysis_result(self, file_path: Path) -> Dict[str, Any]:
+        """创建单个文件的初始分析结果"""
+        return {
             'original_path': file_path,
             'original_name': file_path.name,
             'success': False,
@@ -275,21 +517,219 @@ class DeepSeekFileRenamer:
             'analysis_result': None,
             'skipped': False
         }
+    
+    async def _extract_for_analysis(self, file_path: Path, result: Dict[str, Any]) -> Optional[str]:
+        """在提取进程池中提取待分析的内容，无法分析时在结果中记录原因并返回 None"""
+        logger.info(f"正在分析文件: {file_path.name}")
+        extraction_result = await self._extract_with_cache(file_path)
+        
+        if not extraction_result['success']:
+            result['error'] = f"内容提取失败: {extraction_result['error']}"
+            result['skipped'] = True
+            return None
+        
+        content = extraction_result['content']
+        if not content or len(content.strip()) < 10:
+            result['error'] = "文件内容过短，跳过分析"
+            result['skipped'] = True
+            return None
+        
+        if extraction_result.get('simhash') is not None:
+            result['simhash'] = extraction_result['simhash']
+        return content
+    
+    async def _extract_with_cache(self, file_path: Path) -> Dict[str, Any]:
+        """先查提取缓存，未命中时交给提取进程池，成功结果和确定性的解析失败写回缓存"""
+        if not self.extraction_cache or not self.extraction_cache.enabled:
+            return await self.extraction_pool.extract(file_path)
+        
+        # 缓存查询可能需要计算内容哈希，放到线程里执行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        variant = self.content_extractor.extraction_variant(file_path)
+        cached, fingerprint = await loop.run_in_executor(None, self.extraction_cache.lookup, file_path, variant)
+        if cached is not None:
+            if cached.get('success'):
+                logger.info(f"提取缓存命中: {file_path.name}")
+            else:
+                logger.info(f"文件未变化，跳过上次提取失败的文件 {file_path.name}: {cached.get('error')}")
+            return cached
+        
+        extraction_result = await self.extraction_pool.extract(file_path)
+        await loop.run_in_executor(None, self.extraction_cache.put, fingerprint, extraction_result, variant)
+        return extraction_result
+    
+    def _apply_analysis(self, result: Dict[str, Any], analysis_result: Dict[str, Any]) -> None:
+        """根据 AI 分析结果生成新文件名并写入结果"""
+        file_path = result['original_path']
+        result['analysis_result'] = analysis_result
+        result['retries'] = analysis_result.get('retries', 0)
+        result['usage'] = analysis_result.get('usage') or {}
+        result['elapsed'] = analysis_result.get('elapsed', 0.0)
+        
+        if not analysis_result['success']:
+            result['error'] = f"AI 分析失败: {analysis_result.get('error', '未知错误')}"
+            return
+        
+        # 生成新文件名
+        new_filename = self.generate_filename(analysis_result, file_path)
+        new_path = file_path.parent / new_filename
+        
+        # 解决冲突
+        final_path = self.resolve_name_conflict(new_path, file_path)
+        
+        result['success'] = True
+        result['new_name'] = final_path.name
+        result['new_path'] = final_path
+        result['suggested_name'] = analysis_result['suggested_name']
+        
+        logger.info(f"分析完成: {file_path.name} -> {final_path.name}")
+    
+    def _assign_unique_names(self, results: List[Dict[str, Any]]) -> None:
+        """按路径顺序重新分配目标路径，同一批次内的文件不会得到相同的新名称
+        
+        分析是并发完成的，完成顺序不固定；这里统一按原路径排序后分配编号后缀，结果可复现。
+        """
+        claimed = set()
+        renamed = [r for r in results if r.get('success') and not r.get('skipped')]
+        for result in sorted(renamed, key=lambda r: str(r['original_path'])):
+            original_path = result['original_path']
+            target_path = original_path.parent / self.generate_filename(result['analysis_result'], original_path)
+            final_path = self.resolve_name_conflict(target_path, original_path, claimed)
+            claimed.add(os.path.normcase(str(final_path)))
+            result['new_name'] = final_path.name
+            result['new_path'] = final_path
+    
+    @staticmethod
+    def _duplicate_result(file_path: Path, representative: Dict[str, Any]) -> Dict[str, Any]:
+        """根据代表文件的分析结果生成重复文件的结果，不计入 API 用量"""
+        result = dict(representative)
+        result.update({
+            'original_path': file_path,
+            'original_name': file_path.name,
+            'duplicate_of': representative['original_name'],
+            'retries': 0,
+            'usage': {},
+            'elapsed': 0.0
+        })
+        # 分析结果中的用量属于代表文件的请求，副本不带用量，汇总时不会重复计入
+        if result.get('analysis_result'):
+            result['analysis_result'] = {
+                name: value for name, value in result['analysis_result'].items() if name != 'usage'
+            }
+        return result
+    
+    def _near_duplicate_result(self, file_path: Path, representative: Dict[str, Any],
+                               differentiator: Optional[str]) -> Dict[str, Any]:
+        """沿用相似文件的分析结果，名称后加上本文件特有的日期或版本标记"""
+        result = self._duplicate_result(file_path, representative)
+        result.pop('duplicate_of')
+        result['near_duplicate_of'] = representative['original_name']
+        result.pop('simhash', None)
+        
+        if representative.get('success') and differentiator:
+            self._append_differentiator(result, differentiator)
+        return result
+    
+    @staticmethod
+    def _append_differentiator(result: Dict[str, Any], differentiator: str) -> None:
+        """在建议名称后追加区分标记，分析结果复制一份，不影响共用它的其他文件"""
+        analysis_result = dict(result['analysis_result'])
+        analysis_result['suggested_name'] = f"{analysis_result['suggested_name']}_{differentiator}"
+        result['analysis_result'] = analysis_result
+        result['suggested_name'] = analysis_result['suggested_name']
+    
+    @staticmethod
+    def _report_to_slot(slot, analysis_results: List[Dict[str, Any]]) -> None:
+        """把本次请求的状态码交给并发控制器，用于判断是否限流或过载"""
+        status_codes = []
+        for r in analysis_results:
+            # 重试过程中遇到的限流也要让控制器知道
+            status_codes.extend(code for code in r.get('retry_statuses', []) if code is not None)
+            if r.get('status_code') is not None:
+                status_codes.append(r['status_code'])
+        errors = [code for code in status_codes if code != 200]
+        slot.status_code = errors[0] if errors else (200 if status_codes else None)
+        # 没有状态码的失败是网络异常或超时
+        slot.failed = any(
+            (not r.get('success') and r.get('status_code') is None) or None in r.get('retry_statuses', [])
+            for r in analysis_results
+        )
+    
+    async def _request_analysis(self, content: str, limiter: AdaptiveConcurrencyLimiter,
+                                retry_budget: Optional[RetryBudget] = None) -> Dict[str, Any]:
+        """分析单个文件内容，缓存命中时不占用并发窗口"""
+        if not self.bypass_cache:
+            cached = self.deepseek_client.lookup_cached(content, self.analysis_type)
+            if cached:
+                return cached
+        
+        async with limiter.slot() as slot:
+            analysis_result = await self.deepseek_client.analyze_content_async(
+                content, self.analysis_type, use_cache=False, retry_budget=retry_budget
+            )
+            self._report_to_slot(slot, [analysis_result])
+        return analysis_result
+    
+    @staticmethod
+    def count_retries(analysis_results: List[Dict[str, Any]]) -> int:
+        """统计重试次数，打包请求的重试记录在该批每个文件上都有一份，按请求编号只计一次"""
+        by_request = {}
+        total = 0
+        for result in analysis_results:
+            retries = result.get('retries', 0)
+            request_id = (result.get('analysis_result') or {}).get('request_id')
+            if request_id is None:
+                total += retries
+            else:
+                # 重复文件沿用代表文件的分析结果，但重试次数记为 0，取最大值
+                by_request[request_id] = max(by_request.get(request_id, 0), retries)
+        return total + sum(by_request.values())
+    
+    @staticmethod
+    def summarize_prompt_cache(analysis_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """汇总本次运行中命中与未命中服务端上下文缓存的提示词 token 数"""
+        hit_tokens = 0
+        miss_tokens = 0
+        for r in analysis_results:
+            usage = (r.get('analysis_result') or {}).get('usage') or {}
+            hit_tokens += usage.get('prompt_cache_hit_tokens', 0)
+            miss_tokens += usage.get('prompt_cache_miss_tokens', 0)
+        
+        total = hit_tokens + miss_tokens
+        return {
+            'hit_tokens': hit_tokens,
+            'miss_tokens': miss_tokens,
+            'hit_rate': hit_tokens / total if total else 0.0
+        }
+    
+    def _record_usage(self, analysis_results: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+        """统计本次运行的 token 用量和费用，并累计到本次会话"""
+        stats = UsageStats.from_results(analysis_results, self.pricing, wall_time)
+        self.session_usage.merge(stats)
+        self.last_run_usage = stats.summary()
+        
+        totals = self.last_run_usage['totals']
+        logger.info(f"本次共消耗提示词 {totals['prompt_tokens']} tokens、生成 {totals['completion_tokens']} tokens，"
+                    f"预计费用 {totals['cost']:.4f} {self.last_run_usage['currency']}")
+        return self.last_run_usage
+    
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """返回最近一次运行和本次会话累计的用量统计"""
+        return {
+            'last_run': self.last_run_usage,
+            'session': self.session_usage.summary()
+        }
+    
+    async def analyze_and_rename_file(self, file_info: Dict[str, Any], limiter: AdaptiveConcurrencyLimiter = None,
+                                      retry_budget: Optional[RetryBudget] = None) -> Dict[str, Any]:
+        """分析单个文件并生成重命名建议"""
+        file_path = file_info['path']
+        result = self._new_analysis_result(file_path)
         
         try:
             # 提取文件内容
-            logger.info(f"正在分析文件: {file_path.name}")
-            extraction_result = self.content_extractor.extract_content(file_path)
-            
-            if not extraction_result['success']:
-                result['error'] = f"内容提取失败: {extraction_result['error']}"
-                result['skipped'] = True
-                return result
-            
-            content = extraction_result['content']
-            if not content or len(content.strip()) < 10:
-                result['error'] = "文件内容过短，跳过分析"
-                result['skipped'] = True
+            content = await self._extract_for_analysis(file_path, result)
+            if content is None:
                 return result
             
             # 调用 DeepSeek API 分析
@@ -297,26 +737,8 @@ class DeepSeekFileRenamer:
                 result['error'] = "DeepSeek API 客户端未初始化"
                 return result
             
-            analysis_result = self.deepseek_client.analyze_content(content, self.analysis_type)
-            result['analysis_result'] = analysis_result
-            
-            if not analysis_result['success']:
-                result['error'] = f"AI 分析失败: {analysis_result.get('error', '未知错误')}"
-                return result
-            
-            # 生成新文件名
-            new_filename = self.generate_filename(analysis_result, file_path)
-            new_path = file_path.parent / new_filename
-            
-            # 解决冲突
-            final_path = self.resolve_name_conflict(new_path, file_path)
-            
-            result['success'] = True
-            result['new_name'] = final_path.name
-            result['new_path'] = final_path
-            result['suggested_name'] = analysis_result['suggested_name']
-            
-            logger.info(f"分析完成: {file_path.name} -> {final_path.name}")
+            analysis_result = await self._request_analysis(content, limiter or self.concurrency_limiter, retry_budget)
+            self._apply_analysis(result, analysis_result)
             
         except Exception as e:
             result['error'] = f"处理文件时发生错误: {str(e)}"
@@ -324,36 +746,236 @@ class DeepSeekFileRenamer:
         
         return result
     
-    async def batch_analyze_files(self, files_info: List[Dict[str, Any]], max_concurrent: int = 3) -> List[Dict[str, Any]]:
-        """批量分析文件"""
-        semaphore = asyncio.Semaphore(max_concurrent)
+    async def _analyze_files_pipelined(self, files_info: List[Dict[str, Any]], limiter: AdaptiveConcurrencyLimiter,
+                                       retry_budget: Optional[RetryBudget] = None) -> List[Any]:
+        """提取和分析流水线：提取进程池产出的内容经有界队列交给分析阶段
+        
+        短小文件攒够 batch_size 个就打包成一个请求，其余文件单独分析。
+        在途分析任务达到上限时停止从队列取内容，队列满后提取也随之暂停。
+        与已出队文件的 SimHash 指纹相近的文件不再请求 API，最后沿用相似文件的结果。
+        """
+        results = [self._new_analysis_result(file_info['path']) for file_info in files_info]
+        queue = asyncio.Queue(maxsize=self.extraction_queue_size)
+        pending = asyncio.Semaphore(self.extraction_queue_size)
+        next_index = iter(range(len(files_info)))
+        
+        async def extract_worker():
+            for index in next_index:
+                try:
+                    content = await self._extract_for_analysis(files_info[index]['path'], results[index])
+                except Exception as e:
+                    results[index]['error'] = f"处理文件时发生错误: {str(e)}"
+                    logger.error(f"处理文件失败 {files_info[index]['path']}: {str(e)}")
+                    content = None
+                if content is not None:
+                    await queue.put((str(index), content))
+        
+        async def produce():
+            # 在途提取数略多于进程数，保证进程池不空闲
+            workers = [extract_worker() for _ in range(self.extraction_pool.workers * 2)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                await queue.put(None)
+        
+        async def analyze_single(item):
+            index, content = item
+            try:
+                async with limiter.slot() as slot:
+                    analysis_result = await self.deepseek_client.analyze_content_async(
+                        content, self.analysis_type, use_cache=False, retry_budget=retry_budget
+                    )
+                    self._report_to_slot(slot, [analysis_result])
+                self._apply_analysis(results[int(index)], analysis_result)
+            finally:
+                pending.release()
+        
+        async def analyze_group(items):
+            try:
+                async with limiter.slot() as slot:
+                    analysis_results = await self.deepseek_client.analyze_batch_async(
+                        items, self.analysis_type, use_cache=False, retry_budget=retry_budget
+                    )
+                    self._report_to_slot(slot, list(analysis_results.values()))
+                for index, _ in items:
+                    self._apply_analysis(results[int(index)], analysis_results[index])
+            finally:
+                pending.release()
+        
+        tasks = []
+        task_indices = []
+        
+        async def dispatch(coro, indices):
+            await pending.acquire()
+            tasks.append(asyncio.ensure_future(coro))
+            task_indices.append(indices)
+        
+        # 近似去重：先出队的文件作为代表，之后相似的文件记到 near_duplicates 里
+        near_index = SimHashIndex(self.near_duplicate_distance) if self.near_dedupe_enabled else None
+        near_tokens = {}
+        near_duplicates = {}
+        
+        def find_near_duplicate(index: int, content: str) -> bool:
+            fingerprint = results[index].get('simhash')
+            if near_index is None or fingerprint is None:
+                return False
+            # 文件名中的日期、版本优先于正文中的
+            near_tokens[index] = {
+                'name': distinguishing_tokens(files_info[index]['path'].stem),
+                'text': distinguishing_tokens(content)
+            }
+            match = near_index.find(fingerprint)
+            if match is None:
+                near_index.add(index, fingerprint)
+                return False
+            near_duplicates[index] = match[0]
+            return True
+        
+        producer = asyncio.ensure_future(produce())
+        group = []
+        group_count = 0
+        single_count = 0
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                
+                index, content = item
+                if find_near_duplicate(int(index), content):
+                    continue
+                # 缓存命中的文件直接出结果，剩下的才参与打包；打包与单独请求的结果分开缓存
+                batchable = self.batch_size > 1 and estimate_tokens(content) <= self.batch_max_tokens
+                cached = None if self.bypass_cache else self.deepseek_client.lookup_cached(
+                    content, self.analysis_type, batch=batchable
+                )
+                if cached:
+                    self._apply_analysis(results[int(index)], cached)
+                elif batchable:
+                    group.append(item)
+                    if len(group) >= self.batch_size:
+                        await dispatch(analyze_group(group), [int(i) for i, _ in group])
+                        group_count += 1
+                        group = []
+                else:
+                    await dispatch(analyze_single(item), [int(index)])
+                    single_count += 1
+            
+            if len(group) == 1:
+                await dispatch(analyze_single(group[0]), [int(group[0][0])])
+                single_count += 1
+            elif group:
+                await dispatch(analyze_group(group), [int(i) for i, _ in group])
+                group_count += 1
+        finally:
+            # 分析阶段异常退出时生产者可能卡在满队列上
+            if not producer.done():
+                producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
         
-        async def analyze_with_semaphore(file_info):
-            async with semaphore:
-                return await self.analyze_and_rename_file(file_info)
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
         
-        tasks = [analyze_with_semaphore(file_info) for file_info in files_info]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 整组请求异常时，组内每个文件都记为异常
+        for indices, outcome in zip(task_indices, outcomes):
+            if isinstance(outcome, Exception):
+                for index in indices:
+                    results[index] = outcome
+        
+        # 每个文件名后加上自己特有的日期或版本标记，代表文件与组内其他文件区分
+        siblings_of = {}
+        for index, representative in near_duplicates.items():
+            siblings_of.setdefault(representative, []).append(index)
+        for representative, siblings in siblings_of.items():
+            representative_result = results[representative]
+            if isinstance(representative_result, Exception):
+                for index in siblings:
+                    results[index] = representative_result
+                continue
+            
+            for index in siblings:
+                differentiator = pick_differentiator(near_tokens[index], near_tokens[representative])
+                results[index] = self._near_duplicate_result(
+                    files_info[index]['path'], representative_result, differentiator
+                )
+            # 代表文件取组内其他文件都没有的标记
+            differentiator = pick_differentiator(near_tokens[representative], {
+                source: [t for i in siblings for t in near_tokens[i][source]]
+                for source in near_tokens[representative]
+            })
+            if representative_result.get('success') and differentiator:
+                self._append_differentiator(representative_result, differentiator)
+        
+        if near_duplicates:
+            logger.info(f"{len(near_duplicates)} 个文件与其他文件内容近似，沿用其分析结果")
+        logger.info(f"批量请求 {group_count} 个，单文件请求 {single_count} 个")
+        return results
+    
+    async def batch_analyze_files(self, files_info: List[Dict[str, Any]], max_concurrent: int = None) -> List[Dict[str, Any]]:
+        """批量分析文件
+        
+        Args:
+            files_info: scan_directory 返回的文件信息
+            max_concurrent: 指定时使用固定并发数，否则使用自适应并发控制器
+        """
+        if max_concurrent is None:
+            limiter = self.concurrency_limiter
+        else:
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=max_concurrent, max_limit=max_concurrent, adaptive=False)
+        
+        # 内容完全相同的文件只分析组内第一个，其余沿用它的结果
+        duplicate_of = {}
+        if self.dedupe_enabled and len(files_info) > 1:
+            loop = asyncio.get_running_loop()
+            duplicate_groups = await loop.run_in_executor(None, find_duplicate_groups, files_info)
+            duplicate_of = {index: group[0] for group in duplicate_groups for index in group[1:]}
+            if duplicate_of:
+                logger.info(f"发现 {len(duplicate_groups)} 组内容相同的文件，跳过 {len(duplicate_of)} 个重复文件的分析")
+        unique_indices = [i for i in range(len(files_info)) if i not in duplicate_of]
+        unique_info = [files_info[i] for i in unique_indices]
+        
+        # 整个批次共享重试预算，API 故障时不会把请求量放大数倍
+        retry_budget = RetryBudget.for_batch(len(unique_info), self.api_config.get('retry_budget_ratio', 0.2))
+        
+        try:
+            if self.deepseek_client:
+                results = await self._analyze_files_pipelined(unique_info, limiter, retry_budget)
+            else:
+                tasks = [self.analyze_and_rename_file(file_info, limiter, retry_budget) for file_info in unique_info]
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            # 连接池绑定当前事件循环，批次结束后释放
+            if self.deepseek_client:
+                await self.deepseek_client.aclose()
+        
+        if retry_budget.used:
+            logger.info(f"本批次共重试 {retry_budget.used} 次（预算 {retry_budget.max_retries} 次）")
         
         # 处理异常结果
-        processed_results = []
-        for i, result in enumerate(results):
+        processed_results = [None] * len(files_info)
+        for i, result in zip(unique_indices, results):
             if isinstance(result, Exception):
-                error_result = {
+                result = {
                     'original_path': files_info[i]['path'],
                     'original_name': files_info[i]['name'],
                     'success': False,
                     'error': f"异步处理异常: {str(result)}",
                     'skipped': False
                 }
-                processed_results.append(error_result)
-            else:
-                processed_results.append(result)
+            processed_results[i] = result
         
+        for i, representative in duplicate_of.items():
+            processed_results[i] = self._duplicate_result(files_info[i]['path'], processed_results[representative])
+        
+        self._assign_unique_names(processed_results)
         return processed_results
     
-    def execute_rename(self, rename_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """执行实际的文件重命名操作"""
+    def execute_rename(self, rename_results: List[Dict[str, Any]], new_backup_dir: bool = True) -> Dict[str, Any]:
+        """执行实际的文件重命名操作
+        
+        Args:
+            rename_results: 分析结果
+            new_backup_dir: 是否为本次重命名新建备份目录，为 False 时沿用上一个备份目录
+        """
         stats = {
             'total': len(rename_results),
             'success': 0,
@@ -362,9 +984,10 @@ class DeepSeekFileRenamer:
             'errors': []
         }
         
-        if self.backup_enabled:
+        if self.backup_enabled and (new_backup_dir or not self.backup_dir or not self.backup_dir.exists()):
             self.create_backup_directory()
         
+        renames = []
         for result in rename_results:
             if result['skipped'] or not result['success']:
                 stats['skipped'] += 1
@@ -384,6 +1007,8 @@ class DeepSeekFileRenamer:
                 # 执行重命名
                 original_path.rename(new_path)
                 stats['success'] += 1
+                result['renamed'] = True
+                renames.append((original_path, new_path))
                 
                 # 记录操作日志
                 log_entry = {
@@ -413,6 +1038,7 @@ class DeepSeekFileRenamer:
                 
                 logger.error(f"重命名失败 {original_path.name}: {str(e)}")
         
+        self._remember_renames(renames)
         return stats
     
     def save_operation_log(self) -> str:
@@ -450,9 +1076,31 @@ class DeepSeekFileRenamer:
             
             logger.info(f"找到 {len(files_info)} 个可处理的文件")
             
+            if self.only_changed:
+                files_info = [file_info for file_info in files_info if file_info['changed']]
+                logger.info(f"只处理新增或修改的文件：{len(files_info)} 个")
+                if not files_info:
+                    return {
+                        'total_files': 0,
+                        'analysis_results': [],
+                        'successful_analyses': 0,
+                        'failed_analyses': 0,
+                        'skipped_analyses': 0,
+                        'total_retries': 0,
+                        'duplicate_files': 0,
+                        'near_duplicate_files': 0,
+                        'prompt_cache': self.summarize_prompt_cache([]),
+                        'usage': None,
+                        'rename_stats': None,
+                        'message': '上次运行以来没有新增或修改的文件'
+                    }
+            
             # 批量分析文件
             logger.info("正在分析文件内容...")
+            analysis_started = time.monotonic()
             analysis_results = await self.batch_analyze_files(files_info)
+            analysis_time = time.monotonic() - analysis_started
+            self._remember_processed(files_info, analysis_results, processed=execute_rename)
             
             # 统计分析结果
             successful_analyses = [r for r in analysis_results if r['success']]
@@ -465,9 +1113,18 @@ class DeepSeekFileRenamer:
                 'successful_analyses': len(successful_analyses),
                 'failed_analyses': len(failed_analyses),
                 'skipped_analyses': len(skipped_analyses),
+                'total_retries': self.count_retries(analysis_results),
+                'duplicate_files': sum(1 for r in analysis_results if r.get('duplicate_of')),
+                'near_duplicate_files': sum(1 for r in analysis_results if r.get('near_duplicate_of')),
+                'prompt_cache': self.summarize_prompt_cache(analysis_results),
+                'usage': self._record_usage(analysis_results, analysis_time),
                 'rename_stats': None
             }
             
+            prompt_cache = result['prompt_cache']
+            logger.info(f"提示词缓存命中 {prompt_cache['hit_tokens']} tokens，"
+                        f"未命中 {prompt_cache['miss_tokens']} tokens（命中率 {prompt_cache['hit_rate']:.1%}）")
+            
             # 如果需要执行重命名
             if execute_rename and successful_analyses:
                 logger.info("正在执行文件重命名...")
@@ -545,7 +1202,10 @@ class DeepSeekFileRenamer:
         
         # 批量分析选中的文件
         logger.info("正在分析文件内容...")
+        analysis_started = time.monotonic()
         analysis_results = await self.batch_analyze_files(selected_files_info)
+        analysis_time = time.monotonic() - analysis_started
+        self._remember_processed(selected_files_info, analysis_results, processed=execute_rename)
         
         # 统计分析结果
         successful_analyses = [r for r in analysis_results if r['success']]
@@ -557,6 +1217,11 @@ class DeepSeekFileRenamer:
             'successful_analyses': len(successful_analyses),
             'failed_analyses': len(failed_analyses),
             'skipped_analyses': len(skipped_analyses),
+            'total_retries': self.count_retries(analysis_results),
+            'duplicate_files': sum(1 for r in analysis_results if r.get('duplicate_of')),
+            'near_duplicate_files': sum(1 for r in analysis_results if r.get('near_duplicate_of')),
+            'prompt_cache': self.summarize_prompt_cache(analysis_results),
+            'usage': self._record_usage(analysis_results, analysis_time),
             'results': analysis_results
         }
         
@@ -573,6 +1238,67 @@ class DeepSeekFileRenamer:
         
         return result
 
+    def apply_plan(self, plan: RenamePlan, selected_indices: List[int] = None) -> Dict[str, Any]:
+        """套用预览阶段生成的重命名计划，只做文件系统操作，不重新扫描或调用 AI
+        
+        Args:
+            plan: 预览时保存的重命名计划
+            selected_indices: 选中的预览结果索引，为空时套用全部
+        """
+        entries = plan.select(selected_indices)
+        if not entries:
+            return {"error": "没有有效的选中文件"}
+        
+        rename_results = []
+        claimed = set()
+        for entry in entries:
+            result = dict(entry)
+            
+            if result['success'] and not result['skipped']:
+                original_path = result['original_path']
+                try:
+                    stat = original_path.stat()
+                    if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+                        result['success'] = False
+                        result['skipped'] = True
+                        result['error'] = "文件在预览后已被修改，请重新预览"
+                    else:
+                        # 预览之后目录里可能出现了同名文件，重新解决冲突
+                        final_path = self.resolve_name_conflict(result['new_path'], original_path, claimed)
+                        claimed.add(os.path.normcase(str(final_path)))
+                        result['new_path'] = final_path
+                        result['new_name'] = final_path.name
+                except FileNotFoundError:
+                    result['success'] = False
+                    result['skipped'] = True
+                    result['error'] = "文件在预览后已被移动或删除"
+            
+            rename_results.append(result)
+        
+        successful = [r for r in rename_results if r['success']]
+        failed = [r for r in entries if not r['success'] and not r['skipped']]
+        skipped = [r for r in rename_results if r['skipped']]
+        
+        result = {
+            'total_files': len(rename_results),
+            'successful_analyses': len(successful),
+            'failed_analyses': len(failed),
+            'skipped_analyses': len(skipped),
+            'results': rename_results,
+            'rename_stats': None
+        }
+        
+        if successful:
+            logger.info(f"正在按计划 {plan.plan_id} 执行文件重命名...")
+            result['rename_stats'] = self.execute_rename(rename_results)
+            self._remember_plan_applied(entries, rename_results)
+            
+            log_file = self.save_operation_log()
+            if log_file:
+                result['log_file'] = log_file
+        
+        return result
+
 
 # 为了向后兼容，保留原来的类名
 class InteractiveFileRenamer(DeepSeekFileRenamer):
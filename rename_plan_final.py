@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenamePlan:
+    """一次预览产生的重命名计划，保存已解析好的目标路径"""
+    
+    def __init__(self, plan_id: str, base_dir: Path, entries: List[Dict[str, Any]]):
+        self.plan_id = plan_id
+        self.base_dir = base_dir
+        self.entries = entries
+        self.created_at = time.time()
+    
+    def select(self, selected_indices: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """按预览结果的索引挑选条目，未指定时返回全部"""
+        if not selected_indices:
+            return list(self.entries)
+        
+        return [self.entries[idx] for idx in selected_indices if 0 <= idx < len(self.entries)]
+
+
+class RenamePlanStore:
+    """服务端重命名计划存储，执行时直接套用预览结果而不再调用 AI"""
+    
+    def __init__(self, ttl_seconds: int = 3600, max_plans: int = 20):
+        self.ttl_seconds = ttl_seconds
+        self.max_plans = max_plans
+        self._plans: Dict[str, RenamePlan] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _snapshot_entry(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录预览时的文件状态，执行前用于判断文件是否已被改动"""
+        original_path = Path(analysis_result['original_path'])
+        entry = {
+            'original_path': original_path,
+            'original_name': analysis_result.get('original_name', original_path.name),
+            'new_path': analysis_result.get('new_path'),
+            'new_name': analysis_result.get('new_name'),
+            'suggested_name': analysis_result.get('suggested_name'),
+            'success': analysis_result.get('success', False),
+            'skipped': analysis_result.get('skipped', False),
+            'error': analysis_result.get('error'),
+            'size': None,
+            'mtime_ns': None
+        }
+        
+        try:
+            stat = original_path.stat()
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+        except OSError:
+            pass
+        
+        return entry
+    
+    def create(self, base_dir: Path, analysis_results: List[Dict[str, Any]]) -> str:
+        """根据预览结果创建计划，返回计划 ID"""
+        plan_id = uuid.uuid4().hex
+        entries = [self._snapshot_entry(r) for r in analysis_results]
+        
+        with self._lock:
+            self._purge_expired()
+            # 超出数量上限时丢弃最早的计划
+            while len(self._plans) >= self.max_plans:
+                oldest_id = min(self._plans, key=lambda pid: self._plans[pid].created_at)
+                del self._plans[oldest_id]
+            self._plans[plan_id] = RenamePlan(plan_id, Path(base_dir), entries)
+        
+        logger.info(f"已创建重命名计划 {plan_id}，共 {len(entries)} 个条目")
+        return plan_id
+    
+    def get(self, plan_id: str) -> Optional[RenamePlan]:
+        """获取未过期的计划"""
+        with self._lock:
+            self._purge_expired()
+            return self._plans.get(plan_id)
+    
+    def discard(self, plan_id: str) -> None:
+        """执行后丢弃计划，避免重复套用"""
+        with self._lock:
+            self._plans.pop(plan_id, None)
+    
+    def _purge_expired(self):
+        """清理过期计划（调用方持有锁）"""
+        now = time.time()
+        expired = [pid for pid, plan in self._plans.items() if now - plan.created_at > self.ttl_seconds]
+        for pid in expired:
+            del self._plans[pid]
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# 可以重试的状态码：限流和临时性的服务端错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class RetryBudget:
+    """一个批次内所有请求共享的重试次数上限，避免故障时重试放大请求量"""
+    
+    def __init__(self, max_retries: int):
+        self.max_retries = max(0, max_retries)
+        self.used = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_batch(cls, file_count: int, ratio: float = 0.2, minimum: int = 20) -> 'RetryBudget':
+        """按批次文件数的比例分配重试预算"""
+        return cls(max(minimum, int(file_count * ratio)))
+    
+    def try_consume(self) -> bool:
+        """占用一次重试，预算用完时返回 False"""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+    
+    @property
+    def exhausted(self) -> bool:
+        return self.used >= self.max_retries
+
+
+class RetryPolicy:
+    """指数退避 + 完全抖动的重试策略，支持 Retry-After 和单请求截止时间"""
+    
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        deadline: float = 120.0
+    ):
+        """
+        初始化重试策略
+        
+        Args:
+            max_retries: 单个请求的最大重试次数
+            base_delay: 退避的基础时长（秒）
+            max_delay: 单次等待的上限（秒）
+            deadline: 单个请求从首次发出到放弃的总时长（秒）
+        """
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+    
+    @staticmethod
+    def is_retryable_status(status_code: int) -> bool:
+        return status_code in RETRYABLE_STATUS_CODES
+    
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式"""
+        if not value:
+            return None
+        
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError, IndexError):
+            return None
+    
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试（从 0 开始）的完全抖动退避时长"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def next_delay(self, attempt: int, started_at: float, retry_after: Optional[str] = None) -> Optional[float]:
+        """
+        计算下一次重试前的等待时长
+        
+        Args:
+            attempt: 已经重试的次数
+            started_at: 首次请求的 time.monotonic() 时间
+            retry_after: 响应中的 Retry-After 头
+        
+        Returns:
+            等待秒数；超出重试次数或等待后会超过截止时间时返回 None
+        """
+        if attempt >= self.max_retries:
+            return None
+        
+        delay = self.parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff(attempt)
+        
+        if time.monotonic() + delay - started_at >= self.deadline:
+            return None
+        
+        return delay
+    
+    def remaining(self, started_at: float) -> float:
+        """距截止时间还剩多少秒"""
+        return max(0.0, self.deadline - (time.monotonic() - started_at))
@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from fs_walk_final import DirListing
+from suggestion_cache_final import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class CachedStat(NamedTuple):
+    """快照中保存的文件属性，字段名与 os.stat_result 相同，可以互换使用"""
+    st_size: int
+    st_mtime_ns: int
+    st_ino: int
+
+
+def processed_key(size: int, mtime_ns: int) -> str:
+    """文件被处理时的状态，大小或修改时间变化后视为已修改；不含 inode，改名和移动不算修改"""
+    return f"{size}:{mtime_ns}"
+
+
+class SnapshotIndex:
+    """按根目录持久化的目录快照
+    
+    记录每个目录的修改时间和子目录、每个文件的相对路径、大小、修改时间、inode、类型，
+    以及上次处理时的状态和文件名建议。再次扫描时修改时间未变的目录直接复用快照，
+    只重新列出有变化的目录；据此可以只处理上次运行以来新增或修改的文件。
+    """
+    
+    def __init__(self, db_path: Union[str, Path] = None, enabled: bool = True):
+        """
+        初始化快照索引
+        
+        Args:
+            db_path: 数据库文件路径，默认位于用户目录下
+            enabled: 是否启用快照
+        """
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / "snapshots.db"
+        self.enabled = enabled
+        
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if enabled:
+            try:
+                self._open()
+            except Exception as e:
+                logger.error(f"打开目录快照失败，快照已禁用 {self.db_path}: {str(e)}")
+                self.enabled = False
+    
+    def _open(self):
+        """打开数据库并建表"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS roots (
+                root TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                scanned_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                root TEXT NOT NULL,
+                rel_dir TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                subdirs TEXT NOT NULL,
+                PRIMARY KEY (root, rel_dir)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                root TEXT NOT NULL,
+                rel_dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                file_type TEXT,
+                suggestion TEXT,
+                processed_key TEXT,
+                processed_at REAL,
+                PRIMARY KEY (root, rel_dir, name)
+            )
+        """)
+        self._conn.commit()
+    
+    def load(self, root: Union[str, Path], signature: str) -> Dict[str, DirListing]:
+        """读取根目录上次的快照
+        
+        Args:
+            root: 根目录
+            signature: 扫描条件（排除规则、支持的扩展名等）的摘要，与上次不同时快照中的文件列表不可复用
+        
+        Returns:
+            相对目录路径 -> 目录列表，没有可用快照时为空
+        """
+        if not self.enabled:
+            return {}
+        
+        root_key = str(root)
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT signature FROM roots WHERE root = ?", (root_key,)).fetchone()
+                if row is None or row[0] != signature:
+                    return {}
+                
+                files: Dict[str, List[Tuple[str, CachedStat]]] = {}
+                for rel_dir, name, size, mtime_ns, inode in self._conn.execute(
+                    "SELECT rel_dir, name, size, mtime_ns, inode FROM files WHERE root = ?", (root_key,)
+                ):
+                    files.setdefault(rel_dir, []).append((name, CachedStat(size, mtime_ns, inode)))
+                
+                return {
+                    rel_dir: DirListing(mtime_ns, files.get(rel_dir, []), json.loads(subdirs))
+                    for rel_dir, mtime_ns, subdirs in self._conn.execute(
+                        "SELECT rel_dir, mtime_ns, subdirs FROM dirs WHERE root = ?", (root_key,)
+                    )
+                }
+        except Exception as e:
+            logger.error(f"读取目录快照失败 {root_key}: {str(e)}")
+            return {}
+    
+    def save(
+        self,
+        root: Union[str, Path],
+        signature: str,
+        listings: Dict[str, DirListing],
+        previous: Dict[str, DirListing],
+        type_of: Optional[Callable[[str], str]] = None
+    ) -> None:
+        """保存本次扫描的结果，只改写重新列出或已消失的目录
+        
+        文件的处理状态按名称保留；目录中消失的文件如果以相同的 inode、大小、修改时间
+        出现在别处（在外部被改名或移动），处理状态随之转移。
+        
+        Args:
+            root: 根目录
+            signature: 扫描条件摘要
+            listings: walk_listings 的结果
+            previous: 本次扫描使用的旧快照（load 的返回值）
+            type_of: 按文件名返回文件类型
+        """
+        if not self.enabled:
+            return
+        
+        root_key = str(root)
+        changed_dirs = [rel_dir for rel_dir, listing in listings.items() if previous.get(rel_dir) is not listing]
+        try:
+            with self._lock:
+                stored_dirs = {row[0] for row in self._conn.execute(
+                    "SELECT rel_dir FROM dirs WHERE root = ?", (root_key,)
+                )}
+                rewritten = changed_dirs + [rel_dir for rel_dir in stored_dirs if rel_dir not in listings]
+                
+                # 收集将被改写的目录中已处理文件的状态
+                states: Dict[Tuple[str, str], Tuple[Any, ...]] = {}
+                identities: Dict[Tuple[int, int, int], Tuple[Any, ...]] = {}
+                for rel_dir in rewritten:
+                    for name, size, mtime_ns, inode, suggestion, key, processed_at in self._conn.execute(
+                        "SELECT name, size, mtime_ns, inode, suggestion, processed_key, processed_at FROM files "
+                        "WHERE root = ? AND rel_dir = ? AND (processed_key IS NOT NULL OR suggestion IS NOT NULL)",
+                        (root_key, rel_dir)
+                    ):
+                        state = (suggestion, key, processed_at)
+                        states[(rel_dir, name)] = state
+                        if inode:
+                            identities[(inode, size, mtime_ns)] = state
+                
+                rows = []
+                for rel_dir in changed_dirs:
+                    listing = listings[rel_dir]
+                    for name, stat_result in listing.files:
+                        state = states.get((rel_dir, name))
+                        if state is None and stat_result.st_ino:
+                            state = identities.get((stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns))
+                        rows.append((
+                            root_key, rel_dir, name, stat_result.st_size, stat_result.st_mtime_ns,
+                            stat_result.st_ino or 0, type_of(name) if type_of else None,
+                            *(state or (None, None, None))
+                        ))
+                
+                self._conn.executemany(
+                    "DELETE FROM files WHERE root = ? AND rel_dir = ?", [(root_key, d) for d in rewritten]
+                )
+                self._conn.executemany(
+                    "DELETE FROM dirs WHERE root = ? AND rel_dir = ?", [(root_key, d) for d in rewritten]
+                )
+                self._conn.executemany(
+                    "INSERT INTO files (root, rel_dir, name, size, mtime_ns, inode, file_type, "
+                    "suggestion, processed_key, processed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.executemany(
+                    "INSERT INTO dirs (root, rel_dir, mtime_ns, subdirs) VALUES (?, ?, ?, ?)",
+                    [(root_key, d, listings[d].mtime_ns, json.dumps(listings[d].subdirs, ensure_ascii=False))
+                     for d in changed_dirs]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO roots (root, signature, scanned_at) VALUES (?, ?, ?)",
+                    (root_key, signature, time.time())
+                )
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"保存目录快照失败 {root_key}: {str(e)}")
+            if self._conn is not None:
+                self._conn.rollback()
+    
+    def file_states(self, root: Union[str, Path]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """返回已处理或预览过的文件的 相对路径 -> (上次的文件名建议, 处理时的状态)，只预览过的文件状态为 None"""
+        if not self.enabled:
+            return {}
+        
+        try:
+            with self._lock:
+                return {
+                    os.path.join(rel_dir, name): (suggestion, key)
+                    for rel_dir, name, suggestion, key in self._conn.execute(
+                        "SELECT rel_dir, name, suggestion, processed_key FROM files "
+                        "WHERE root = ? AND (processed_key IS NOT NULL OR suggestion IS NOT NULL)", (str(root),)
+                    )
+                }
+        except Exception as e:
+            logger.error(f"读取文件处理状态失败 {root}: {str(e)}")
+            return {}
+    
+    def mark_processed(self, root: Union[str, Path], entries: Iterable[Tuple[str, int, int, Optional[str]]],
+                       processed: bool = True) -> None:
+        """记录文件已处理，快照中还没有的文件（如监视模式处理的新文件）同时补上记录
+        
+        Args:
+            root: 根目录
+            entries: (相对路径, 处理时的大小, 处理时的修改时间, 文件名建议)
+            processed: 为 False 时只记录文件名建议（预览），不改变文件的处理状态，
+                       文件在下次只处理新增或修改的运行中仍会被处理
+        """
+        if not self.enabled:
+            return
+        
+        now = time.time()
+        rows = []
+        for relative_path, size, mtime_ns, suggestion in entries:
+            rel_dir, name = os.path.split(relative_path)
+            key = processed_key(size, mtime_ns) if processed else None
+            rows.append((str(root), rel_dir, name, size, mtime_ns, suggestion, key, now if processed else None))
+        if processed:
+            update = ("suggestion = excluded.suggestion, processed_key = excluded.processed_key, "
+                      "processed_at = excluded.processed_at")
+        else:
+            update = "suggestion = excluded.suggestion"
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT INTO files (root, rel_dir, name, size, mtime_ns, inode, suggestion, processed_key, "
+                    "processed_at) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?) "
+                    f"ON CONFLICT (root, rel_dir, name) DO UPDATE SET {update}", rows
+                )
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"记录文件处理状态失败 {root}: {str(e)}")
+    
+    def record_renames(self, root: Union[str, Path], renames: Iterable[Tuple[str, str]]) -> None:
+        """把已重命名文件的记录移到新路径，下次扫描时不会被当作新增文件"""
+        if not self.enabled:
+            return
+        
+        root_key = str(root)
+        try:
+            with self._lock:
+                for old_path, new_path in renames:
+                    old_dir, old_name = os.path.split(old_path)
+                    new_dir, new_name = os.path.split(new_path)
+                    self._conn.execute(
+                        "DELETE FROM files WHERE root = ? AND rel_dir = ? AND name = ?", (root_key, new_dir, new_name)
+                    )
+                    self._conn.execute(
+                        "UPDATE files SET rel_dir = ?, name = ? WHERE root = ? AND rel_dir = ? AND name = ?",
+                        (new_dir, new_name, root_key, old_dir, old_name)
+                    )
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"更新重命名记录失败 {root_key}: {str(e)}")
+    
+    def clear(self) -> None:
+        """清空所有快照和处理记录"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM roots")
+            self._conn.execute("DELETE FROM dirs")
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回快照中的根目录、目录和文件数"""
+        roots = directories = files = processed = 0
+        if self.enabled:
+            with self._lock:
+                roots = self._conn.execute("SELECT COUNT(*) FROM roots").fetchone()[0]
+                directories = self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+                files, processed = self._conn.execute(
+                    "SELECT COUNT(*), COUNT(processed_key) FROM files"
+                ).fetchone()
+        
+        return {
+            'enabled': self.enabled,
+            'path': str(self.db_path),
+            'roots': roots,
+            'directories': directories,
+            'files': files,
+            'processed_files': processed
+        }
+    
+    def close(self) -> None:
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self.enabled = False
@@ -4,7 +4,8 @@ const AppState = {
     hasDirectory: false,
     currentConfig: {},
     scannedFiles: [],
-    previewResults: []
+    previewResults: [],
+    planId: null
 };
 
 // 工具函数
@@ -162,14 +163,15 @@ const API = {
         });
     },
 
-    async executeRename(selectedFiles = []) {
+    async executeRename(selectedFiles = [], planId = null) {
         return await this.call('/execute_rename', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                selected_files: selectedFiles
+                selected_files: selectedFiles,
+                plan_id: planId
             })
         });
     },
@@ -178,6 +180,10 @@ const API = {
         return await this.call('/get_config');
     },
 
+    async getStats() {
+        return await this.call('/stats');
+    },
+
     async chooseDirectory() {
         return await this.call('/choose_directory', {
             method: 'POST'
@@ -251,7 +257,7 @@ const UI = {
                         <div class="file-info">
                             <div class="file-name">${file.name}</div>
                             <div class="file-details">
-                                ${Utils.formatFileSize(file.size)} • ${file.relative_path}
+                                ${Utils.formatFileSize(file.size)} • ${file.relative_path}${file.changed ? ' • 新增/已修改' : ''}
                             </div>
                         </div>
                         <div class="file-type">${file.extension}</div>
@@ -319,6 +325,9 @@ const UI = {
                     </div>
                     ${result.error ? `<div class="error-message" style="color: #e53e3e; font-size: 12px; margin-top: 8px;">${result.error}</div>` : ''}
                     ${result.suggested_name ? `<div class="suggested-name" style="color: #38a169; font-size: 12px; margin-top: 8px;">AI 建议：${result.suggested_name}</div>` : ''}
+                    ${result.duplicate_of ? `<div class="duplicate-info" style="color: #718096; font-size: 12px; margin-top: 8px;">与 ${result.duplicate_of} 内容相同，沿用其分析结果</div>` : ''}
+                    ${result.near_duplicate_of ? `<div class="duplicate-info" style="color: #718096; font-size: 12px; margin-top: 8px;">与 ${result.near_duplicate_of} 内容相近，沿用其命名</div>` : ''}
+                    ${result.retries ? `<div class="retry-info" style="color: #dd6b20; font-size: 12px; margin-top: 8px;">重试 ${result.retries} 次</div>` : ''}
                 </div>
             `;
         });
@@ -337,7 +346,36 @@ const UI = {
         Utils.updateButtonStates();
     },
 
-    displayResults(data) {
+    renderUsage(usage) {
+        if (!usage || !usage.totals || usage.totals.files === 0) {
+            return '';
+        }
+        
+        const totals = usage.totals;
+        const rows = Object.entries(usage.by_type).map(([fileType, item]) => `
+            <tr>
+                <td>${fileType}</td>
+                <td>${item.files}</td>
+                <td>${item.prompt_tokens}</td>
+                <td>${item.completion_tokens}</td>
+                <td>${item.avg_prompt_tokens}</td>
+                <td>${item.cost.toFixed(4)}</td>
+            </tr>
+        `).join('');
+        
+        return `
+            <div class="usage-summary">
+                <h4>Token 用量（预计费用 ${totals.cost.toFixed(4)} ${usage.currency}）：</h4>
+                <div>提示词 ${totals.prompt_tokens} tokens（缓存命中 ${totals.prompt_cache_hit_tokens}），生成 ${totals.completion_tokens} tokens，分析耗时 ${usage.wall_time.toFixed(1)} 秒</div>
+                <table class="usage-table" style="width: 100%; font-size: 12px; margin-top: 8px;">
+                    <tr><th>类型</th><th>文件数</th><th>提示词</th><th>生成</th><th>平均提示词</th><th>费用</th></tr>
+                    ${rows}
+                </table>
+            </div>
+        `;
+    },
+
+    displayResults(data, usage = null) {
         const panel = document.getElementById('results-panel');
         const container = document.getElementById('results-container');
         
@@ -373,6 +411,7 @@ const UI = {
                     <i class="fas fa-file-alt"></i> 操作日志已保存到：${data.log_file}
                 </div>
             ` : ''}
+            ${this.renderUsage(usage)}
         `;
         
         container.innerHTML = html;
@@ -386,6 +425,10 @@ const UI = {
         document.getElementById('custom-suffix').value = config.custom_suffix || '';
         document.getElementById('add-date').checked = config.add_date || false;
         document.getElementById('backup-enabled').checked = config.backup_enabled !== false;
+        document.getElementById('bypass-cache').checked = config.bypass_cache || false;
+        document.getElementById('only-changed').checked = config.only_changed || false;
+        document.getElementById('max-concurrent').value = config.max_concurrent_limit || 16;
+        document.getElementById('adaptive-concurrency').checked = config.adaptive_concurrency !== false;
         
         if (config.directory) {
             document.getElementById('directory').value = config.directory;
@@ -498,7 +541,7 @@ const EventHandlers = {
             Utils.showLoading('扫描文件中...');
             const result = await API.scanFiles();
             UI.displayFiles(result.files);
-            Utils.showToast(`扫描完成，找到 ${result.total_files} 个文件`, 'success');
+            Utils.showToast(`扫描完成，找到 ${result.total_files} 个文件，其中新增或修改 ${result.changed_files} 个`, 'success');
         } catch (error) {
             Utils.showToast(`文件扫描失败: ${error.message}`, 'error');
         } finally {
@@ -514,8 +557,12 @@ const EventHandlers = {
             custom_suffix: document.getElementById('custom-suffix').value.trim(),
             add_date: document.getElementById('add-date').checked,
             backup_enabled: document.getElementById('backup-enabled').checked,
+            bypass_cache: document.getElementById('bypass-cache').checked,
+            only_changed: document.getElementById('only-changed').checked,
+            max_concurrent_limit: parseInt(document.getElementById('max-concurrent').value) || 16,
+            adaptive_concurrency: document.getElementById('adaptive-concurrency').checked,
             max_filename_length: 100,
-            exclude_patterns: []
+            exclude_patterns: (AppState.currentConfig && AppState.currentConfig.exclude_patterns) || []
         };
 
         try {
@@ -534,8 +581,26 @@ const EventHandlers = {
         try {
             Utils.showLoading('AI 分析文件内容中...');
             const result = await API.previewRename();
+            AppState.planId = result.plan_id;
             UI.displayPreview(result.preview_results);
-            Utils.showToast(`预览完成：${result.successful_analyses} 个文件分析成功`, 'success');
+            if (result.message) {
+                Utils.showToast(result.message, 'info');
+            }
+            const cachedCount = result.preview_results.filter(r => r.cached).length;
+            Utils.showToast(`预览完成：${result.successful_analyses} 个文件分析成功（缓存命中 ${cachedCount} 个）`, 'success');
+            if (result.duplicate_files > 0) {
+                Utils.showToast(`${result.duplicate_files} 个文件与其他文件内容相同，未重复调用 AI`, 'info');
+            }
+            if (result.near_duplicate_files > 0) {
+                Utils.showToast(`${result.near_duplicate_files} 个文件与其他文件内容相近，沿用其命名`, 'info');
+            }
+            if (result.prompt_cache && (result.prompt_cache.hit_tokens + result.prompt_cache.miss_tokens) > 0) {
+                const hitRate = (result.prompt_cache.hit_rate * 100).toFixed(1);
+                Utils.showToast(`提示词缓存：命中 ${result.prompt_cache.hit_tokens} tokens，未命中 ${result.prompt_cache.miss_tokens} tokens（${hitRate}%）`, 'info');
+            }
+            if (result.usage && result.usage.totals.api_files > 0) {
+                Utils.showToast(`本次预计费用 ${result.usage.totals.cost.toFixed(4)} ${result.usage.currency}`, 'info');
+            }
         } catch (error) {
             Utils.showToast(`预览失败: ${error.message}`, 'error');
         } finally {
@@ -561,12 +626,14 @@ const EventHandlers = {
 
         try {
             Utils.showLoading('执行文件重命名中...');
-            const result = await API.executeRename(selectedFiles);
-            UI.displayResults(result);
+            const result = await API.executeRename(selectedFiles, AppState.planId);
+            const stats = await API.getStats().catch(() => null);
+            UI.displayResults(result, stats ? stats.last_run : null);
             Utils.showToast(`重命名完成：${result.rename_success || 0} 个文件成功`, 'success');
             
             // 清空预览结果，需要重新扫描
             AppState.previewResults = [];
+            AppState.planId = null;
             AppState.scannedFiles = [];
             document.getElementById('files-container').innerHTML = `
                 <div class="empty-state">
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存目录，放在用户目录下，避免被扫描到工作目录中
+DEFAULT_CACHE_DIR = Path.home() / ".deepseek_rename"
+
+
+class SuggestionCache:
+    """基于 SQLite 的文件名建议缓存，按内容哈希寻址"""
+    
+    def __init__(
+        self,
+        db_path: Union[str, Path] = None,
+        max_size_bytes: int = 50 * 1024 * 1024,
+        enabled: bool = True
+    ):
+        """
+        初始化缓存
+        
+        Args:
+            db_path: 数据库文件路径，默认位于用户目录下
+            max_size_bytes: 缓存条目总大小上限，超出后按最近最少使用淘汰
+            enabled: 是否启用缓存
+        """
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_DIR / "suggestions.db"
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+        
+        # 命中统计
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if enabled:
+            try:
+                self._open()
+            except Exception as e:
+                logger.error(f"打开建议缓存失败，缓存已禁用 {self.db_path}: {str(e)}")
+                self.enabled = False
+    
+    def _open(self):
+        """打开数据库并建表"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS suggestions (
+                key TEXT PRIMARY KEY,
+                suggested_name TEXT NOT NULL,
+                analysis_type TEXT,
+                model TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_access ON suggestions (last_access)")
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(content: str, analysis_type: str, model: str, prompt_version: str) -> str:
+        """由提取内容、分析类型、模型和提示词版本计算缓存键"""
+        hasher = hashlib.sha256()
+        for part in (prompt_version, model, analysis_type):
+            hasher.update(part.encode('utf-8'))
+            hasher.update(b'\0')
+        hasher.update(content.encode('utf-8', errors='surrogatepass'))
+        return hasher.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，命中时返回建议的文件名"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT suggested_name FROM suggestions WHERE key = ?", (key,)
+                ).fetchone()
+                
+                if row is None:
+                    self.misses += 1
+                    return None
+                
+                self._conn.execute(
+                    "UPDATE suggestions SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            except Exception as e:
+                logger.error(f"读取建议缓存失败: {str(e)}")
+                self.misses += 1
+                return None
+    
+    def put(self, key: str, suggested_name: str, analysis_type: str = "", model: str = "") -> None:
+        """写入缓存，并在超出容量时淘汰旧条目"""
+        if not self.enabled:
+            return
+        
+        size = len(key) + len(suggested_name.encode('utf-8'))
+        now = time.time()
+        
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO suggestions "
+                    "(key, suggested_name, analysis_type, model, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, suggested_name, analysis_type, model, size, now, now)
+                )
+                self._evict()
+                self._conn.commit()
+            except Exception as e:
+                logger.error(f"写入建议缓存失败: {str(e)}")
+    
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小不超过上限（调用方持有锁）"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM suggestions").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        
+        overflow = total - self.max_size_bytes
+        rows = self._conn.execute(
+            "SELECT key, size FROM suggestions ORDER BY last_access ASC"
+        )
+        stale_keys = []
+        for key, size in rows:
+            if overflow <= 0:
+                break
+            stale_keys.append((key,))
+            overflow -= size
+        
+        self._conn.executemany("DELETE FROM suggestions WHERE key = ?", stale_keys)
+        self.evictions += len(stale_keys)
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._conn.execute("DELETE FROM suggestions")
+            self._conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        entries = 0
+        size_bytes = 0
+        if self.enabled:
+            with self._lock:
+                entries, size_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM suggestions"
+                ).fetchone()
+        
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'path': str(self.db_path),
+            'entries': entries,
+            'size_bytes': size_bytes,
+            'max_size_bytes': self.max_size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+    
+    def close(self) -> None:
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self.enabled = False
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# 默认价格（美元 / 百万 tokens），可在 config.json 的 pricing 中覆盖
+DEFAULT_PRICING = {
+    "currency": "USD",
+    "input_cache_hit_per_million": 0.028,
+    "input_cache_miss_per_million": 0.28,
+    "output_per_million": 0.42
+}
+
+_USAGE_KEYS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens", "prompt_cache_miss_tokens")
+
+
+class UsageStats:
+    """按文件累计 token 用量、耗时和费用，并按文件类型分组汇总"""
+    
+    def __init__(self, pricing: Optional[Dict[str, Any]] = None):
+        self.pricing = dict(DEFAULT_PRICING)
+        self.pricing.update(pricing or {})
+        self.totals = self._empty()
+        self.by_type: Dict[str, Dict[str, Any]] = defaultdict(self._empty)
+        # 分析阶段的实际耗时；各文件 elapsed 之和因并发会大于它
+        self.wall_time = 0.0
+    
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        totals = {key: 0 for key in _USAGE_KEYS}
+        totals.update({"files": 0, "api_files": 0, "cached_files": 0, "elapsed": 0.0, "cost": 0.0})
+        return totals
+    
+    def estimate_cost(self, usage: Dict[str, int]) -> float:
+        """按命中缓存、未命中缓存和输出三档价格估算费用"""
+        return (
+            usage.get("prompt_cache_hit_tokens", 0) * self.pricing["input_cache_hit_per_million"]
+            + usage.get("prompt_cache_miss_tokens", 0) * self.pricing["input_cache_miss_per_million"]
+            + usage.get("completion_tokens", 0) * self.pricing["output_per_million"]
+        ) / 1_000_000
+    
+    def add(self, file_type: str, usage: Optional[Dict[str, int]], elapsed: float = 0.0, cached: bool = False) -> float:
+        """记录一个文件的用量，返回该文件的估算费用"""
+        usage = usage or {}
+        cost = self.estimate_cost(usage)
+        for bucket in (self.totals, self.by_type[file_type]):
+            bucket["files"] += 1
+            if cached:
+                bucket["cached_files"] += 1
+            elif usage:
+                bucket["api_files"] += 1
+            for key in _USAGE_KEYS:
+                bucket[key] += usage.get(key, 0)
+            bucket["elapsed"] += elapsed
+            bucket["cost"] += cost
+        return cost
+    
+    @staticmethod
+    def _finish(bucket: Dict[str, Any]) -> Dict[str, Any]:
+        summary = dict(bucket)
+        summary["elapsed"] = round(summary["elapsed"], 3)
+        summary["cost"] = round(summary["cost"], 6)
+        api_files = summary["api_files"]
+        summary["avg_prompt_tokens"] = round(summary["prompt_tokens"] / api_files, 1) if api_files else 0
+        summary["avg_completion_tokens"] = round(summary["completion_tokens"] / api_files, 1) if api_files else 0
+        return summary
+    
+    def summary(self) -> Dict[str, Any]:
+        """返回总计和按文件类型的明细，类型按 token 消耗从高到低排列"""
+        by_type = {
+            file_type: self._finish(bucket)
+            for file_type, bucket in sorted(
+                self.by_type.items(),
+                key=lambda item: item[1]["prompt_tokens"] + item[1]["completion_tokens"],
+                reverse=True
+            )
+        }
+        return {
+            "currency": self.pricing["currency"],
+            "totals": self._finish(self.totals),
+            "by_type": by_type,
+            "wall_time": round(self.wall_time, 3)
+        }
+    
+    def merge(self, other: 'UsageStats') -> None:
+        """把另一次运行的统计累加进来"""
+        self.wall_time += other.wall_time
+        for source, target in [(other.totals, self.totals)] + [
+            (bucket, self.by_type[file_type]) for file_type, bucket in other.by_type.items()
+        ]:
+            for key, value in source.items():
+                target[key] += value
+    
+    @classmethod
+    def from_results(cls, analysis_results: List[Dict[str, Any]], pricing: Optional[Dict[str, Any]] = None,
+                     wall_time: float = 0.0) -> 'UsageStats':
+        """根据分析结果统计用量，并把每个文件的估算费用写回结果"""
+        stats = cls(pricing)
+        stats.wall_time = wall_time
+        for r in analysis_results:
+            original_path = r.get('original_path')
+            file_type = original_path.suffix.lower() if original_path is not None and original_path.suffix else '(无扩展名)'
+            analysis_result = r.get('analysis_result') or {}
+            r['cost'] = round(stats.add(
+                file_type,
+                r.get('usage'),
+                r.get('elapsed', 0.0),
+                cached=bool(analysis_result.get('cached'))
+            ), 8)
+        return stats
@@ -0,0 +1,508 @@
+import asyncio
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from file_extractor_final import _module_available
+from fs_walk_final import DirListing, walk_files, walk_listings
+
+# 没有安装 watchdog 时退回定时轮询；真正开始监视时才导入，不拖慢启动
+WATCHDOG_AVAILABLE = _module_available('watchdog')
+
+logger = logging.getLogger(__name__)
+
+# 自己重命名出来的文件在这段时间内产生的事件一律忽略（秒）
+OWN_OUTPUT_TTL = 300.0
+
+# 最近处理记录保留的条数
+RECENT_LIMIT = 50
+
+
+class _PendingFile:
+    """等待写入完成的文件：最后一次事件之后大小和修改时间都不再变化才会被处理"""
+    
+    __slots__ = ('first_seen', 'last_event', 'signature', 'closed')
+    
+    def __init__(self, now: float):
+        self.first_seen = now
+        self.last_event = now
+        self.signature: Optional[Tuple[int, int]] = None
+        self.closed = False
+
+
+class _EventHandler:
+    """把 watchdog 的事件转交给监视器所在的事件循环（watchdog 只调用 dispatch）"""
+    
+    def __init__(self, watcher: 'FolderWatcher'):
+        self.watcher = watcher
+    
+    def dispatch(self, event) -> None:
+        if event.event_type == 'created':
+            self.watcher.notify(event.src_path, is_directory=event.is_directory)
+        elif event.event_type == 'moved':
+            # 移入监视目录的文件或目录只会产生 moved 事件
+            self.watcher.notify(event.dest_path, is_directory=event.is_directory)
+        elif event.is_directory:
+            return
+        elif event.event_type == 'modified':
+            self.watcher.notify(event.src_path)
+        elif event.event_type == 'closed':
+            # 仅 Linux（inotify）提供，写入方关闭文件后可以更早处理
+            self.watcher.notify(event.src_path, closed=True)
+
+
+class FolderWatcher:
+    """监视工作目录，把新到达的文件送入 提取 -> 分析 -> 重命名 流程
+    
+    优先使用 watchdog（Linux 上为 inotify，macOS 为 FSEvents，Windows 为 ReadDirectoryChangesW），
+    未安装时按固定间隔轮询，轮询只重新列出修改时间变化的目录。
+    文件在最后一次事件后静置 debounce_seconds 且大小不变才算写完；写完的文件攒够 batch_size 个
+    或等待超过 batch_window_seconds 后作为一个批次处理，同一时间只处理一个批次。
+    等待中的文件超过 max_pending 时不再逐个接收事件，积压消化后做一次增量扫描补上遗漏的文件。
+    """
+    
+    def __init__(
+        self,
+        renamer,
+        backend: str = "auto",
+        debounce_seconds: float = 1.0,
+        batch_size: int = 20,
+        batch_window_seconds: float = 1.0,
+        max_pending: int = 1000,
+        poll_interval_seconds: float = 2.0,
+        auto_rename: bool = True,
+        process_existing: bool = False
+    ):
+        """
+        初始化目录监视器
+        
+        Args:
+            renamer: DeepSeekFileRenamer 实例，监视其工作目录
+            backend: 'auto'、'watchdog' 或 'polling'
+            debounce_seconds: 文件最后一次变化后静置多久才处理
+            batch_size: 每个批次最多处理的文件数
+            batch_window_seconds: 批次未满时最多等待多久
+            max_pending: 等待处理的文件数上限，超出后转为积压后的增量扫描
+            poll_interval_seconds: 轮询模式下的扫描间隔
+            auto_rename: 是否直接重命名，为 False 时只记录建议
+            process_existing: 启动时是否处理目录中尚未处理过的已有文件
+        """
+        self.renamer = renamer
+        self.backend = backend
+        self.debounce_seconds = max(0.1, debounce_seconds)
+        self.batch_size = max(1, batch_size)
+        self.batch_window_seconds = max(0.0, batch_window_seconds)
+        self.max_pending = max(self.batch_size, max_pending)
+        self.poll_interval_seconds = max(0.2, poll_interval_seconds)
+        self.auto_rename = auto_rename
+        self.process_existing = process_existing
+        
+        self.directory: Optional[Path] = None
+        self.active_backend: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.log_file: Optional[Path] = None
+        
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._observer = None
+        
+        # 以下状态只在监视线程的事件循环中修改
+        self._pending: Dict[str, _PendingFile] = {}
+        self._ready: List[Tuple[str, _PendingFile]] = []
+        self._in_flight = 0
+        self._own_outputs: Dict[str, float] = {}
+        self._overflowed = False
+        self._listings: Dict[str, DirListing] = {}
+        self._log_entries: List[Dict[str, Any]] = []
+        self._backup_created = False
+        self._recent = deque(maxlen=RECENT_LIMIT)
+        self._latencies = deque(maxlen=200)
+        
+        # 运行统计
+        self.events = 0
+        self.ignored = 0
+        self.dropped = 0
+        self.rescans = 0
+        self.batches = 0
+        self.processed = 0
+        self.renamed = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self) -> Dict[str, Any]:
+        """在后台线程中开始监视工作目录"""
+        if self.running:
+            return {'success': False, 'error': '监视已在运行'}
+        if not self.renamer.base_dir or not self.renamer.base_dir.is_dir():
+            return {'success': False, 'error': '未设置工作目录'}
+        if not self.renamer.deepseek_client:
+            return {'success': False, 'error': '未设置 DeepSeek API 密钥'}
+        
+        backend = self.backend
+        if backend == 'auto':
+            backend = 'watchdog' if WATCHDOG_AVAILABLE else 'polling'
+        elif backend == 'watchdog' and not WATCHDOG_AVAILABLE:
+            logger.warning("未安装 watchdog，监视模式改为轮询")
+            backend = 'polling'
+        elif backend not in ('watchdog', 'polling'):
+            return {'success': False, 'error': f'不支持的监视方式: {backend}'}
+        
+        self.directory = self.renamer.base_dir
+        self.active_backend = backend
+        self.started_at = time.time()
+        self.log_file = self.directory / f"rename_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}_watch.json"
+        self._log_entries = []
+        self._backup_created = False
+        
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), name='folder-watch', daemon=True)
+        self._thread.start()
+        started.wait(timeout=10)
+        logger.info(f"开始监视目录（{backend}）: {self.directory}")
+        return {'success': True, 'backend': backend, 'directory': str(self.directory)}
+    
+    def stop(self, timeout: float = 30.0) -> Dict[str, Any]:
+        """停止监视，正在处理的批次完成后退出"""
+        if not self.running:
+            return {'success': False, 'error': '监视未在运行'}
+        
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning("监视线程未能在限定时间内退出，正在处理的批次会在后台完成")
+        logger.info(f"已停止监视目录: {self.directory}")
+        return {'success': True}
+    
+    def notify(self, path: str, closed: bool = False, is_directory: bool = False) -> None:
+        """文件系统事件入口，可以从任意线程调用"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._note, path, closed, is_directory)
+        except RuntimeError:
+            # 事件循环已经关闭
+            pass
+    
+    def _run(self, started: threading.Event) -> None:
+        """监视线程入口，以下方法都在该线程的事件循环中运行"""
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            self._stop_event = asyncio.Event()
+            loop.run_until_complete(self._main(started))
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"监视模式异常退出: {str(e)}")
+        finally:
+            started.set()
+            self._stop_observer()
+            self._loop = None
+            loop.close()
+    
+    async def _main(self, started: threading.Event) -> None:
+        loop = asyncio.get_running_loop()
+        # 记录当前的目录状态，轮询时与之比较，启动前已有的文件不算新文件
+        self._listings = await loop.run_in_executor(None, self._walk)
+        if self.active_backend == 'watchdog':
+            self._start_observer()
+        started.set()
+        
+        if self.process_existing:
+            await self._rescan(only_new=False)
+        
+        batch_task: Optional[asyncio.Future] = None
+        next_poll = time.monotonic() + self.poll_interval_seconds
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            
+            if self.active_backend == 'polling' and now >= next_poll and not self._overflowed:
+                await self._poll()
+                next_poll = time.monotonic() + self.poll_interval_seconds
+            
+            self._check_pending(now)
+            
+            if batch_task is not None and batch_task.done():
+                batch_task = None
+            if batch_task is None:
+                batch = self._take_batch(now)
+                if batch:
+                    batch_task = asyncio.ensure_future(self._process_batch(batch))
+                elif self._overflowed and len(self._pending) < self.max_pending // 2:
+                    # 积压已经消化，做一次增量扫描，找回溢出期间丢弃的文件
+                    self._overflowed = False
+                    await self._rescan(only_new=True)
+            
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=0.25)
+            except asyncio.TimeoutError:
+                pass
+        
+        if batch_task is not None:
+            await batch_task
+    
+    def _start_observer(self) -> None:
+        self._observer = importlib.import_module('watchdog.observers').Observer()
+        self._observer.schedule(_EventHandler(self), str(self.directory), recursive=True)
+        self._observer.start()
+    
+    def _stop_observer(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+    
+    def _walk(self, previous: Optional[Dict[str, DirListing]] = None) -> Dict[str, DirListing]:
+        return walk_listings(
+            self.directory,
+            prune_dir=self._should_prune_dir,
+            include_file=self.renamer._should_include_entry,
+            workers=self.renamer.scan_workers,
+            previous=previous,
+            verify_files=False
+        )
+    
+    def _should_prune_dir(self, entry) -> bool:
+        return self.renamer._should_prune_dir(entry)
+    
+    def _is_ignored(self, path: str) -> bool:
+        """自己产生的文件（重命名结果、备份、日志）和不支持的文件不处理"""
+        key = os.path.normcase(path)
+        expires = self._own_outputs.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                return True
+            del self._own_outputs[key]
+        
+        file_path = Path(path)
+        if self.log_file is not None and file_path == self.log_file:
+            return True
+        # 位于被排除目录（含备份目录）中的文件与扫描时一样跳过
+        try:
+            relative_dirs = file_path.relative_to(self.directory).parts[:-1]
+        except ValueError:
+            relative_dirs = ()
+        if any(self.renamer.exclude_matcher.matches_dir(name) for name in relative_dirs):
+            return True
+        if not self.renamer.content_extractor.is_supported_file(file_path):
+            return True
+        return self.renamer.is_excluded_file(file_path)
+    
+    def _note(self, path: str, closed: bool = False, is_directory: bool = False) -> None:
+        """记录一个文件事件，文件进入等待队列"""
+        self.events += 1
+        if is_directory:
+            # 整个目录被移入时其中的文件不会逐个产生事件
+            asyncio.ensure_future(self._note_directory(path))
+            return
+        if self._is_ignored(path):
+            self.ignored += 1
+            return
+        
+        now = time.monotonic()
+        pending = self._pending.get(path)
+        if pending is None:
+            if any(ready_path == path for ready_path, _ in self._ready):
+                return
+            if len(self._pending) + len(self._ready) >= self.max_pending:
+                if not self._overflowed:
+                    logger.warning(f"等待处理的文件超过 {self.max_pending} 个，积压消化后将增量扫描补齐")
+                self._overflowed = True
+                self.dropped += 1
+                return
+            pending = self._pending[path] = _PendingFile(now)
+        pending.last_event = now
+        pending.closed = pending.closed or closed
+    
+    async def _note_directory(self, directory: str) -> None:
+        if os.path.islink(directory):
+            return
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(
+            None, lambda: walk_files(directory, self._should_prune_dir, self.renamer._should_include_entry)
+        )
+        for file_path, _ in files:
+            self._note(str(file_path))
+    
+    async def _poll(self) -> None:
+        """轮询模式：只重新列出修改时间变化的目录，新出现或大小、修改时间变化的文件视为事件"""
+        loop = asyncio.get_running_loop()
+        previous = self._listings
+        listings = await loop.run_in_executor(None, self._walk, previous)
+        for relative_dir, listing in listings.items():
+            old_listing = previous.get(relative_dir)
+            if old_listing is listing:
+                continue
+            old_files = dict(old_listing.files) if old_listing else {}
+            directory = os.path.join(str(self.directory), relative_dir) if relative_dir else str(self.directory)
+            for name, stat_result in listing.files:
+                old_stat = old_files.get(name)
+                if old_stat is None or old_stat.st_size != stat_result.st_size \
+                        or old_stat.st_mtime_ns != stat_result.st_mtime_ns:
+                    self._note(os.path.join(directory, name))
+        self._listings = listings
+    
+    async def _rescan(self, only_new: bool) -> None:
+        """增量扫描工作目录，把尚未处理的文件加入等待队列
+        
+        Args:
+            only_new: 只加入监视开始之后修改过的文件
+        """
+        self.rescans += 1
+        loop = asyncio.get_running_loop()
+        files_info = await loop.run_in_executor(None, self.renamer.scan_directory)
+        started_ns = int((self.started_at or 0) * 1e9)
+        for file_info in files_info:
+            if not file_info['changed']:
+                continue
+            if only_new and file_info['mtime_ns'] < started_ns:
+                continue
+            self._note(str(file_info['path']))
+    
+    def _check_pending(self, now: float) -> None:
+        """把静置足够久且大小、修改时间不再变化的文件移入就绪列表"""
+        for path, pending in list(self._pending.items()):
+            # 写入方已关闭文件时只需短暂等待
+            quiet_for = 0.2 if pending.closed else self.debounce_seconds
+            if now - pending.last_event < quiet_for:
+                continue
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                # 文件已被删除或移走
+                del self._pending[path]
+                continue
+            signature = (stat_result.st_size, stat_result.st_mtime_ns)
+            if signature != pending.signature:
+                # 第一次检查或仍在写入，再等一个静置周期
+                pending.signature = signature
+                pending.last_event = now
+                continue
+            del self._pending[path]
+            self._ready.append((path, pending))
+    
+    def _take_batch(self, now: float) -> List[Tuple[str, _PendingFile]]:
+        if not self._ready:
+            return []
+        oldest = min(pending.last_event for _, pending in self._ready)
+        if len(self._ready) < self.batch_size and now - oldest < self.batch_window_seconds:
+            return []
+        batch, self._ready = self._ready[:self.batch_size], self._ready[self.batch_size:]
+        return batch
+    
+    async def _process_batch(self, batch: List[Tuple[str, _PendingFile]]) -> None:
+        """分析并重命名一个批次；与网页上的预览、重命名互斥"""
+        loop = asyncio.get_running_loop()
+        renamer = self.renamer
+        self._in_flight = len(batch)
+        started = time.monotonic()
+        first_seen = {}
+        files_info = []
+        for path, pending in batch:
+            file_path = Path(path)
+            try:
+                files_info.append(renamer.build_file_info(file_path, file_path.stat()))
+                first_seen[file_path] = pending.first_seen
+            except (OSError, ValueError):
+                continue
+        
+        await loop.run_in_executor(None, renamer.run_lock.acquire)
+        try:
+            if not files_info:
+                return
+            results = await renamer.batch_analyze_files(files_info)
+            renamer._remember_processed(files_info, results)
+            
+            rename_stats = None
+            if self.auto_rename:
+                log_start = len(renamer.operation_log)
+                # 同一次监视的所有批次共用一个备份目录
+                rename_stats = renamer.execute_rename(results, new_backup_dir=not self._backup_created)
+                self._backup_created = True
+                self._log_entries.extend(renamer.operation_log[log_start:])
+                self._save_log()
+        except Exception as e:
+            self.failed += len(files_info)
+            self.last_error = str(e)
+            logger.error(f"监视模式处理批次失败: {str(e)}")
+            return
+        finally:
+            renamer.run_lock.release()
+            self._in_flight = 0
+        
+        finished = time.monotonic()
+        self.batches += 1
+        for result in results:
+            self.processed += 1
+            renamed = bool(rename_stats) and result['success'] and not result['skipped'] \
+                and result.get('new_path') is not None and result['new_path'].exists()
+            if renamed:
+                self.renamed += 1
+                self._own_outputs[os.path.normcase(str(result['new_path']))] = finished + OWN_OUTPUT_TTL
+            elif not result['success'] and not result['skipped']:
+                self.failed += 1
+            latency = finished - first_seen.get(result['original_path'], started)
+            self._latencies.append(latency)
+            self._recent.append({
+                'original_name': result['original_name'],
+                'new_name': result.get('new_name') or '',
+                'renamed': renamed,
+                'success': result['success'],
+                'skipped': result['skipped'],
+                'error': result.get('error') or '',
+                'latency': round(latency, 2),
+                'finished_at': datetime.now().isoformat()
+            })
+        logger.info(f"监视模式处理 {len(results)} 个文件，用时 {finished - started:.1f} 秒")
+    
+    def _save_log(self) -> None:
+        """把本次监视的重命名记录写入同一个日志文件"""
+        if not self._log_entries:
+            return
+        try:
+            with open(self.log_file, 'w', encoding='utf-8') as f:
+                json.dump(self._log_entries, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"保存监视日志失败: {str(e)}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        """返回监视状态、队列长度、处理统计和最近处理的文件"""
+        latencies = sorted(self._latencies)
+        return {
+            'running': self.running,
+            'backend': self.active_backend,
+            'directory': str(self.directory) if self.directory else '',
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            'auto_rename': self.auto_rename,
+            'pending': len(self._pending),
+            'ready': len(self._ready),
+            'in_flight': self._in_flight,
+            'overflowed': self._overflowed,
+            'events': self.events,
+            'ignored': self.ignored,
+            'dropped': self.dropped,
+            'rescans': self.rescans,
+            'batches': self.batches,
+            'processed': self.processed,
+            'renamed': self.renamed,
+            'failed': self.failed,
+            'latency_p50': round(latencies[len(latencies) // 2], 2) if latencies else None,
+            'latency_max': round(latencies[-1], 2) if latencies else None,
+            'log_file': str(self.log_file) if self._log_entries else '',
+            'last_error': self.last_error,
+            'recent': list(self._recent)
+        }